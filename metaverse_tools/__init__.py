@@ -36,11 +36,12 @@ import logging
 import bpy
 
 from bpy.types import Operator, AddonPreferences
-from bpy.props import StringProperty, IntProperty, BoolProperty
+from bpy.props import StringProperty, IntProperty, BoolProperty, EnumProperty
 
 from metaverse_tools.ext.apply_modifier_for_object_with_shapekeys.ApplyModifierForObjectWithShapeKeys import ApplyModifierForObjectWithShapeKeysOperator
 
 from metaverse_tools.utils.bones.custom import bones_binder_register, bones_binder_unregister, bones_scene_define, bones_scene_clean
+from metaverse_tools.utils.animation.statistics import action_statistics_register, action_statistics_unregister
 
 from . import ui
 from . import armature
@@ -52,6 +53,7 @@ from .files.facerig import EXPORT_OT_MVT_TOOLSET_Writer_Facerig_Bundle_DAE
 from .ext.modified_fbx_tools import EXPORT_OT_MVT_TOOLSET_FBX
 
 from .utils.bpyutil import operator_exists
+from .utils import log
 from .files.hifi_json.operator import *
 from .files.fst.operator import *
 
@@ -64,6 +66,10 @@ def on_color_space_automation_update(self, context):
     addon_prefs["automatic_color_space_fix"] = self.colorspaces_on_save
 
 
+def on_log_level_update(self, context):
+    log.set_level(self.log_level)
+
+
 class MVTAddOnPreferences(AddonPreferences):
     bl_idname = __name__
 
@@ -72,12 +78,22 @@ class MVTAddOnPreferences(AddonPreferences):
                                                     default=True,
                                                     update=on_color_space_automation_update)
 
+    mesh_cache_size: IntProperty(name="Mesh Cache Size (MB)",
+                                 description="Disk space used to keep meshes with their modifiers applied between scene exports",
+                                 default=512, min=0)
+
+    log_level: EnumProperty(name="Log Level", items=log.LOG_LEVELS, default=log.DEFAULT_LOG_LEVEL,
+                            description="Detail of the messages written to the system console",
+                            update=on_log_level_update)
+
     message_box: StringProperty(
         name="Status", default="", options={"SKIP_SAVE"})
 
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "colorspaces_on_save")
+        layout.prop(self, "mesh_cache_size")
+        layout.prop(self, "log_level")
 
 
 if "add_mesh_extra_objects" not in addon_utils.addons_fake_modules:
@@ -100,8 +116,8 @@ def menu_func_export(self, context):
     self.layout.operator(EXPORT_OT_MVT_TOOLSET_FBX.bl_idname, text="Vircadia FBX (.fbx)")
     self.layout.operator(EXPORT_OT_MVT_TOOLSET_Hifi_FST_Writer_Operator.bl_idname,
                          text="Vircadia Avatar FST (.fst)")
-   # self.layout.operator(EXPORT_OT_MVT_TOOLSET_Writer_GLTF_JSON.bl_idname,
-   #                      text="HiFi Metaverse Scene JSON / GLTF (.json/.glb/.glm)")
+    self.layout.operator(EXPORT_OT_MVT_TOOLSET_Writer_GLTF_JSON.bl_idname,
+                         text="Vircadia Metaverse Scene JSON / GLB (.json/.glb)")
     self.layout.operator(EXPORT_OT_MVT_TOOLSET_Writer_FBX_JSON.bl_idname,
                          text="Vircadia Metaverse Scene JSON / FBX (.json/.fbx)")
     self.layout.operator(EXPORT_OT_MVT_TOOLSET_Writer_Facerig_Bundle_DAE.bl_idname,
@@ -126,6 +142,9 @@ bpy.app.handlers.save_pre.append(utils.helpers.materials.correct_all_color_space
 
 def register():
     main_register()
+    addon = bpy.context.preferences.addons.get(__name__)
+    if addon is not None:
+        log.set_level(addon.preferences.log_level)
     bones_binder_register()
     bones_scene_define()
 
@@ -140,6 +159,7 @@ def register():
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
     bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
     ui.register_operators()
+    action_statistics_register()
 
 
 
@@ -154,3 +174,4 @@ def unregister():
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
     bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
     ui.unregister_operators()
+    action_statistics_unregister()
@@ -115,6 +115,9 @@ from io_scene_fbx.export_fbx_bin import (
     )
 
 from metaverse_tools.utils.helpers.materials import HifiShaderWrapper
+from metaverse_tools.utils import log
+
+logger = log.get_logger("fbx")
 # Save fbx_objects_elements, save_single, save
 
 
@@ -185,15 +188,13 @@ def fbx_metav_toolset_data_material_elements(root, ma, scene_data):
     elem_props_template_set(tmpl, props, "p_number", b"SpecularFactor", 0.0)
     # elem_props_template_set(tmpl, props, "p_number", b"SpecularFactor", ma_wrap.specular / 2.0)
 
-    print(ma_wrap)
-
     if ma_wrap.base_color_texture is not None and ma_wrap.base_color_texture.node_image is not None:
-        print("Color Texture")
+        logger.debug("Material %s: Color Texture", ma.name)
         elem_props_template_set(tmpl, props, "p_color", b"DiffuseColor", (1.0, 1.0, 1.0))
         elem_props_template_set(tmpl, props, "p_color", b"Maya|base_color", (1.0, 1.0, 1.0))
         elem_props_template_set(tmpl, props, "p_bool", b"Maya|use_color_map", True)
     else: 
-        print("No Color Texture")
+        logger.debug("Material %s: No Color Texture", ma.name)
         elem_props_template_set(tmpl, props, "p_color", b"DiffuseColor", ma_wrap.base_color)
         elem_props_template_set(tmpl, props, "p_color", b"Maya|base_color", ma_wrap.base_color)
 
@@ -417,7 +418,6 @@ def fbx_data_from_scene(scene, depsgraph, settings):
                 data_meshes[ob_obj] = (get_blenderID_key(tmp_me), tmp_me, True)
             # Change armatures back.
             for armature, pose_position in backup_pose_positions:
-                print((armature, pose_position))
                 armature.pose_position = pose_position
                 # Update now, so we don't leave modified state after last object was exported.
                 depsgraph.update()
@@ -531,10 +531,8 @@ def fbx_data_from_scene(scene, depsgraph, settings):
         # Note: with nodal shaders, we'll could be generating much more textures, but that's kind of unavoidable,
         #       given that textures actually do not exist anymore in material context in Blender...
         ma_wrap = HifiShaderWrapper(ma, is_readonly=True)
-        print("Material", ma, ma.name)
         for sock_name, fbx_name in HIFI_SPECIFIC_SOCKETS_FBX:
             tex = getattr(ma_wrap, sock_name)
-            print("Texture:", tex, sock_name)
             if tex is None or tex.image is None:
                 continue
 
@@ -837,9 +835,8 @@ def fbx_objects_elements(root, scene_data):
     for ma in scene_data.data_materials:
         fbx_data_material_elements(objects, ma, scene_data)
 
-    print("Getting Tex Keys")
+    logger.debug("Writing %d textures", len(scene_data.data_textures))
     for blender_tex_key in scene_data.data_textures:
-        print(blender_tex_key)
         fbx_data_texture_file_elements(objects, blender_tex_key, scene_data)
 
     for vid in scene_data.data_videos:
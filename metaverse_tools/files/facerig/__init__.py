@@ -20,6 +20,13 @@
 import bpy
 import os
 import os.path as ntpath
+import json
+import math
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 from bpy_extras.io_utils import (
     ExportHelper
@@ -27,15 +34,18 @@ from bpy_extras.io_utils import (
 from metaverse_tools.utils.animation.action import *
 from metaverse_tools.utils.facerig.statics import *
 from metaverse_tools.utils.bones.bones_builder import find_armature, clear_pose
-from metaverse_tools.utils.animation.action import get_max_frames_in_action
+from metaverse_tools.utils.animation.statistics import get_action_statistics
 
 from bpy.props import (
     StringProperty,
     BoolProperty,
     FloatProperty,
-    EnumProperty
+    EnumProperty,
+    IntProperty
 )
 
+WORKER_EXPRESSION = "from metaverse_tools.files.facerig import export_action_jobs; export_action_jobs()"
+
 
 class EXPORT_OT_MVT_TOOLSET_Writer_Facerig_Bundle_DAE(bpy.types.Operator, ExportHelper):
     """ This Operator exports Facerig dae bundles"""
@@ -50,6 +60,18 @@ class EXPORT_OT_MVT_TOOLSET_Writer_Facerig_Bundle_DAE(bpy.types.Operator, Export
     # TODO: instead create a new directory instead of a file.
     filter_glob: StringProperty(default="*.dae", options={'HIDDEN'}) 
 
+    use_workers: BoolProperty(default=True, name="Export in Parallel",
+                              description="Export the actions from background Blender processes")
+
+    workers: IntProperty(default=max(1, (os.cpu_count() or 2) // 2), min=1, name="Processes",
+                         description="Number of background Blender processes used for the action exports")
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, "use_workers")
+        if self.use_workers:
+            layout.prop(self, "workers")
+
     def execute(self, context):
         if not self.filepath:
             raise Exception("filepath not set")
@@ -62,7 +84,7 @@ class EXPORT_OT_MVT_TOOLSET_Writer_Facerig_Bundle_DAE(bpy.types.Operator, Export
             return {'CANCELLED'}
 
 
-        if bpy.data.actions["idle1"] is  None:
+        if bpy.data.actions.get("idle1") is None:
             return {'CANCELLED'}
 
         # Lets make sure we dont accidentally override shit.
@@ -95,46 +117,151 @@ class EXPORT_OT_MVT_TOOLSET_Writer_Facerig_Bundle_DAE(bpy.types.Operator, Export
         bpy.ops.object.select_all(action="DESELECT")
         armature.select_set(True)
 
-        for action in bpy.data.actions:
-            name = action.name
-            # TODO: Excepted Animations here instead of just idle.
-            if name in "idle1":
-                # Detect Max frame in action
-                bpy.context.scene.frame_end = get_max_frames_in_action(armature, action)
-            else:
-                bpy.context.scene.frame_end = 30
-
-            clear_pose([armature])
-            armature.animation_data.action = action
-            
-            if name in general_movement_names:
-                directory = ntpath.join(anim_directory, general_movement_directory )
-                mkdir_if_not_exist(directory)
-            elif name in eye_and_eyebrows_names:
-                directory = ntpath.join(anim_directory, eye_and_eyebrows_directory )
-                mkdir_if_not_exist(directory)
-            elif name in mouth_and_nose_names:
-                directory = ntpath.join(anim_directory, mouth_and_nose_directory )
-                mkdir_if_not_exist(directory)
-            elif name in viseme_names:
-                directory = ntpath.join(anim_directory, viseme_directory)
-                mkdir_if_not_exist(directory)
-            else:
-                # Skip if we dont know file.
-                directory = None
-                continue
-
-            if directory is not None:
-                action_file = ntpath.join(directory, name)
-                export_collada_file(action_file, True)
+        jobs = plan_action_jobs(armature, anim_directory)
+        print("Exporting", len(jobs), "actions")
 
+        if self.use_workers and bpy.app.binary_path and len(jobs) > 1:
+            failed = export_action_jobs_parallel(armature, jobs, self.workers)
+            if failed:
+                self.report({'WARNING'}, str(len(failed)) + " FaceRig actions failed to export, check the console")
+        else:
+            run_action_jobs(armature, jobs)
 
         # bpy.ops.wm.collada_export(filepath='/Users/dave/test.dae', check_existing=False, filter_blender=False, filter_image=False, filter_movie=False, filter_python=False, filter_font=False, filter_sound=False, filter_text=False, filter_btx=False, filter_collada=True, filter_folder=True, filemode=8)
         # bpy.context.active_object.animation_data.action.groups to get current action's active stuff
         #
         clear_pose([armature])
+        armature.animation_data.action = bpy.data.actions["idle1"]
         return {'FINISHED'}
 
+
+# Plans every action export up front as {"action", "filepath", "frame_start", "frame_end"} jobs from action_routes,
+# creating the directories on the way. Actions without a route are skipped.
+def plan_action_jobs(armature, anim_directory):
+    jobs = []
+    for action in bpy.data.actions:
+        name = action.name
+        route = action_routes.get(name)
+        if route is None:
+            continue
+
+        directory = ntpath.join(anim_directory, route.directory)
+        mkdir_if_not_exist(directory)
+        frame_start, frame_end = route.frame_range
+        # TODO: Excepted Animations here instead of just idle.
+        if name == "idle1":
+            # Idle can contain subtle movements, so it runs to its last keyframe
+            frame_end = max(frame_start, int(math.ceil(get_action_statistics(action).max_frame())))
+
+        jobs.append({"action": name, "filepath": ntpath.join(directory, name),
+                     "frame_start": frame_start, "frame_end": frame_end})
+    return jobs
+
+
+def run_action_job(armature, job):
+    bpy.context.scene.frame_start = job["frame_start"]
+    bpy.context.scene.frame_end = job["frame_end"]
+    clear_pose([armature])
+    armature.animation_data.action = bpy.data.actions[job["action"]]
+    export_collada_file(job["filepath"], True)
+
+
+def run_action_jobs(armature, jobs):
+    for job in jobs:
+        run_action_job(armature, job)
+
+
+def get_job_target(job):
+    return job["filepath"] + ".dae"
+
+
+# Saves the scene to a temporary .blend once, then splits the jobs over background Blender processes.
+# Returns the jobs that did not export.
+def export_action_jobs_parallel(armature, jobs, workers):
+    temp_directory = tempfile.mkdtemp(prefix="mvt_facerig_")
+    temp_file = ntpath.join(temp_directory, "bundle.blend")
+
+    # Split actions are not used by anything yet, keep them in the copy.
+    unused_actions = [action for action in bpy.data.actions if action.users == 0]
+    for action in unused_actions:
+        action.use_fake_user = True
+    try:
+        bpy.ops.wm.save_as_mainfile(filepath=temp_file, copy=True)
+    finally:
+        for action in unused_actions:
+            action.use_fake_user = False
+
+    workers = max(1, min(workers, len(jobs)))
+    chunks = [jobs[index::workers] for index in range(workers)]
+
+    def run_chunk(index):
+        jobs_file = ntpath.join(temp_directory, "jobs_" + str(index) + ".json")
+        results_file = ntpath.join(temp_directory, "results_" + str(index) + ".json")
+        with open(jobs_file, "w", encoding="utf-8") as f:
+            json.dump({"armature": armature.name, "jobs": chunks[index], "results": results_file}, f)
+
+        # A file left by an earlier export must not count as this one
+        for job in chunks[index]:
+            if os.path.isfile(get_job_target(job)):
+                os.remove(get_job_target(job))
+
+        command = [bpy.app.binary_path, "-b", temp_file, "--python-expr", WORKER_EXPRESSION, "--", jobs_file]
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                 universal_newlines=True, encoding="utf-8", errors="replace")
+
+        results = {}
+        if process.returncode == 0:
+            try:
+                with open(results_file, "r", encoding="utf-8") as f:
+                    results = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+        exported = [job for job in chunks[index]
+                    if results.get(job["action"]) == "ok" and os.path.isfile(get_job_target(job))]
+        if len(exported) != len(chunks[index]):
+            print("FaceRig export worker", index, "exited with", process.returncode)
+            for job in chunks[index]:
+                if job not in exported:
+                    print(" ", job["action"], results.get(job["action"], "not reported"))
+            print(process.stdout[-4000:])
+        return [job for job in chunks[index] if job not in exported]
+
+    failed = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for chunk_failed in pool.map(run_chunk, range(workers)):
+                failed.extend(chunk_failed)
+    finally:
+        shutil.rmtree(temp_directory, ignore_errors=True)
+
+    for job in failed:
+        print("Failed to export", job["action"])
+    return failed
+
+
+# Entry point of the background workers, run as blender -b bundle.blend --python-expr WORKER_EXPRESSION -- jobs.json
+def export_action_jobs():
+    jobs_file = sys.argv[sys.argv.index("--") + 1]
+    with open(jobs_file, "r", encoding="utf-8") as f:
+        work = json.load(f)
+
+    armature = bpy.data.objects[work["armature"]]
+    bpy.context.view_layer.objects.active = armature
+
+    # {action name: "ok" or the error}, one failed action does not stop the rest of the chunk
+    results = {}
+    for job in work["jobs"]:
+        try:
+            run_action_job(armature, job)
+            results[job["action"]] = "ok" if os.path.isfile(get_job_target(job)) else "no file written"
+        except Exception as e:
+            results[job["action"]] = repr(e)
+
+    with open(work["results"], "w", encoding="utf-8") as f:
+        json.dump(results, f)
+
+
 def mkdir_if_not_exist(directory):
     if os.path.isdir(directory) == False:
         os.mkdir(directory)
@@ -31,10 +31,12 @@ from bpy.props import (
     StringProperty,
     BoolProperty,
     FloatProperty,
-    EnumProperty
+    EnumProperty,
+    IntProperty
 )
 import metaverse_tools.files.fst.writer as FSTWriter
 from metaverse_tools.utils.bones.bones_builder import find_armatures
+from metaverse_tools.utils import budget
 
 
 class EXPORT_OT_MVT_TOOLSET_Message_Warn_Bone(bpy.types.Operator):
@@ -184,11 +186,25 @@ class EXPORT_OT_MVT_TOOLSET_Hifi_FST_Writer_Operator(bpy.types.Operator, ExportH
     embed: BoolProperty(default=False, name="Embed Textures",
                          description="Embed Textures to Exported Model. Turn this off if you are having issues of Textures not showing correctly in elsewhere.")
 
+    lod_levels: IntProperty(default=0, min=0, max=5, name="LOD Levels",
+                            description="Reduced detail versions of the avatar written next to it, 0 disables LODs")
+    lod_ratio: FloatProperty(default=0.5, min=0.01, max=0.99, name="LOD Ratio",
+                             description="Share of the triangles each LOD level keeps from the level before it")
+    lod_triangle_budget: IntProperty(default=0, min=0, name="LOD1 Triangle Budget",
+                                     description="Triangles of the whole avatar in the first LOD level, 0 uses the LOD Ratio instead")
+    lod_distance: FloatProperty(default=5.0, min=0.1, name="LOD Distance",
+                                description="Distance in meters a level keeping half of the triangles is switched to, levels with fewer triangles switch further away")
+
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "selected_only")
        #layout.prop(self, "flow")
         layout.prop(self, "embed")
+        layout.prop(self, "lod_levels")
+        if self.lod_levels > 0:
+            layout.prop(self, "lod_ratio")
+            layout.prop(self, "lod_triangle_budget")
+            layout.prop(self, "lod_distance")
 
         #layout.prop(self, "anim_graph_url")
         layout.prop(self, "script")
@@ -213,10 +229,14 @@ class EXPORT_OT_MVT_TOOLSET_Hifi_FST_Writer_Operator(bpy.types.Operator, ExportH
             bpy.ops.metaverse_toolset_messages.export_error_no_armature('INVOKE_DEFAULT')
             return {'CANCELLED'}
 
+        # Rate the avatar before export, the bone warning comes from the Vircadia budget
+        report = budget.analyze_avatar(to_export, ["vircadia"])
+        budget.print_report(report)
+
         val = FSTWriter.fst_export(self, to_export)
         
         if val == {'FINISHED'}:
-            if len(armatures[0].data.edit_bones) > 100:
+            if report["platforms"]["vircadia"]["metrics"]["bones"]["rating"] != "ok":
                 bpy.ops.metaverse_toolset_messages.export_warn_bone('INVOKE_DEFAULT')
             else:
                 bpy.ops.metaverse_toolset_messages.export_success('INVOKE_DEFAULT')
@@ -31,11 +31,15 @@ from metaverse_tools.utils.helpers.mesh import get_mesh_from
 from metaverse_tools.utils.helpers.common import of
 from metaverse_tools.utils.helpers.materials import get_images_from
 from metaverse_tools.utils.helpers.bake_tool import bake_fbx
+from metaverse_tools.utils.helpers import lod
+from metaverse_tools.utils import log
 
 import webbrowser
 import shutil
 import json
 
+logger = log.get_logger("export")
+
 prefix_joint_maps = {
     "Hips": "jointRoot",
     "Head": "jointHead",
@@ -66,6 +70,7 @@ prefix_joint = "joint = ¤ = $\n"
 prefix_free_joint = "freeJoint = $\n"
 
 prefix_script = "script = $\n"
+prefix_lod = "lod = ¤ = $\n"
 #prefix_anim_graph_url = "animGraphUrl = $\n"
 
 
@@ -79,6 +84,41 @@ def default_blend_shape(selected):
             #  if something does not already exist in model
 
 
+# Exports <avatar>_LOD<n>.fbx with every mesh of the avatar decimated, returns [(file name, switch distance, triangles)]
+def export_avatar_lods(context, selected, directory, avatar_name, path_mode):
+    levels = getattr(context, "lod_levels", 0)
+    meshes = of(selected, "MESH")
+    if levels <= 0 or len(meshes) == 0:
+        return []
+
+    triangles = sum(lod.count_triangles(obj.data) for obj in meshes)
+    ratios = lod.get_lod_ratios(triangles, levels, context.lod_ratio, context.lod_triangle_budget)
+    original_data = [(obj, obj.data) for obj in meshes]
+
+    lod_distance = getattr(context, "lod_distance", lod.DEFAULT_LOD_DISTANCE)
+    lods = []
+    try:
+        for level, ratio in ratios:
+            for obj in meshes:
+                obj.data = lod.get_lod_mesh(obj, ratio)
+
+            lod_file = avatar_name + "_LOD" + str(level) + ".fbx"
+            logger.debug("Writing LOD %d %s", level, lod_file)
+            bpy.ops.metaverse_toolset.export_scene_fbx(filepath=ntpath.join(directory, lod_file), embed_textures=context.embed, path_mode=path_mode,
+                                     use_selection=True, add_leaf_bones=False,  axis_forward='-Z', axis_up='Y')
+            lods.append((lod_file, lod.get_lod_distance(lod_distance, ratio), sum(lod.count_triangles(obj.data) for obj in meshes)))
+
+            for obj, data in original_data:
+                obj.data = data
+    finally:
+        for obj, data in original_data:
+            obj.data = data
+        lod.clear_lod_cache()
+
+    lod.log_lod_report([(avatar_name, [triangles] + [lod_triangles for _, _, lod_triangles in lods])])
+    return lods
+
+
 def fst_export(context, selected):
 
     preferences = bpy.context.preferences.addons[metaverse_tools.__name__].preferences
@@ -160,6 +200,9 @@ def fst_export(context, selected):
         bpy.ops.metaverse_toolset.export_scene_fbx(filepath=avatar_filepath, embed_textures=context.embed, path_mode=path_mode,
                                  use_selection=True, add_leaf_bones=False,  axis_forward='-Z', axis_up='Y')
 
+        for lod_file, distance, _ in export_avatar_lods(context, selected, directory, scene_id, path_mode):
+            f.write(prefix_lod.replace('¤', lod_file).replace('$', str(distance)))
+
         if not context.embed:
             texture_dir = ntpath.join(directory, "textures")
 
@@ -184,8 +227,9 @@ def fst_export(context, selected):
                 shutil.copy(current_path, ntpath.join(
                     texture_dir, ntpath.basename(current_path)))
 
-        if preferences.oventool is not None and context.bake:
-            bake_fbx(preferences.oventool, avatar_filepath)
+        oventool = getattr(preferences, "oventool", None)
+        if oventool is not None and getattr(context, "bake", False):
+            bake_fbx(oventool, avatar_filepath)
 
     except Exception as e:
         print('Could not write to file.', e)
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Binary glTF assets for the scene JSON exporter.
+# Meshes are written with Blender's glTF exporter and post processed here:
+#  - positions / normals quantized to normalized shorts / bytes (KHR_mesh_quantization),
+#    dequantized by a child node transform per mesh
+#  - embedded images moved to content hashed files in a shared texture folder, so entities
+#    using the same texture point to the same url
+#  - the binary chunk repacked tightly without the removed buffer views
+
+import bpy
+import os
+import json
+import struct
+import numpy
+from hashlib import sha256
+
+from metaverse_tools.utils import log
+
+logger = log.get_logger("export")
+
+GLB_MAGIC = 0x46546C67
+GLB_VERSION = 2
+JSON_CHUNK = 0x4E4F534A
+BIN_CHUNK = 0x004E4942
+
+ARRAY_BUFFER = 34962
+MESH_QUANTIZATION = "KHR_mesh_quantization"
+
+COMPONENT_TYPES = {
+    5120: numpy.int8,
+    5121: numpy.uint8,
+    5122: numpy.int16,
+    5123: numpy.uint16,
+    5125: numpy.uint32,
+    5126: numpy.float32
+}
+COMPONENT_COUNTS = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT4": 16}
+IMAGE_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg"}
+
+
+def export_glb(file_path):
+    properties = bpy.ops.export_scene.gltf.get_rna_type().properties.keys()
+    options = {"filepath": file_path, "export_format": "GLB", "export_yup": True}
+    # Renamed in 2.83
+    options["use_selection" if "use_selection" in properties else "export_selected"] = True
+    if "export_animations" in properties:
+        options["export_animations"] = False
+    return bpy.ops.export_scene.gltf(**options)
+
+
+def read_glb(file_path):
+    with open(file_path, "rb") as glb_file:
+        data = glb_file.read()
+
+    magic, version, length = struct.unpack_from("<III", data, 0)
+    if magic != GLB_MAGIC or version != GLB_VERSION:
+        raise ValueError(file_path + " is not a glTF 2.0 binary file")
+
+    gltf = None
+    binary = b""
+    offset = 12
+    while offset < length:
+        chunk_length, chunk_type = struct.unpack_from("<II", data, offset)
+        offset += 8
+        chunk = data[offset:offset + chunk_length]
+        offset += chunk_length
+        if chunk_type == JSON_CHUNK:
+            gltf = json.loads(chunk.decode("utf-8"))
+        elif chunk_type == BIN_CHUNK:
+            binary = bytes(chunk)
+    return gltf, binary
+
+
+def write_glb(file_path, gltf, binary):
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    binary += b"\0" * (-len(binary) % 4)
+
+    length = 12 + 8 + len(json_chunk) + (8 + len(binary) if binary else 0)
+    with open(file_path, "wb") as glb_file:
+        glb_file.write(struct.pack("<III", GLB_MAGIC, GLB_VERSION, length))
+        glb_file.write(struct.pack("<II", len(json_chunk), JSON_CHUNK))
+        glb_file.write(json_chunk)
+        if binary:
+            glb_file.write(struct.pack("<II", len(binary), BIN_CHUNK))
+            glb_file.write(binary)
+    return length
+
+
+# Buffer views as separate byte strings, the exporter writes everything into the single GLB buffer
+def split_buffer_views(gltf, binary):
+    return [binary[view.get("byteOffset", 0):view.get("byteOffset", 0) + view["byteLength"]]
+            for view in gltf.get("bufferViews", [])]
+
+
+def add_buffer_view(gltf, views, data, target=None, byte_stride=None):
+    view = {"buffer": 0, "byteLength": len(data)}
+    if target is not None:
+        view["target"] = target
+    if byte_stride is not None:
+        view["byteStride"] = byte_stride
+    gltf.setdefault("bufferViews", []).append(view)
+    views.append(data)
+    return len(views) - 1
+
+
+def get_accessor_references(gltf):
+    # (container, key) pairs holding an accessor index
+    references = []
+    for mesh in gltf.get("meshes", []):
+        for primitive in mesh["primitives"]:
+            references.extend((primitive["attributes"], key) for key in primitive["attributes"])
+            if "indices" in primitive:
+                references.append((primitive, "indices"))
+            for target in primitive.get("targets", []):
+                references.extend((target, key) for key in target)
+    for skin in gltf.get("skins", []):
+        if "inverseBindMatrices" in skin:
+            references.append((skin, "inverseBindMatrices"))
+    for animation in gltf.get("animations", []):
+        for sampler in animation["samplers"]:
+            references.extend([(sampler, "input"), (sampler, "output")])
+    return references
+
+
+def remove_unused_accessors(gltf):
+    references = get_accessor_references(gltf)
+    used = sorted({container[key] for container, key in references})
+    remap = {old: new for new, old in enumerate(used)}
+    gltf["accessors"] = [gltf["accessors"][index] for index in used]
+    for container, key in references:
+        container[key] = remap[container[key]]
+
+
+# Drops accessors and buffer views nothing refers to anymore and packs the rest back to back, 4 byte aligned.
+def pack_buffer_views(gltf, views):
+    if "accessors" in gltf:
+        remove_unused_accessors(gltf)
+
+    used = set()
+    for accessor in gltf.get("accessors", []):
+        if "bufferView" in accessor:
+            used.add(accessor["bufferView"])
+    for image in gltf.get("images", []):
+        if "bufferView" in image:
+            used.add(image["bufferView"])
+
+    remap = {}
+    packed_views = []
+    chunks = []
+    offset = 0
+    for index, view in enumerate(gltf.get("bufferViews", [])):
+        if index not in used:
+            continue
+        remap[index] = len(packed_views)
+        view["byteOffset"] = offset
+        view["byteLength"] = len(views[index])
+        padding = -len(views[index]) % 4
+        chunks.append(views[index] + b"\0" * padding)
+        offset += len(views[index]) + padding
+        packed_views.append(view)
+
+    for accessor in gltf.get("accessors", []):
+        if "bufferView" in accessor:
+            accessor["bufferView"] = remap[accessor["bufferView"]]
+    for image in gltf.get("images", []):
+        if "bufferView" in image:
+            image["bufferView"] = remap[image["bufferView"]]
+
+    gltf["bufferViews"] = packed_views
+    binary = b"".join(chunks)
+    if binary:
+        gltf["buffers"] = [{"byteLength": len(binary)}]
+    else:
+        gltf.pop("buffers", None)
+    return binary
+
+
+def read_accessor(gltf, views, index):
+    accessor = gltf["accessors"][index]
+    dtype = numpy.dtype(COMPONENT_TYPES[accessor["componentType"]])
+    components = COMPONENT_COUNTS[accessor["type"]]
+    count = accessor["count"]
+    view = gltf["bufferViews"][accessor["bufferView"]]
+    data = views[accessor["bufferView"]]
+    stride = view.get("byteStride", dtype.itemsize * components)
+
+    array = numpy.ndarray((count, components), dtype=dtype, buffer=data,
+                          offset=accessor.get("byteOffset", 0), strides=(stride, dtype.itemsize))
+    return numpy.array(array)
+
+
+# Writes an (n, c) array as a new accessor, rows padded so every vertex starts 4 byte aligned
+def add_vertex_accessor(gltf, views, array, accessor_type, normalized=False):
+    count, components = array.shape
+    padded_components = components
+    while (padded_components * array.dtype.itemsize) % 4:
+        padded_components += 1
+
+    if padded_components != components:
+        padded = numpy.zeros((count, padded_components), dtype=array.dtype)
+        padded[:, :components] = array
+    else:
+        padded = numpy.ascontiguousarray(array)
+
+    component_type = next(key for key, value in COMPONENT_TYPES.items() if numpy.dtype(value) == array.dtype)
+    byte_stride = padded_components * array.dtype.itemsize
+    view = add_buffer_view(gltf, views, padded.tobytes(), ARRAY_BUFFER,
+                           byte_stride if padded_components != components else None)
+
+    accessor = {"bufferView": view, "componentType": component_type, "count": count, "type": accessor_type}
+    if normalized:
+        accessor["normalized"] = True
+    gltf["accessors"].append(accessor)
+    return len(gltf["accessors"]) - 1
+
+
+def get_quantizable_meshes(gltf):
+    skinned = {node["mesh"] for node in gltf.get("nodes", []) if "mesh" in node and "skin" in node}
+    meshes = []
+    for index, mesh in enumerate(gltf.get("meshes", [])):
+        if index in skinned:
+            continue
+        # Morph targets would need the same dequantization, leave them as floats
+        if any("targets" in primitive for primitive in mesh["primitives"]):
+            continue
+        if all("POSITION" in primitive["attributes"] for primitive in mesh["primitives"]):
+            meshes.append(index)
+    return meshes
+
+
+# KHR_mesh_quantization: positions to normalized int16 in the mesh bounds, normals to normalized int8.
+# The bounds are restored by a child node with translation / scale, normals and tangents are
+# pre-transformed so they come out the same after the renderer applies that scale.
+def quantize_meshes(gltf, views):
+    meshes = get_quantizable_meshes(gltf)
+    if not meshes:
+        return 0
+
+    for mesh_index in meshes:
+        primitives = gltf["meshes"][mesh_index]["primitives"]
+        positions = [read_accessor(gltf, views, primitive["attributes"]["POSITION"]).astype(numpy.float64)
+                     for primitive in primitives]
+        stacked = numpy.concatenate(positions)
+        low = stacked.min(axis=0)
+        high = stacked.max(axis=0)
+        offset = (low + high) / 2
+        scale = (high - low) / 2
+        scale[scale == 0] = 1.0
+
+        for primitive, position in zip(primitives, positions):
+            attributes = primitive["attributes"]
+            quantized = numpy.clip(numpy.round((position - offset) / scale * 32767), -32767, 32767).astype(numpy.int16)
+            index = add_vertex_accessor(gltf, views, quantized, "VEC3", normalized=True)
+            gltf["accessors"][index]["min"] = quantized.min(axis=0).tolist()
+            gltf["accessors"][index]["max"] = quantized.max(axis=0).tolist()
+            attributes["POSITION"] = index
+
+            if "NORMAL" in attributes:
+                normal = read_accessor(gltf, views, attributes["NORMAL"]).astype(numpy.float64) * scale
+                normal /= numpy.maximum(numpy.linalg.norm(normal, axis=1, keepdims=True), 1e-12)
+                quantized = numpy.clip(numpy.round(normal * 127), -127, 127).astype(numpy.int8)
+                attributes["NORMAL"] = add_vertex_accessor(gltf, views, quantized, "VEC3", normalized=True)
+
+            if "TANGENT" in attributes:
+                tangent = read_accessor(gltf, views, attributes["TANGENT"]).astype(numpy.float64)
+                direction = tangent[:, :3] / scale
+                tangent[:, :3] = direction / numpy.maximum(numpy.linalg.norm(direction, axis=1, keepdims=True), 1e-12)
+                attributes["TANGENT"] = add_vertex_accessor(gltf, views, tangent.astype(numpy.float32), "VEC4")
+
+        # Move the mesh to a child node that dequantizes it
+        for node in list(gltf["nodes"]):
+            if node.get("mesh") == mesh_index:
+                gltf["nodes"].append({"mesh": mesh_index, "translation": offset.tolist(), "scale": scale.tolist()})
+                node.setdefault("children", []).append(len(gltf["nodes"]) - 1)
+                del node["mesh"]
+
+    for extension_list in ("extensionsUsed", "extensionsRequired"):
+        extensions = gltf.setdefault(extension_list, [])
+        if MESH_QUANTIZATION not in extensions:
+            extensions.append(MESH_QUANTIZATION)
+
+    return len(meshes)
+
+
+# Moves embedded images to <texture_directory>/<content hash>.<ext>, returns (written, reused) file counts
+def share_textures(gltf, views, texture_directory, uri_prefix):
+    written = 0
+    reused = 0
+    for image in gltf.get("images", []):
+        if "bufferView" not in image:
+            continue
+        data = views[image["bufferView"]]
+        filename = sha256(data).hexdigest()[:32] + IMAGE_EXTENSIONS.get(image.get("mimeType"), ".bin")
+        filepath = os.path.join(texture_directory, filename)
+        if os.path.exists(filepath):
+            reused += 1
+        else:
+            os.makedirs(texture_directory, exist_ok=True)
+            with open(filepath, "wb") as texture_file:
+                texture_file.write(data)
+            written += 1
+
+        del image["bufferView"]
+        image.pop("mimeType", None)
+        image["uri"] = uri_prefix + filename
+    return written, reused
+
+
+def optimize_glb(file_path, quantize=False, texture_directory=None, texture_uri_prefix="textures/"):
+    original_size = os.path.getsize(file_path)
+    gltf, binary = read_glb(file_path)
+    views = split_buffer_views(gltf, binary)
+
+    quantized = quantize_meshes(gltf, views) if quantize else 0
+    written, reused = (0, 0)
+    if texture_directory is not None:
+        written, reused = share_textures(gltf, views, texture_directory, texture_uri_prefix)
+
+    binary = pack_buffer_views(gltf, views)
+    size = write_glb(file_path, gltf, binary)
+    logger.debug("GLB %s %d KB -> %d KB, %d quantized meshes, %d new and %d shared textures", os.path.basename(file_path),
+                 original_size // 1024, size // 1024, quantized, written, reused)
+    return size
@@ -31,11 +31,22 @@ def load_file(operator, context, filepath="",
               join_children=True, 
               merge_distance = 0.01, 
               delete_interior_faces = True,
-              use_boolean_operation = 'NONE'):
+              use_boolean_operation = 'NONE',
+              color_quantization = 0,
+              use_spatial_cells = False,
+              cell_capacity = 64,
+              merge_cells = False,
+              region_mode = 'NONE',
+              region_center = (0.0, 0.0, 0.0),
+              region_size = (100.0, 100.0, 100.0),
+              region_radius = 50.0):
                   
     json_data = open(filepath).read()
     data = json.loads(json_data)
     
-    scene = HifiScene(data, uv_sphere, join_children, merge_distance, delete_interior_faces, use_boolean_operation)
+    name = os.path.basename(filepath).split(".")[0]
+    scene = HifiScene(data, uv_sphere, join_children, merge_distance, delete_interior_faces, use_boolean_operation, color_quantization,
+                      name=name, use_spatial_cells=use_spatial_cells, cell_capacity=cell_capacity, merge_cells=merge_cells,
+                      region_mode=region_mode, region_center=region_center, region_size=region_size, region_radius=region_radius)
     return {"FINISHED"}
 
@@ -32,7 +32,9 @@ from bpy.props import (
     StringProperty,
     BoolProperty,
     FloatProperty,
-    EnumProperty
+    EnumProperty,
+    IntProperty,
+    FloatVectorProperty
 )
 
 class EXPORT_OT_MVT_TOOLSET_Message_Error_Missing_ATP_Override(bpy.types.Operator):
@@ -91,6 +93,29 @@ class EXPORT_OT_MVT_TOOLSET_Writer_FBX_JSON(bpy.types.Operator, ExportHelper):
     remove_trailing: BoolProperty(
         default=False, name="Remove Trailing .### from names")
 
+    compact: BoolProperty(default=False, name="Compact JSON",
+                          description="Write the json without indentation, for smaller and faster exports of large scenes")
+    use_gzip: BoolProperty(default=False, name="Gzip",
+                           description="Compress the exported json with gzip (.json.gz)")
+    float_precision: IntProperty(default=0, min=0, max=10, name="Float Precision",
+                                 description="Number of decimals all exported values are rounded to, 0 disables rounding")
+
+    lod_levels: IntProperty(default=0, min=0, max=5, name="LOD Levels",
+                            description="Reduced detail versions written next to each model, 0 disables LODs")
+    lod_ratio: FloatProperty(default=0.5, min=0.01, max=0.99, name="LOD Ratio",
+                             description="Share of the triangles each LOD level keeps from the level before it")
+    lod_triangle_budget: IntProperty(default=0, min=0, name="LOD1 Triangle Budget",
+                                     description="Triangles of the first LOD level, 0 uses the LOD Ratio instead")
+
+    use_mesh_cache: BoolProperty(default=True, name="Cache Modified Meshes",
+                                 description="Reuse meshes with their modifiers applied from earlier exports when the mesh and modifier settings are unchanged")
+    share_textures: BoolProperty(default=False, name="Share Textures",
+                                 description="Write every distinct texture once to a textures folder next to the json instead of embedding it in every .fbx")
+    atlas_textures: BoolProperty(default=False, name="Atlas Textures",
+                                 description="Pack small base color textures of otherwise identical materials into shared atlases, requires Clone Scene")
+    atlas_max_texture_size: IntProperty(default=512, min=0, max=4096, name="Atlas Max Texture Size",
+                                        description="Only textures up to this size are packed into atlases, 0 packs any size")
+
     def draw(self, context):
         layout = self.layout
 
@@ -107,6 +132,18 @@ class EXPORT_OT_MVT_TOOLSET_Writer_FBX_JSON(bpy.types.Operator, ExportHelper):
             text="Clone scene: Performs automated actions on a cloned scene instead of the original.")
         layout.prop(self, "clone_scene")
         layout.prop(self, "remove_trailing")
+        layout.prop(self, "compact")
+        layout.prop(self, "use_gzip")
+        layout.prop(self, "float_precision")
+        layout.prop(self, "use_mesh_cache")
+        layout.prop(self, "lod_levels")
+        if self.lod_levels > 0:
+            layout.prop(self, "lod_ratio")
+            layout.prop(self, "lod_triangle_budget")
+        layout.prop(self, "share_textures")
+        layout.prop(self, "atlas_textures")
+        if self.atlas_textures:
+            layout.prop(self, "atlas_max_texture_size")
 
     def execute(self, context):
         if not self.filepath:
@@ -123,7 +160,7 @@ class EXPORT_OT_MVT_TOOLSET_Writer_FBX_JSON(bpy.types.Operator, ExportHelper):
         return {'FINISHED'}
 
 class EXPORT_OT_MVT_TOOLSET_Writer_GLTF_JSON(bpy.types.Operator, ExportHelper):
-    """ This Operator to show an error that the ATP Override is missing from export
+    """ Export the scene as Vircadia scene JSON with binary glTF (.glb) models
     """
     bl_idname = "metaverse_toolset.export_gltb_json"
     bl_label = "Export HiFi Scene"
@@ -146,6 +183,31 @@ class EXPORT_OT_MVT_TOOLSET_Writer_GLTF_JSON(bpy.types.Operator, ExportHelper):
     remove_trailing: BoolProperty(
         default=False, name="Remove Trailing .### from names")
 
+    compact: BoolProperty(default=False, name="Compact JSON",
+                          description="Write the json without indentation, for smaller and faster exports of large scenes")
+    use_gzip: BoolProperty(default=False, name="Gzip",
+                           description="Compress the exported json with gzip (.json.gz)")
+    float_precision: IntProperty(default=0, min=0, max=10, name="Float Precision",
+                                 description="Number of decimals all exported values are rounded to, 0 disables rounding")
+
+    lod_levels: IntProperty(default=0, min=0, max=5, name="LOD Levels",
+                            description="Reduced detail versions written next to each model, 0 disables LODs")
+    lod_ratio: FloatProperty(default=0.5, min=0.01, max=0.99, name="LOD Ratio",
+                             description="Share of the triangles each LOD level keeps from the level before it")
+    lod_triangle_budget: IntProperty(default=0, min=0, name="LOD1 Triangle Budget",
+                                     description="Triangles of the first LOD level, 0 uses the LOD Ratio instead")
+
+    use_mesh_cache: BoolProperty(default=True, name="Cache Modified Meshes",
+                                 description="Reuse meshes with their modifiers applied from earlier exports when the mesh and modifier settings are unchanged")
+    quantize_meshes: BoolProperty(default=False, name="Quantize Meshes",
+                                  description="Store positions and normals as normalized integers (KHR_mesh_quantization), the client must support the extension")
+    share_textures: BoolProperty(default=True, name="Share Textures",
+                                 description="Write textures once to a textures folder next to the json instead of embedding them in every .glb")
+    atlas_textures: BoolProperty(default=False, name="Atlas Textures",
+                                 description="Pack small base color textures of otherwise identical materials into shared atlases, requires Clone Scene")
+    atlas_max_texture_size: IntProperty(default=512, min=0, max=4096, name="Atlas Max Texture Size",
+                                        description="Only textures up to this size are packed into atlases, 0 packs any size")
+
     def draw(self, context):
         layout = self.layout
 
@@ -162,6 +224,19 @@ class EXPORT_OT_MVT_TOOLSET_Writer_GLTF_JSON(bpy.types.Operator, ExportHelper):
             text="Clone scene: Performs automated actions on a cloned scene instead of the original.")
         layout.prop(self, "clone_scene")
         layout.prop(self, "remove_trailing")
+        layout.prop(self, "compact")
+        layout.prop(self, "use_gzip")
+        layout.prop(self, "float_precision")
+        layout.prop(self, "use_mesh_cache")
+        layout.prop(self, "lod_levels")
+        if self.lod_levels > 0:
+            layout.prop(self, "lod_ratio")
+            layout.prop(self, "lod_triangle_budget")
+        layout.prop(self, "quantize_meshes")
+        layout.prop(self, "share_textures")
+        layout.prop(self, "atlas_textures")
+        if self.atlas_textures:
+            layout.prop(self, "atlas_max_texture_size")
 
     def execute(self, context):
         if not self.filepath:
@@ -225,6 +300,62 @@ class IMPORT_OT_MVT_TOOLSET_Scene_From_JSON(bpy.types.Operator, ImportHelper):
         description="EXPERIMENTAL: Enable Boolean Operation when joining parents",
     )
 
+    color_quantization: IntProperty(
+        name="Color Merge Step",
+        description="Snap entity colors to multiples of this value so near identical colors share a material, 0 keeps every color",
+        min=0, max=64,
+        default=0,
+    )
+
+    use_spatial_cells: BoolProperty(
+        name="Spatial Cells",
+        description="Group entities into collections by an octree over their world bounds, so large domains can be hidden and edited a cell at a time",
+        default=False,
+    )
+
+    cell_capacity: IntProperty(
+        name="Entities per Cell",
+        description="Split a cell when it holds more root entities than this",
+        min=1, max=4096,
+        default=64,
+    )
+
+    merge_cells: BoolProperty(
+        name="Merge Static per Cell",
+        description="Join the non-dynamic entities of each cell sharing a material into one mesh. Individual entity objects are lost",
+        default=False,
+    )
+
+    region_mode: EnumProperty(
+        items=(('NONE', "Everything", "Import every entity"),
+               ('BOX', "Box", "Import only entities overlapping a box"),
+               ('SPHERE', "Sphere", "Import only entities overlapping a sphere")),
+        name="Region of Interest",
+        description="Import only the part of the domain around a point. Entities are kept or skipped together with their children",
+        default='NONE',
+    )
+
+    region_center: FloatVectorProperty(
+        name="Region Center",
+        description="Center of the region in Blender coordinates",
+        subtype='TRANSLATION',
+        default=(0.0, 0.0, 0.0),
+    )
+
+    region_size: FloatVectorProperty(
+        name="Region Size",
+        description="Size of the region box",
+        subtype='XYZ', min=0.0,
+        default=(100.0, 100.0, 100.0),
+    )
+
+    region_radius: FloatProperty(
+        name="Region Radius",
+        description="Radius of the region sphere",
+        min=0.0,
+        default=50.0,
+    )
+
     def draw(self, context):
         layout = self.layout
 
@@ -237,8 +368,22 @@ class IMPORT_OT_MVT_TOOLSET_Scene_From_JSON(bpy.types.Operator, ImportHelper):
 
         sub.prop(self, "delete_interior_faces")
         sub.prop(self, "use_boolean_operation")
+        sub.prop(self, "color_quantization")
         sub.prop(self, "use_gltf")
 
+        sub.prop(self, "use_spatial_cells")
+        if self.use_spatial_cells:
+            sub.prop(self, "cell_capacity")
+            sub.prop(self, "merge_cells")
+
+        sub.prop(self, "region_mode")
+        if self.region_mode != 'NONE':
+            sub.prop(self, "region_center")
+            if self.region_mode == 'BOX':
+                sub.prop(self, "region_size")
+            else:
+                sub.prop(self, "region_radius")
+
     def execute(self, context):
         keywords = self.as_keywords(ignore=("filter_glob", "directory"))
         return load_file(self, context, **keywords)
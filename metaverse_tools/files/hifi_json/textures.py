@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Scene level texture sharing for the scene JSON exporter.
+# Every image used by the exported meshes is hashed by its pixels and written once to the shared
+# texture folder, image nodes are pointed to the shared copies for the duration of the export so the
+# models reference them instead of embedding their own.
+
+import bpy
+import os
+import shutil
+from hashlib import sha256
+
+from metaverse_tools.utils.helpers.atlas import read_image_pixels, write_image_pixels
+from metaverse_tools.utils.helpers.materials import get_texture_memory
+from metaverse_tools.utils import log
+
+COPY_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+logger = log.get_logger("export")
+
+
+# {image: [image nodes]} of the materials on the given mesh objects
+def get_export_image_nodes(objects):
+    image_nodes = {}
+    materials = set()
+    for obj in objects:
+        if obj.type == "MESH":
+            materials.update(slot.material for slot in obj.material_slots if slot.material is not None)
+
+    for material in materials:
+        if not material.use_nodes or material.node_tree is None:
+            continue
+        for node in material.node_tree.nodes:
+            if node.type == 'TEX_IMAGE' and node.image is not None:
+                image_nodes.setdefault(node.image, []).append(node)
+    return image_nodes
+
+
+def get_pixel_hash(image):
+    digest = sha256()
+    digest.update(str(tuple(image.size)).encode("utf-8"))
+    digest.update(read_image_pixels(image).tobytes())
+    return digest.hexdigest()
+
+
+def get_source_file(image):
+    if image.source != 'FILE' or image.packed_file is not None:
+        return None
+    filepath = bpy.path.abspath(image.filepath)
+    if os.path.isfile(filepath) and filepath.lower().endswith(COPY_EXTENSIONS):
+        return filepath
+    return None
+
+
+# Copies the source file when there is one, otherwise writes the pixels as PNG
+def write_shared_texture(image, directory, digest):
+    source = get_source_file(image)
+    extension = os.path.splitext(source)[1].lower() if source is not None else ".png"
+    filepath = os.path.join(directory, digest[:32] + extension)
+    if os.path.exists(filepath):
+        return filepath
+
+    os.makedirs(directory, exist_ok=True)
+    if source is not None:
+        shutil.copyfile(source, filepath)
+    else:
+        width, height = image.size
+        copy = bpy.data.images.new(digest[:32], width, height, alpha=True)
+        try:
+            write_image_pixels(copy, read_image_pixels(image))
+            copy.filepath_raw = filepath
+            copy.file_format = 'PNG'
+            copy.save()
+        finally:
+            bpy.data.images.remove(copy)
+    return filepath
+
+
+# Returns [(node, original image)] to hand to restore_scene_textures once the export is done
+def share_scene_textures(objects, texture_directory):
+    image_nodes = get_export_image_nodes(objects)
+    shared_images = {}
+    replaced = []
+    duplicate_memory = 0
+    for image, nodes in image_nodes.items():
+        if image.size[0] == 0 or image.size[1] == 0:
+            continue
+        digest = get_pixel_hash(image)
+        shared = shared_images.get(digest)
+        if shared is None:
+            filepath = write_shared_texture(image, texture_directory, digest)
+            shared = bpy.data.images.load(filepath, check_existing=True)
+            shared.colorspace_settings.name = image.colorspace_settings.name
+            shared_images[digest] = shared
+        else:
+            duplicate_memory += get_texture_memory(image)
+
+        for node in nodes:
+            replaced.append((node, image))
+            node.image = shared
+
+    logger.info("Shared textures: %d images, %d unique, %.1f MB of duplicates removed",
+                len(image_nodes), len(shared_images), duplicate_memory / 1024 ** 2)
+    return replaced
+
+
+def restore_scene_textures(replaced):
+    shared_images = set()
+    for node, image in replaced:
+        shared_images.add(node.image)
+        node.image = image
+
+    for image in shared_images:
+        if image is not None and image.users == 0:
+            bpy.data.images.remove(image)
@@ -23,15 +23,25 @@ import uuid
 import re
 import os
 import json
+import gzip
+import metaverse_tools
 
-from mathutils import Quaternion
+from mathutils import Quaternion, Vector
 from math import sqrt
 from hashlib import md5, sha256
 from copy import copy, deepcopy
 
 from metaverse_tools.utils.helpers.extra_math import *
+from metaverse_tools.files.hifi_json import glb, textures
+from metaverse_tools.utils.helpers import lod, material_merge, mesh_cache
+from metaverse_tools.utils import log
 
 EXPORT_VERSION = 85
+# Shared textures of the exported models, relative to the exported json
+TEXTURE_FOLDER = "textures/"
+
+logger = log.get_logger("export")
+
 
 def center_all(blender_object):
     for child in blender_object.children:
@@ -49,77 +59,10 @@ def select(blender_object):
                 
     blender_object.select_set(state=True)
 
-# Can't use name to define the unique id as this is not shared between instancing, instead going to go through 
-# Each modifier in order and hope the order is the same
-# TODO: Separate to utility perhaps?
+# Can't use name to define the unique id as this is not shared between instancing, instead going to go through
+# every setting of each modifier in order and hope the order is the same
 def generate_unique_id_modifier(modifiers):
-    unique_name = ""
-    for index, modifier in enumerate(modifiers):
-        print(str(index), "Iterating", modifier.name, modifier.type)
-        # for use only 
-        old_unique = unique_name + "|name>" + modifier.name
-       
-        unique_name = unique_name + "|" + str(index) + "|m:" + modifier.type
-        if modifier.type == 'EDGE_SPLIT':
-            print("Edge split")
-            unique_name = unique_name + "|sa:" + str(modifier.split_angle)
-            if modifier.use_apply_on_spline:
-                unique_name = unique_name + "|uaos"
-            if modifier.use_edge_angle:
-                unique_name = unique_name + "|ua"
-            if modifier.use_edge_sharp:
-                unique_name = unique_name + "|us"
-        elif modifier.type == 'MIRROR':
-            print("Mirror")
-            if modifier.mirror_object:
-                unique_name = unique_name + '|m:' + modifier.mirror_object.name      
-            if modifier.use_x:
-                unique_name = unique_name + "|x"
-            if modifier.use_y:
-                unique_name = unique_name + "|y"
-            if modifier.use_z:
-                unique_name = unique_name + "|z"
-            if modifier.use_mirror_u:
-                unique_name = unique_name + "|u"
-            if modifier.use_mirror_v:
-                unique_name = unique_name + "|v"
-            if modifier.use_clip:
-                unique_name = unique_name + "|c"
-            if modifier.use_mirror_vertex_groups:
-                unique_name = unique_name + "|mvg"
-            if modifier.use_mirror_merge:
-                unique_name = unique_name + "|mm:" + str(modifier.merge_threshold)
-        elif modifier.type == 'ARRAY':
-
-            print("Array")
-            if modifier.fit_type == 'FIXED_COUNT':
-                unique_name = unique_name + '|c:' + str(modifier.count)
-            if modifier.fit_type == 'FIT_LENGTH':
-                unique_name = unique_name + '|fl:' + str(modifier.fit_length)
-            if modifier.fit_type == 'FIT_CURVE' and modifier.curve:
-                unique_name = unique_name + '|cr:' + str(modifier.curve.name)
-            if modifier.use_merge_vertices:
-                unique_name = unique_name + '|mt:' + str(modifier.merge_threshold)
-            if modifier.use_constant_offset:
-                unique_name = unique_name + '|cod:' + str(modifier.constant_offset_display.to_tuple())
-            # This one behaves differently than above in blender, so custom method
-            if modifier.use_relative_offset:
-                rod = (modifier.relative_offset_displace[0], modifier.relative_offset_displace[1], modifier.relative_offset_displace[2])
-                unique_name = unique_name + '|rod:' + str(rod)
-
-            if modifier.start_cap:
-                unique_name = unique_name + '|sc:' + modifier.start_cap.name
-            if modifier.end_cap:
-                unique_name = unique_name + '|ec:' + modifier.end_cap.name
-            if modifier.use_object_offset and modifier.offset_object:
-                unique_name = unique_name + '|oo:' + modifier.offset_object.name
-        else:
-            # TODO: Add Support to subsurface / solidify
-            unique_name = old_unique
-            print( 'Unsupported modifier ', modifier.name, modifier.type, ' Skipping')
-    
-    print(unique_name)
-    return str(uuid.uuid5(uuid.NAMESPACE_DNS, unique_name))
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, mesh_cache.get_modifiers_fingerprint(modifiers)))
 
 
 def apply_all_modifiers(modifiers):
@@ -134,8 +77,9 @@ def set_relative_to_parent(blender_object, json_data):
         
         parent_uuid = uuid.uuid5(uuid.NAMESPACE_DNS, parent.name)
         
-        parent_orientation = quat_swap_nzy(relative_rotation(blender_object))
-        parent_position = swap_nzy(relative_position(blender_object))
+        local_position, local_rotation = get_parent_relative_transform(blender_object)
+        parent_orientation = quat_swap_nzy(local_rotation)
+        parent_position = swap_nzy(local_position)
         
         json_data["position"] = {
             'x': parent_position.x,
@@ -155,7 +99,67 @@ def set_relative_to_parent(blender_object, json_data):
     return json_data
         
 
-def parse_object(blender_object, path, options, gltf):  
+def export_model_file(blender_object, file_path, path, options, gltf):
+    if gltf:
+        logger.debug("Writing GLB %s", file_path)
+        # glTF keeps the object location on the root node, the entity position already carries it
+        temp_location = Vector(blender_object.location)
+        blender_object.location = Vector((0, 0, 0))
+        try:
+            glb.export_glb(file_path)
+        finally:
+            blender_object.location = temp_location
+
+        texture_directory = path + TEXTURE_FOLDER if options.share_textures else None
+        glb.optimize_glb(file_path, options.quantize_meshes, texture_directory, TEXTURE_FOLDER)
+    else:
+        logger.debug("Writing FBX %s", file_path)
+        if options.share_textures:
+            # Image nodes point to the shared texture folder, see textures.share_scene_textures
+            bpy.ops.metaverse_toolset.export_scene_fbx(filepath=file_path, embed_textures=False, path_mode='RELATIVE', use_selection=True, axis_forward='-Z', axis_up='Y')
+        else:
+            bpy.ops.metaverse_toolset.export_scene_fbx(filepath=file_path, embed_textures=True, path_mode='COPY', use_selection=True, axis_forward='-Z', axis_up='Y')
+
+
+# Export settings the model files depend on besides the mesh, stored with each LOD file in the manifest
+def get_lod_options(options, gltf):
+    return {"format": "glb" if gltf else "fbx",
+            "quantize_meshes": bool(gltf and getattr(options, "quantize_meshes", False)),
+            "share_textures": bool(getattr(options, "share_textures", False))}
+
+
+# Writes <asset name>_LOD<n><extension> next to the model, skipping files the manifest says are current.
+def export_model_lods(blender_object, path, asset_name, extension, options, gltf, lod_export):
+    levels = getattr(options, "lod_levels", 0)
+    if levels <= 0 or lod_export is None:
+        return []
+
+    mesh = blender_object.data
+    content_hash = lod.get_mesh_content_hash(mesh)
+    triangles = lod.count_triangles(mesh)
+    ratios = lod.get_lod_ratios(triangles, levels, options.lod_ratio, options.lod_triangle_budget)
+
+    lods = []
+    for level, ratio in ratios:
+        file_name = asset_name + "_LOD" + str(level) + extension
+        lod_triangles = lod_export.get_current_triangles(file_name, content_hash, ratio)
+        if lod_triangles is None:
+            lod_mesh = lod.get_lod_mesh(blender_object, ratio, content_hash)
+            blender_object.data = lod_mesh
+            try:
+                export_model_file(blender_object, path + file_name, path, options, gltf)
+            finally:
+                blender_object.data = mesh
+            lod_triangles = lod.count_triangles(lod_mesh)
+            lod_export.add(file_name, content_hash, ratio, lod_triangles)
+
+        lods.append({"file": file_name, "ratio": ratio, "triangles": lod_triangles})
+
+    lod_export.report.append((asset_name, [triangles] + [lod_file["triangles"] for lod_file in lods]))
+    return lods
+
+
+def parse_object(blender_object, path, options, gltf, lod_export=None):
     # Store existing rotation mode, just in case.
     json_data = None
     # Make sure context is quaternion for the models
@@ -186,14 +190,29 @@ def parse_object(blender_object, path, options, gltf):
             # Lets do a LOW-LEVEL duplicate, too much automation in duplicate         
             clone = blender_object.copy()
             original_object = blender_object
-            clone.data = blender_object.data.copy()
+            uid = "-" + generate_unique_id_modifier(blender_object.modifiers)
+
+            cache_key = None
+            cached_mesh = None
+            if getattr(options, "use_mesh_cache", False) and mesh_cache.is_cacheable(blender_object):
+                cache_key = evaluated_meshes.get_key(blender_object)
+                cached_mesh = evaluated_meshes.get_mesh(cache_key, blender_object.data)
+
+            if cached_mesh is not None:
+                clone.data = cached_mesh
+                for modifier in list(clone.modifiers):
+                    clone.modifiers.remove(modifier)
+            else:
+                clone.data = blender_object.data.copy()
             bpy.context.collection.objects.link(clone)
             clone.select_set(state=True)
             original_object.select_set(state=False)
-            
-            uid = "-" + generate_unique_id_modifier(clone.modifiers)
+
             bpy.context.view_layer.objects.active = clone
-            apply_all_modifiers(clone.modifiers)
+            if cached_mesh is None:
+                apply_all_modifiers(clone.modifiers)
+                if cache_key is not None:
+                    evaluated_meshes.store(cache_key, clone.data)
             blender_object = clone
 
             clone.select_set(state=True)
@@ -202,30 +221,20 @@ def parse_object(blender_object, path, options, gltf):
         dimensions = swap_yz(blender_object.dimensions)
         
         bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY', center='BOUNDS')
+        # Entities are placed by their bounds center, the same origin children are made relative to
+        position = swap_nzy(blender_object.location)
 
-        print("Storing existing rotation")
         temp_rotation = Quaternion(blender_object.rotation_quaternion)
         # Temporary Rotate Model to a zero rotation so that the exported model rotation is normalized.
         blender_object.rotation_quaternion = Quaternion((1,0,0,0))
         
         #blender_object.dimensions = Vector((1,1,1))
 
-        # TODO: Option to also export via gltf instead of fbx
         # TODO: Add Option to not embedtextures / copy paths
 
-
-        #
-        if gltf:
-            file_path = path + reference_name + uid 
-            print("Writing GLTF with path_mode=", file_path)
-            #bpy.ops.metaverse_toolset.export_scene_fbx(filepath=file_path, embed_textures=True, path_mode='COPY', use_selection=True, axis_forward='-Z', axis_up='Y')
-            # TODO: Add gltf option HERE.
-            return False
-
-        else:
-            file_path = path + reference_name + uid + ".fbx"
-            print("Writing FBX with path_mode=", file_path)
-            bpy.ops.metaverse_toolset.export_scene_fbx(filepath=file_path, embed_textures=True, path_mode='COPY', use_selection=True, axis_forward='-Z', axis_up='Y')
+        extension = '.glb' if gltf else '.fbx'
+        export_model_file(blender_object, path + reference_name + uid + extension, path, options, gltf)
+        lods = export_model_lods(blender_object, path, reference_name + uid, extension, options, gltf, lod_export)
 
         # Restore earlier rotation
         # blender_object.dimensions = temp_dimensions
@@ -241,15 +250,16 @@ def parse_object(blender_object, path, options, gltf):
             else:
                 last_folder = ""               
             
-            if gltf:
-                print("GLTF PLACEHOLDER")
-            else:
-                model_url = "atp:/"+ last_folder + reference_name + uid + '.fbx'
+            base_url = "atp:/"+ last_folder
         else:
-            if gltf:
-                print("GLTF PLACEHOLDER")
-            else:
-                model_url = options.url_override + reference_name +  uid + '.fbx'
+            base_url = options.url_override
+
+        model_url = base_url + reference_name + uid + extension
+
+        user_data = {"blender_export": scene_id}
+        if lods:
+            user_data["lods"] = [{"url": base_url + lod_file["file"], "ratio": lod_file["ratio"],
+                                  "triangles": lod_file["triangles"]} for lod_file in lods]
 
 
         json_data = {
@@ -279,18 +289,21 @@ def parse_object(blender_object, path, options, gltf):
                 'cloneable': False
             },
             "shapeType": "static-mesh",
-            'userData': '{"blender_export":"' + scene_id +'"}'
+            'userData': json.dumps(user_data, separators=(",", ":"))
         }         
         
         json_data = set_relative_to_parent(blender_object, json_data)
 
         if original_object:
+            clone_mesh = blender_object.data
             bpy.ops.object.delete()
+            if clone_mesh.users == 0:
+                bpy.data.meshes.remove(clone_mesh)
             blender_object = original_object
             blender_object.select_set(state=True)
             
     elif bo_type == 'LAMP':
-        print(name, 'is Light')
+        logger.debug("%s is Light", name)
         
         # Hifi 5, Blender 3.3 ????
         light = blender_object.data
@@ -335,10 +348,10 @@ def parse_object(blender_object, path, options, gltf):
         # TODO: Spot Lights require rotation by 90 degrees to get pointing in the right direction        
     elif bo_type == 'ARMATURE': # Same as Mesh actually.
         # Get all children export as a single file.
-        print(name, 'is armature. Not Supported as of the moment')
+        logger.debug("%s is armature. Not Supported as of the moment", name)
 
     elif bo_type == 'EMPTY':
-        print(name, 'Adding an Empty')
+        logger.debug("%s Adding an Empty", name)
 
         json_data = { 
             'id': scene_id,
@@ -369,37 +382,106 @@ def parse_object(blender_object, path, options, gltf):
         json_data = set_relative_to_parent(blender_object, json_data)
 
     else:
-        print('Skipping unsupported feature', name, bo_type)
+        logger.debug("Skipping unsupported feature %s %s", name, bo_type)
     
     
+    export_counters[bo_type.lower()] += 1
     # Restore object's rotation mode
-    print(blender_object)
     if blender_object:
         blender_object.rotation_mode = stored_rotation_mode
     
     bpy.ops.object.select_all(action = 'DESELECT')
     return json_data
 
-# Rotation is based on the rotaiton of the parent and self. 
-def relative_rotation(parent_object):
-    if not parent_object.parent:
-        return parent_object.rotation_quaternion
-    else:
-        rotation = relative_rotation( parent_object.parent)
-        current = parent_object.rotation_quaternion
-        current.invert() 
-        print('rotation test', current)
-       
-        return rotation @ current
+# Hifi reads the position and rotation of a child entity in the frame of its parent entity, which has no scale.
+# Read from the world matrices, so matrix_parent_inverse and the parent's scale are accounted for.
+def get_parent_relative_transform(blender_object):
+    # The export changes origins and rotations, matrix_world is only current after an update
+    bpy.context.view_layer.update()
+    parent_position, parent_rotation, _ = blender_object.parent.matrix_world.decompose()
+    position, rotation, _ = blender_object.matrix_world.decompose()
+    parent_rotation.invert()
+    return parent_rotation @ (position - parent_position), parent_rotation @ rotation
+
+
+# Parents before their children, so a parent's origin is moved to its bounds before children are made relative to it
+def get_parents_first(objects):
+    def get_depth(blender_object):
+        depth = 0
+        while blender_object.parent is not None:
+            blender_object = blender_object.parent
+            depth += 1
+        return depth
+    return sorted(objects, key=get_depth)
+
+
+# Parsed objects by type of the current export
+export_counters = log.Counters()
+
+# Meshes with their modifiers applied, kept on disk between exports
+evaluated_meshes = mesh_cache.MeshCache()
+
+
+def get_mesh_cache_size():
+    addon = bpy.context.preferences.addons.get(metaverse_tools.__name__)
+    preferences = addon.preferences if addon is not None else None
+    return getattr(preferences, "mesh_cache_size", 512) * 1024 ** 2
 
 
-def relative_position(parent_object):
-    if parent_object.parent is not None:
-        return relative_rotation(parent_object.parent) @ parent_object.location - relative_position(parent_object.parent)
-    else:
-        return parent_object.location
 
 
+# Streams the scene json one entity at a time instead of building the whole document in memory.
+# Indented output matches json.dumps(indent=4), compact drops all whitespace, gzip compresses the file.
+class SceneJSONWriter:
+    def __init__(self, filepath, compact=False, use_gzip=False, precision=None):
+        self.filepath = filepath
+        self.compact = compact
+        self.use_gzip = use_gzip
+        # No rounding for None or 0 decimals
+        self.nearest = 10 ** precision if precision else None
+        self.count = 0
+        self.temp_filepath = filepath + ".tmp"
+        self.file = None
+
+    def __enter__(self):
+        if self.use_gzip:
+            self.file = gzip.open(self.temp_filepath, "wt", encoding="utf-8")
+        else:
+            self.file = open(self.temp_filepath, "w", encoding="utf-8")
+
+        if self.compact:
+            self.file.write('{"Version":' + str(EXPORT_VERSION) + ',"Entities":[')
+        else:
+            self.file.write('{\n    "Version": ' + str(EXPORT_VERSION) + ',\n    "Entities": [')
+        return self
+
+    def write_entity(self, entity):
+        if self.nearest is not None:
+            entity = round_floats(entity, self.nearest)
+
+        if self.compact:
+            if self.count > 0:
+                self.file.write(",")
+            self.file.write(json.dumps(entity, separators=(",", ":")))
+        else:
+            self.file.write(",\n        " if self.count > 0 else "\n        ")
+            self.file.write(json.dumps(entity, indent=4).replace("\n", "\n        "))
+        self.count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            if self.compact:
+                self.file.write("]}")
+            else:
+                self.file.write("\n    ]\n}" if self.count > 0 else "]\n}")
+        self.file.close()
+
+        if exc_type is None:
+            os.replace(self.temp_filepath, self.filepath)
+        else:
+            os.remove(self.temp_filepath)
+        return False
+
 
 def write_file(context, gltf=False):
     current_scene = bpy.context.scene
@@ -435,35 +517,56 @@ def write_file(context, gltf=False):
         
         if not url.endswith('/'):    
             url = url + "/"
-    
-    entities = []
 
-    # Duplicate list to break reference as we may do updates to the scene
-    current_scene_objects = list(read_scene.objects)
-    for blender_object in current_scene_objects:
-        print(len(current_scene_objects))
-        parsed = parse_object(blender_object, path, context, gltf)
-        
-        if parsed:
-            entities.append(parsed)        
+    filepath = context.filepath
+    if context.use_gzip and not filepath.endswith(".gz"):
+        filepath = filepath + ".gz"
 
-    # Delete Cloned scene
-    #     
-    if context.clone_scene:
-        bpy.ops.scene.delete()
-    
-    hifi_scene = {
-        'Version': EXPORT_VERSION,
-        'Entities': entities
-    }
-    
-    data = json.dumps(hifi_scene, indent=4)
-    
-    file = open(context.filepath, "w")
-    
-    try: 
-        file.write(data)
-    except e:
-        print('Could not write to file.', e)
+    # Duplicate list to break reference as we may do updates to the scene
+    current_scene_objects = get_parents_first(read_scene.objects)
+    lod_export = lod.LODExport(path, get_lod_options(context, gltf))
+    evaluated_meshes.clear()
+    evaluated_meshes.max_size = get_mesh_cache_size()
+    export_counters.clear()
+    logger.info("Exporting %d objects to %s", len(current_scene_objects), filepath)
+    shared_textures = []
+    merge_report = None
+    try:
+        if getattr(context, "atlas_textures", False):
+            if context.clone_scene:
+                merge_report = material_merge.merge_materials(current_scene_objects, True, context.atlas_max_texture_size,
+                                                              path + TEXTURE_FOLDER)
+            else:
+                logger.warning("Skipping texture atlas, it changes materials and UVs and requires Clone Scene")
+        if context.share_textures and not gltf:
+            # glb.optimize_glb shares the textures of glTF exports itself
+            shared_textures = textures.share_scene_textures(current_scene_objects, path + TEXTURE_FOLDER)
+
+        with SceneJSONWriter(filepath, context.compact, context.use_gzip, context.float_precision) as writer:
+            for blender_object in current_scene_objects:
+                parsed = parse_object(blender_object, path, context, gltf, lod_export)
+
+                if parsed:
+                    writer.write_entity(parsed)
+        logger.info("Wrote %d entities", writer.count)
+        export_counters.log_summary(logger, "Objects")
+        if getattr(context, "lod_levels", 0) > 0:
+            lod_export.save()
+        if getattr(context, "use_mesh_cache", False):
+            evaluated_meshes.report()
+            evaluated_meshes.evict()
+    except OSError as e:
+        logger.error("Could not write to file. %s", e)
     finally:
-        file.close()
\ No newline at end of file
+        # Delete Cloned scene
+        lod.clear_lod_cache()
+        evaluated_meshes.clear()
+        textures.restore_scene_textures(shared_textures)
+        if context.clone_scene:
+            bpy.ops.scene.delete()
+        if merge_report is not None:
+            # The atlases only exist for the cloned scene, their files stay in the export folder
+            for material in merge_report["materials"]:
+                bpy.data.materials.remove(material)
+            for image in merge_report["images"]:
+                bpy.data.images.remove(image)
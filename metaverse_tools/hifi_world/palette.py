@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Material palette for imported Hifi primitives, one material per unique (quantized) entity color.
+
+import bpy
+
+NO_MATERIAL_TYPES = ('Light', 'Zone', 'Particle')
+
+
+def get_entity_color(entity):
+    if entity['type'] in NO_MATERIAL_TYPES or 'color' not in entity:
+        return None
+    color = entity['color']
+    return (color['red'], color['green'], color['blue'])
+
+
+# Snaps each channel to the nearest multiple of step, 0 or 1 keeps the colors as is
+def quantize_color(color, step=0):
+    if step <= 1:
+        return tuple(min(255, max(0, int(round(c)))) for c in color)
+    return tuple(min(255, max(0, int(round(c / step)) * step)) for c in color)
+
+
+def pack_color(color):
+    return (color[0] << 16) | (color[1] << 8) | color[2]
+
+
+def unpack_color(key):
+    return ((key >> 16) & 255, (key >> 8) & 255, key & 255)
+
+
+class MaterialPalette:
+    def __init__(self, quantization=0):
+        self.quantization = quantization
+        # {packed 24 bit color: material}
+        self.materials = {}
+        # {packed 24 bit color: entities using it}
+        self.usage = {}
+        # Distinct source colors seen, before quantization
+        self.source_colors = set()
+
+    def key(self, color):
+        self.source_colors.add(tuple(color))
+        return pack_color(quantize_color(color, self.quantization))
+
+    def create_material(self, key):
+        color = unpack_color(key)
+        material = bpy.data.materials.new(str(color))
+        # convert from rgb to float
+        material.diffuse_color = tuple(c / 255 for c in color) + (1.0,)
+        # Make sure material at first is not metallic
+        material.specular_color = (0, 0, 0)
+        self.materials[key] = material
+        return material
+
+    # Creates the materials of every unique color in one go
+    def build(self, colors):
+        keys = {self.key(color) for color in colors if color is not None}
+        for key in sorted(keys):
+            if key not in self.materials:
+                self.create_material(key)
+
+    def get(self, color):
+        key = self.key(color)
+        self.usage[key] = self.usage.get(key, 0) + 1
+        material = self.materials.get(key)
+        if material is None:
+            material = self.create_material(key)
+        return material
+
+    def __len__(self):
+        return len(self.materials)
+
+    def report(self):
+        print("Material palette:", len(self.materials), "materials for", sum(self.usage.values()),
+              "colored entities,", len(self.source_colors), "source colors")
+        if self.quantization > 1:
+            print(" quantization step", self.quantization, "merged",
+                  len(self.source_colors) - len(self.materials), "colors")
@@ -21,10 +21,24 @@
 
 
 import bpy
-from hashlib import md5
+import numpy
 from mathutils import Quaternion, Vector, Euler, Matrix
 from metaverse_tools.hifi_world import primitives as prims
+from metaverse_tools.hifi_world.palette import MaterialPalette, get_entity_color
 from metaverse_tools.utils.helpers.extra_math import PIVOT_VECTOR, swap_nyz, swap_nzy, parse_dict_quaternion, parse_dict_vector, swap_yz, swap_pivot, quat_swap_nyz
+from metaverse_tools.utils.helpers.axis_conversion import hifi_to_blender_positions, hifi_to_blender_rotations
+from metaverse_tools.utils.helpers.transforms import TransformCache
+from metaverse_tools.utils.helpers.octree import Octree, get_box_bounds
+
+
+def find_layer_collection(layer_collection, collection):
+    if layer_collection.collection == collection:
+        return layer_collection
+    for child in layer_collection.children:
+        found = find_layer_collection(child, collection)
+        if found is not None:
+            return found
+    return None
 
 
 class HifiScene:
@@ -33,7 +47,16 @@ class HifiScene:
                  join_children=True,
                  merge_distance=0.01,
                  delete_interior_faces=True,
-                 use_boolean_operation="NONE"):
+                 use_boolean_operation="NONE",
+                 color_quantization=0,
+                 name="Hifi Scene",
+                 use_spatial_cells=False,
+                 cell_capacity=64,
+                 merge_cells=False,
+                 region_mode="NONE",
+                 region_center=(0.0, 0.0, 0.0),
+                 region_size=(100.0, 100.0, 100.0),
+                 region_radius=50.0):
         json_entities = json['Entities']
 
         self.uv_sphere = uv_sphere
@@ -42,20 +65,38 @@ class HifiScene:
         self.delete_interior_faces = delete_interior_faces
         self.use_boolean_operation = use_boolean_operation
 
+        self.name = name
+        self.use_spatial_cells = use_spatial_cells
+        self.cell_capacity = cell_capacity
+        self.merge_cells = merge_cells
+        # 'NONE', 'BOX' or 'SPHERE', in Blender coordinates
+        self.region_mode = region_mode
+        self.region_center = Vector(region_center)
+        self.region_size = Vector(region_size)
+        self.region_radius = region_radius
+
         self.entities = []
-        self.materials = []
         self.entity_ids = []
-        self.material_index = []
-        self.materials = []
+        self.palette = MaterialPalette(color_quantization)
         self.parent_entities = []
 
         self.root = []
+        self.transforms = TransformCache(lambda entity: entity.parent,
+                                         lambda entity: (entity.position, entity.rotation),
+                                         lambda entity: entity.children)
 
         # Build Indices for entity ids, and build the Objects
+        # Convert every position and rotation to Blender coordinates in one go
+        positions = hifi_to_blender_positions([parse_dict_vector(entity, 'position') for entity in json_entities])
+        rotations = hifi_to_blender_rotations([parse_dict_quaternion(entity, 'rotation') for entity in json_entities])
+
+        print(' building materials ')
+        self.palette.build([get_entity_color(entity) for entity in json_entities])
+
         print(' building indices ')
         for idx, entity in enumerate(json_entities):
             self.entity_ids.append(entity['id'])
-            hifi_entity = HifiObject(entity, self)
+            hifi_entity = HifiObject(entity, self, Vector(positions[idx]), Quaternion(rotations[idx]))
             self.entities.append(hifi_entity)
 
         # Build Trees by checking if parents exist in parent tree
@@ -63,6 +104,9 @@ class HifiScene:
         for entity in self.entities:
             self.append_parent(entity)
 
+        # World transforms for every tree, once, from the roots down
+        self.transforms.resolve_tree([entity for entity in self.entities if entity.is_root()])
+
         self.build_scene()
 
     # links Parents and children together. to build a tree
@@ -90,48 +134,153 @@ class HifiScene:
             return found_entity
 
     def build_scene(self):
-        # Store context to set cursor
-        current_context = bpy.context.area.type
-        bpy.context.area.type = 'VIEW_3D'
+        # Store context to set cursor, there is no area when run in the background
+        area = bpy.context.area
+        if area is not None:
+            current_context = area.type
+            area.type = 'VIEW_3D'
         # set context to 3D View and set Cursor
         bpy.context.scene.cursor.location[0] = 0.0
         bpy.context.scene.cursor.location[1] = 0.0
         bpy.context.scene.cursor.location[2] = 0.0
         # return context back to earlier, and build scene.
-        bpy.context.area.type = current_context
+        if area is not None:
+            area.type = current_context
+        roots = [entity for entity in self.entities if entity.is_root()]
+        cells = None
+        if self.region_mode != 'NONE' or self.use_spatial_cells:
+            octree = Octree(*self.get_root_bounds(roots), max_items=self.cell_capacity)
+            selected = self.query_region(octree)
+            if selected is not None:
+                print("Region of interest: importing", len(selected), "of", len(roots), "root entities")
+                selected = set(selected.tolist())
+            if self.use_spatial_cells:
+                cells = [(leaf.path, [roots[index] for index in leaf.indices if selected is None or index in selected])
+                         for leaf in octree.leaves()]
+                cells = [(path, cell_roots) for path, cell_roots in cells if cell_roots]
+            if selected is not None:
+                roots = [root for index, root in enumerate(roots) if index in selected]
+
         print("Building Scene out of " + str(len(self.entities)) + ' Objects and '
-              + str(len(self.material_index)) + ' materials')
+              + str(len(self.palette)) + ' materials')
 
-        for entity in self.entities:
-            if entity.is_root():
+        if cells is None:
+            for entity in roots:
                 entity.build()
+        else:
+            self.build_cells(cells)
 
-    def append_material(self, color):
-        # Just Hash result
-
-        material_hash = md5(
-            str(color[0] + color[1] << 2 + color[2] << 4).encode('utf-8')).hexdigest()
-
-        if material_hash not in self.material_index:
-            index = len(self.material_index)
-            self.material_index.append(material_hash)
+        self.palette.report()
 
-            mat = bpy.data.materials.new(str(color))
-            # convert from rgb to float
-            mat.diffuse_color = tuple(c/255 for c in color)
+    # World bounds of every entity as it is built by the primitives, a unit box moved by the pivot then scaled
+    def get_entity_bounds(self):
+        centers = []
+        rotations = []
+        for entity in self.entities:
+            rotation = entity.relative_rotation()
+            offset = Vector([pivot * dimension for pivot, dimension in zip(entity.pivot, entity.dimensions)])
+            centers.append(tuple(entity.relative_position() + rotation @ offset))
+            rotations.append(tuple(rotation))
+        return get_box_bounds(centers, rotations, [entity.dimensions for entity in self.entities])
+
+    # Bounds of each root and all of its children, a tree is always imported and placed as a whole
+    def get_root_bounds(self, roots):
+        entity_min, entity_max = self.get_entity_bounds()
+        root_indices = {root: index for index, root in enumerate(roots)}
+        owners = []
+        for entity in self.entities:
+            root = entity
+            while root.parent is not None:
+                root = root.parent
+            owners.append(root_indices[root])
+
+        bounds_min = numpy.full((len(roots), 3), numpy.inf)
+        bounds_max = numpy.full((len(roots), 3), -numpy.inf)
+        numpy.minimum.at(bounds_min, owners, entity_min)
+        numpy.maximum.at(bounds_max, owners, entity_max)
+        return bounds_min, bounds_max
+
+    def query_region(self, octree):
+        if self.region_mode == 'BOX':
+            half_size = self.region_size / 2
+            return octree.query_box(self.region_center - half_size, self.region_center + half_size)
+        if self.region_mode == 'SPHERE':
+            return octree.query_sphere(self.region_center, self.region_radius)
+        return None
+
+    # Each cell gets its own collection under one for the scene, entities are built straight into it
+    def build_cells(self, cells):
+        view_layer = bpy.context.view_layer
+        active_layer_collection = view_layer.active_layer_collection
+
+        scene_collection = bpy.data.collections.new(self.name)
+        bpy.context.scene.collection.children.link(scene_collection)
+        merged = 0
+        merged_meshes = 0
+        try:
+            for path, cell_roots in cells:
+                collection = bpy.data.collections.new(self.name + " " + path)
+                scene_collection.children.link(collection)
+                view_layer.active_layer_collection = find_layer_collection(view_layer.layer_collection, collection)
+
+                for entity in cell_roots:
+                    entity.build()
+
+                if self.merge_cells:
+                    for material, group in self.get_merge_groups(cell_roots):
+                        merge_entities(group, collection.name + " " + (material.name if material is not None else "Mesh"))
+                        merged += len(group)
+                        merged_meshes += 1
+        finally:
+            view_layer.active_layer_collection = active_layer_collection
+
+        print("Spatial cells:", len(cells), "cells of up to", self.cell_capacity, "root entities")
+        if self.merge_cells:
+            print(" merged", merged, "static entities into", merged_meshes, "meshes")
+
+    # Objects left after the build, children are joined or unioned into their parents unless both are off
+    def get_built_entities(self, root):
+        if self.join_children or self.use_boolean_operation != "NONE":
+            return [root]
+        built = []
+        stack = [root]
+        while stack:
+            entity = stack.pop()
+            built.append(entity)
+            stack.extend(entity.children)
+        return built
+
+    # Static single material meshes of a cell grouped by material, only groups worth joining
+    def get_merge_groups(self, cell_roots):
+        groups = {}
+        for root in cell_roots:
+            for entity in self.get_built_entities(root):
+                obj = entity.blender_object
+                if entity.dynamic or obj is None or obj.type != "MESH" or len(obj.data.materials) > 1:
+                    continue
+                material = obj.data.materials[0] if len(obj.data.materials) == 1 else None
+                groups.setdefault(material, []).append(entity)
+        return [(material, group) for material, group in groups.items() if len(group) > 1]
 
-            # Make sure material at first is not metallic
-            mat.specular_color = (0, 0, 0)
+    def append_material(self, color):
+        return self.palette.get(color)
 
-            self.materials.append(mat)
-            return mat
 
-        return self.materials[self.material_index.index(material_hash)]
+def merge_entities(entities, name):
+    bpy.ops.object.select_all(action='DESELECT')
+    for entity in entities:
+        entity.select()
+    merged = entities[0].blender_object
+    bpy.context.view_layer.objects.active = merged
+    bpy.ops.object.join()
+    merged.name = name
+    for entity in entities:
+        entity.blender_object = merged
 
 
 class HifiObject:
 
-    def __init__(self, entity, scene):
+    def __init__(self, entity, scene, position=None, rotation=None):
 
         self.id = entity['id']
         self.children = []
@@ -146,7 +295,7 @@ class HifiObject:
             self.name = entity['type'] + '-' + self.id
 
         self.position_original = Vector(parse_dict_vector(entity, 'position'))
-        self.position = swap_nyz(parse_dict_vector(entity, 'position'))
+        self.position = position if position is not None else swap_nyz(parse_dict_vector(entity, 'position'))
 
         self.pivot = swap_pivot(parse_dict_vector(
             entity, 'registrationPoint', PIVOT_VECTOR))
@@ -154,7 +303,7 @@ class HifiObject:
 
         self.rotation_original = Quaternion(
             parse_dict_quaternion(entity, 'rotation'))
-        self.rotation = quat_swap_nyz(
+        self.rotation = rotation if rotation is not None else quat_swap_nyz(
             parse_dict_quaternion(entity, 'rotation'))
 
         self.parent = None
@@ -170,11 +319,11 @@ class HifiObject:
         if 'shape' in entity:
             self.shape = entity['shape']
 
-        if self.type != 'Light' and self.type != 'Zone' and self.type != 'Particle':
-            if 'color' in entity:
-                color = entity['color']
-                self.material = scene.append_material(
-                    (color['red'], color['green'], color['blue']))
+        self.dynamic = entity.get('dynamic', False)
+
+        color = get_entity_color(entity)
+        if color is not None:
+            self.material = scene.append_material(color)
         else:
             self.material = None
 
@@ -290,25 +439,29 @@ class HifiObject:
 
     # Get the absolute position by getting the relative position of the parent, and adding my own to it.
     # note that then position is relative to the parents rotation too, so make sure to eliminate that as well.
+    # Both are resolved top-down through the scene's transform cache.
     def relative_position(self):
-        if self.parent is not None:
-            return self.parent.relative_rotation() * self.position + self.parent.relative_position()
-        else:
-            return self.position
+        return self.scene.transforms.position(self)
 
     # Rotation is based on the rotaiton of the parent and self.
     def relative_rotation(self):
-        if self.parent is not None:
-            rotation = self.parent.relative_rotation()
-            return rotation * self.rotation
-        else:
-            return self.rotation
+        return self.scene.transforms.rotation(self)
+
+    def set_position(self, position):
+        self.position = Vector(position)
+        self.scene.transforms.invalidate(self)
+
+    def set_rotation(self, rotation):
+        self.rotation = Quaternion(rotation)
+        self.scene.transforms.invalidate(self)
 
     def set_parent(self, parent):
         if type(parent) is HifiObject:
             self.parent = parent
+            self.scene.transforms.invalidate(self)
         else:
             print('Warning: Type parent was not HifiObject')
 
     def add_child(self, child):
         self.children.append(child)
+        self.scene.transforms.invalidate(child)
@@ -13,6 +13,23 @@ class ACTION_PT_MVT_TOOLSET(bpy.types.Panel):
         layout = self.layout
         layout.operator(ACTION_OT_MVT_Split_Mirrored.bl_idname)
 
+        active = context.active_object
+        if active is None or active.animation_data is None or active.animation_data.action is None:
+            return None
+
+        statistics = get_action_statistics(active.animation_data.action)
+        box = layout.box()
+        box.label(text=statistics.name)
+        if statistics.frame_range is None:
+            box.label(text="No keyframes")
+            return None
+
+        box.label(text="Frames: {:g} - {:g}".format(*statistics.frame_range))
+        box.label(text="Keyframes: {} on {} channels".format(statistics.keyframe_count(), len(statistics.channel_keyframes)))
+        if active.type == "ARMATURE":
+            box.label(text="Bones: {} ({:.0%} of armature)".format(
+                len(statistics.bone_keyframes), statistics.bone_coverage(active)))
+
         return None
 
 
@@ -1,6 +1,7 @@
 
 import bpy
-from metaverse_tools.utils.helpers import mesh
+from bpy.props import BoolProperty
+from metaverse_tools.utils.helpers import mesh, material_merge
 
 class MESH_PT_MVT_TOOLSET(bpy.types.Panel):
     """ Panel for Mesh related tools """
@@ -22,6 +23,8 @@ class MESH_PT_MVT_TOOLSET(bpy.types.Panel):
             MESH_OT_MVT_TOOL_Clean_Unused_Vertex_Groups.bl_idname, icon='NORMALS_VERTEX',  emboss=False)
         layout.operator(
             OBJECT_OT_MVT_TOOL_Boolean_Unite.bl_idname, icon='SELECT_EXTEND',  emboss=False)
+        layout.operator(
+            MESH_OT_MVT_TOOL_Merge_Materials.bl_idname, icon='MATERIAL',  emboss=False)
         return None
 
 # boolean_union_objects
@@ -126,6 +129,27 @@ class OBJECT_OT_MVT_TOOL_Boolean_Unite(bpy.types.Operator):
         return {"FINISHED"}
 
 
+class MESH_OT_MVT_TOOL_Merge_Materials(bpy.types.Operator):
+    """ Merge material slots with the same shader settings, optionally atlasing materials that only differ by their base color texture """
+    bl_idname = "metaverse_toolset.merge_material_slots"
+    bl_label = "Merge Material Slots"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    bl_space_type = "VIEW_3D"
+
+    use_atlas: BoolProperty(default=True, name="Texture Atlas",
+                            description="Bake base color textures of otherwise identical materials into a shared atlas")
+
+    @classmethod
+    def poll(self, context):
+        return context.mode == "OBJECT" and any(obj.type == "MESH" for obj in context.selected_objects)
+
+    def execute(self, context):
+        report = material_merge.merge_materials(context.selected_objects, self.use_atlas)
+        self.report({'INFO'}, "Draw calls {} -> {}".format(report["before"]["draw_calls"], report["after"]["draw_calls"]))
+        return {"FINISHED"}
+
+
 
 classes = (
     MESH_PT_MVT_TOOLSET,
@@ -133,7 +157,8 @@ classes = (
     MESH_OT_MVT_TOOL_Message_Processing,
     MESH_OT_MVT_TOOL_Merge_Modifiers_Shapekey,
     MESH_OT_MVT_TOOL_Clean_Unused_Vertex_Groups,
-    OBJECT_OT_MVT_TOOL_Boolean_Unite
+    OBJECT_OT_MVT_TOOL_Boolean_Unite,
+    MESH_OT_MVT_TOOL_Merge_Materials
 )
 
 module_register, module_unregister = bpy.utils.register_classes_factory(
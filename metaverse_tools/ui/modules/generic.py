@@ -1,4 +1,7 @@
 import bpy
+from bpy.props import StringProperty
+from bpy_extras.io_utils import ExportHelper
+from metaverse_tools.utils import budget
 
 category = "MVT: Generic Tools"
 
@@ -44,10 +47,78 @@ class AVATAR_OT_MVT_TOOLSET_Convert_Custom_To(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class AVATAR_PT_MVT_TOOLSET_Budget(bpy.types.Panel):
+    """ Panel showing the avatar performance budget per platform """
+    bl_label = "Avatar Budget"
+    bl_icon = "INFO"
+
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+    bl_category = category
+
+    @classmethod
+    def poll(self, context):
+        return context.mode == "OBJECT"
+
+    def draw(self, context):
+        layout = self.layout
+        row = layout.row()
+        row.operator(AVATAR_OT_MVT_TOOLSET_Analyze_Budget.bl_idname, icon="VIEWZOOM")
+        row.operator(AVATAR_OT_MVT_TOOLSET_Write_Budget_Report.bl_idname, icon="EXPORT", text="")
+
+        if len(budget.last_reports) == 0:
+            return None
+
+        report = list(budget.last_reports.values())[-1]
+        layout.label(text="Avatar: " + report["avatar"])
+        for platform, result in report["platforms"].items():
+            box = layout.box()
+            box.label(text=platform + ": " + result["rating"], icon=budget_icons[result["rating"]])
+            for metric, entry in result["metrics"].items():
+                row = box.row()
+                row.label(text=metric.replace("_", " ").capitalize(), icon=budget_icons[entry["rating"]])
+                row.label(text=budget.format_metric(metric, entry["value"]) + " / " + budget.format_metric(metric, entry["limit"]))
+
+        return None
+
+
+budget_icons = {"ok": "CHECKMARK", "warning": "ERROR", "over": "CANCEL"}
+
+
+class AVATAR_OT_MVT_TOOLSET_Analyze_Budget(bpy.types.Operator):
+    """ Count bones, draw calls, triangles, blend shapes, texture memory and skinned vertices of the avatar """
+    bl_idname = "metaverse_toolset.analyze_avatar_budget"
+    bl_label = "Analyze Avatar"
+
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        budget.last_reports.clear()
+        report = budget.analyze_avatar(list(context.view_layer.objects))
+        budget.print_report(report)
+        return {'FINISHED'}
+
+
+class AVATAR_OT_MVT_TOOLSET_Write_Budget_Report(bpy.types.Operator, ExportHelper):
+    """ Write the avatar budget report as JSON """
+    bl_idname = "metaverse_toolset.write_avatar_budget"
+    bl_label = "Write Budget Report"
+
+    filename_ext = ".json"
+    filter_glob: StringProperty(default="*.json", options={'HIDDEN'})
+
+    def execute(self, context):
+        report = budget.analyze_avatar(list(context.view_layer.objects))
+        budget.write_report(self.filepath, report)
+        return {'FINISHED'}
+
 
 classes = (
     AVATAR_PT_MVT_metaverse_toolset_generic,
     AVATAR_OT_MVT_TOOLSET_Convert_Custom_To,
+    AVATAR_PT_MVT_TOOLSET_Budget,
+    AVATAR_OT_MVT_TOOLSET_Analyze_Budget,
+    AVATAR_OT_MVT_TOOLSET_Write_Budget_Report,
 )
 
 
@@ -1,7 +1,9 @@
 import math
 import bpy
+import numpy
 from typing import Dict
 from metaverse_tools.utils.bones.bones_builder import mirrorable_name_re, get_bone_side_and_mirrored, BoneMirrorableInfo
+from metaverse_tools.utils.animation.statistics import get_action_statistics, get_all_action_statistics
 
 from mathutils import Matrix, Vector, Euler, Quaternion
 short_sides = ["L", "R"]
@@ -34,21 +36,37 @@ class ObjectInfo:
         entity.scale = self.scale
 
 
+    # Row in get_channel_layout order: location, rotation (4 quaternion / 3 euler), scale
+    def to_row(self):
+        rotation = self.rotation_quaternion if self.rotation_quaternion is not None else self.rotation_euler
+        return list(self.location) + list(rotation) + list(self.scale)
+
+    @staticmethod
+    def from_row(row, rotation_mode):
+        rotation_end = 7 if "QUATERNION" in rotation_mode else 6
+        return ObjectInfo(row[0:3], row[3:rotation_end], rotation_mode, row[rotation_end:rotation_end + 3])
+
     def half(self):
-        half_rotation = None
-        if(self.rotation_mode != "QUATERNION"):
-            half_rotation = self.rotation_quaternion.slerp(Quaternion(), 0.5)
-        else:
-            half_rotation = Euler((self.rotation_euler.x / 2, self.rotation_euler.y / 2, self.rotation_euler.z / 2), self.rotation_mode)
-       
-        return ObjectInfo(self.location / 2, half_rotation, self.rotation_mode, self.scale)
+        row = half_samples(numpy.array([self.to_row()]), self.rotation_mode)[0]
+        return ObjectInfo.from_row(row, self.rotation_mode)
 
 
 class BoneData:
-    def __init__(self, name, frames):
+    # Keyframes of a bone: sorted frames, a frame -> row map and a frames x channels array in get_channel_layout order.
+    __slots__ = ("name", "frames", "rotation_mode", "samples", "rows", "mirrorable")
+
+    def __init__(self, name, frames, rotation_mode="QUATERNION", samples=None):
         self.name = name
-        self.frames = frames
-        self.info: [ObjectInfo] = [None] * len(frames)
+        self.frames = sorted(frames)
+        self.rotation_mode = rotation_mode
+        self.rows = dict((frame, row) for row, frame in enumerate(self.frames))
+
+        if samples is None:
+            # Rest pose until set_object_info fills the rows
+            rest = ObjectInfo((0, 0, 0), (1, 0, 0, 0) if "QUATERNION" in rotation_mode else (0, 0, 0),
+                              rotation_mode, (1, 1, 1))
+            samples = numpy.tile(rest.to_row(), (len(self.frames), 1))
+        self.samples = numpy.asarray(samples, dtype=numpy.float64)
         self.mirrorable: BoneMirrorableInfo = get_bone_side_and_mirrored(name)
 
     def get_frames(self):
@@ -58,26 +76,23 @@ class BoneData:
         return len(self.frames)
 
     def get_object_info(self, frame):
-        if self.frames.get(frame) == None:
+        row = self.rows.get(frame)
+        if row is None:
             return None
 
-        ind = self.frames.index(frame)
-
-        return self.info[ind]
+        return ObjectInfo.from_row(self.samples[row], self.rotation_mode)
 
     def set_object_info(self, frame, info: ObjectInfo):
-        ind = self.frames.index(frame)
-        self.info[ind] = info
+        self.samples[self.rows[frame]] = info.to_row()
 
     def get_info(self):
-        return self.info
+        return [ObjectInfo.from_row(row, self.rotation_mode) for row in self.samples]
 
     def frame_info_tuple(self) -> [(int, ObjectInfo)]:
-        info_frame = []
-        for frame in self.frames:
-            ind = self.frames.index(frame)
-            info_frame.append((frame, self.info[ind]))
-        return info_frame
+        return list(zip(self.frames, self.get_info()))
+
+    def half(self):
+        return BoneData(self.name, self.frames, self.rotation_mode, half_samples(self.samples, self.rotation_mode))
 
 
 def return_sides(name):
@@ -89,43 +104,64 @@ def return_sides(name):
     return None
 
 def get_max_frames_in_action(armature, action):
-    active_bones_actions = action.groups
-    max_frame = 0
-    armature.animation_data.action = action
-    for bone in active_bones_actions:
-        for channel in bone.channels:
-            for keyframe in channel.sampled_points.data.keyframe_points:
-                x, y = keyframe.co
-                if x > max_frame:
-                    max_frame = x
-    
-    return max_frame
-    
+    return get_action_statistics(action).max_frame()
+
+
+# Channel layout of the sampled frames x channels arrays, rotation is 4 wide for quaternions and 3 for euler.
+def get_channel_layout(rotation_mode):
+    rotation = ("rotation_quaternion", 4) if "QUATERNION" in rotation_mode else ("rotation_euler", 3)
+    return (("location", 3), rotation, ("scale", 3))
+
+
+def get_keyframe_frames(channels):
+    frames = set()
+    for channel in channels:
+        count = len(channel.keyframe_points)
+        if count == 0:
+            continue
+        coordinates = numpy.empty(count * 2, dtype=numpy.float32)
+        channel.keyframe_points.foreach_get("co", coordinates)
+        frames.update(int(frame) for frame in numpy.ceil(coordinates[0::2]))
+    return sorted(frames)
+
+
+# Evaluates the bone's F-curves at each frame into a frames x channels array.
+# Channels without an F-curve keep the pose bone's current value, like reading the pose back after frame_set did.
+def sample_bone_channels(pose_bone, channels, frames):
+    curves = {}
+    for channel in channels:
+        curves[(channel.data_path.rsplit(".", 1)[-1], channel.array_index)] = channel
+
+    layout = get_channel_layout(pose_bone.rotation_mode)
+    samples = numpy.empty((len(frames), sum(width for _, width in layout)), dtype=numpy.float64)
+    column = 0
+    for attribute, width in layout:
+        current = getattr(pose_bone, attribute)
+        for index in range(width):
+            curve = curves.get((attribute, index))
+            if curve is None:
+                samples[:, column] = current[index]
+            else:
+                samples[:, column] = [curve.evaluate(frame) for frame in frames]
+            column += 1
+
+    return samples
+
 
 def get_bone_frames_in_action(armature, action):
     active_bones_actions = action.groups
     action_bones_dict: Dict[str, BoneData] = dict()
 
-    armature.animation_data.action = action
     for bone in active_bones_actions:
         name = bone.name
-        keyframes = []
-        for channel in bone.channels:
-            for keyframe in channel.sampled_points.data.keyframe_points:
-                x, y = keyframe.co
-                if x not in keyframes:
-                    keyframes.append((math.ceil(x)))
-        action_bones_dict[name] = BoneData(name, keyframes)
-        for frame in keyframes:
-            bpy.context.scene.frame_set(frame)
-            pose_bone = armature.pose.bones[name]
-            if "QUATERNION" in pose_bone.rotation_mode:
-                info = ObjectInfo(pose_bone.location, pose_bone.rotation_quaternion, pose_bone.rotation_mode, pose_bone.scale)
-            else:
-                info = ObjectInfo(pose_bone.location, pose_bone.rotation_euler, pose_bone.rotation_mode, pose_bone.scale)
-            
-            action_bones_dict[name].set_object_info(frame, info)
-            
+        pose_bone = armature.pose.bones.get(name)
+        if pose_bone is None:
+            continue
+
+        keyframes = get_keyframe_frames(bone.channels)
+        samples = sample_bone_channels(pose_bone, bone.channels, keyframes)
+        action_bones_dict[name] = BoneData(name, keyframes, pose_bone.rotation_mode, samples)
+
     pose_bones = []
     # Convert Dict into a List
     for index in action_bones_dict:
@@ -146,6 +182,47 @@ def create_keyframe(pose_bone, frame, info):
     pose_bone.keyframe_insert('scale', group=pose_bone.name, frame=frame)
 
 
+# Half strength of sampled channels: location halved, rotation halfway to identity, scale kept.
+def half_samples(samples, rotation_mode):
+    halved = numpy.array(samples, dtype=numpy.float64)
+    halved[:, 0:3] *= 0.5
+    if "QUATERNION" in rotation_mode:
+        rotation = halved[:, 3:7]
+        # Same as slerp towards the identity at 0.5, taking the shortest path.
+        rotation[rotation[:, 0] < 0] *= -1
+        rotation[:, 0] += 1
+        rotation /= numpy.linalg.norm(rotation, axis=1)[:, None]
+    else:
+        halved[:, 3:6] *= 0.5
+    return halved
+
+
+# Writes frames x channels samples to the bone's F-curves: each curve is created once,
+# all its points are added and filled in one go, then handles are recalculated with a single update.
+def write_bone_keyframes(action, pose_bone, frames, samples):
+    count = len(frames)
+    if count == 0:
+        return
+
+    coordinates = numpy.empty(count * 2, dtype=numpy.float32)
+    coordinates[0::2] = frames
+    column = 0
+    for attribute, width in get_channel_layout(pose_bone.rotation_mode):
+        data_path = pose_bone.path_from_id(attribute)
+        for index in range(width):
+            fcurve = action.fcurves.find(data_path, index=index)
+            if fcurve is None:
+                fcurve = action.fcurves.new(data_path, index=index, action_group=pose_bone.name)
+            else:
+                fcurve.keyframe_points.clear()
+
+            coordinates[1::2] = samples[:, column]
+            fcurve.keyframe_points.add(count)
+            fcurve.keyframe_points.foreach_set("co", coordinates)
+            fcurve.update()
+            column += 1
+
+
 def split_bone_frames_into_mirrored_action(armature, action, half = False):
     
     bpy.context.scene.tool_settings.use_keyframe_insert_auto = False
@@ -181,18 +258,20 @@ def split_bone_frames_into_mirrored_action(armature, action, half = False):
 
             if bone.mirrorable != None:
                 if (check_side(side, 'R', 'Right', bone.mirrorable.side) or check_side(side, 'L', 'Left', bone.mirrorable.side)):
-                    for frame, info in bone.frame_info_tuple():
-                        create_keyframe(pose_bone, frame, info)
+                    write_bone_keyframes(new_action, pose_bone, bone.frames, bone.samples)
+            elif half:
+                half_bone = bone.half()
+                write_bone_keyframes(new_action, pose_bone, half_bone.frames, half_bone.samples)
             else:
-                for frame, info in bone.frame_info_tuple():
-                    if half:
-                        create_keyframe(pose_bone, frame, info.half())
-                    else:
-                        create_keyframe(pose_bone, frame, info)
-                    # TODO: If its not a mirrorable, perhaps half the amount the animation is moving stuff, since its split?
+                write_bone_keyframes(new_action, pose_bone, bone.frames, bone.samples)
  
 
 def split_all_actions(armature, actions):
-    for action in actions:
+    statistics = get_all_action_statistics(actions)
+    # Splitting adds actions, so work from a snapshot of the mirrorable ones that have keys
+    for action in [action for action in actions if return_sides(action.name) is not None]:
+        if statistics[action.name].frame_range is None:
+            print("No keyframes, skipping " + action.name)
+            continue
         split_bone_frames_into_mirrored_action(armature, action)
     
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Per action keyframe statistics, shared by the FaceRig export, mirrored splitting and the Dopesheet panel.
+# Results are cached per action. Added or removed channels and keyframes are caught by their counts on lookup,
+# moved keyframes by a depsgraph handler dropping the actions Blender reports as updated.
+
+import re
+import bpy
+import numpy
+from bpy.app.handlers import persistent
+
+pose_bone_path_re = re.compile(r'^pose\.bones\["(.+)"\]\.')
+
+
+class ActionStatistics:
+    __slots__ = ("name", "frame_range", "channel_keyframes", "bone_keyframes")
+
+    def __init__(self, name, frame_range, channel_keyframes, bone_keyframes):
+        self.name = name
+        # (first, last) keyframe, None when the action has no keyframes
+        self.frame_range = frame_range
+        # {(data_path, array_index): keyframe count}
+        self.channel_keyframes = channel_keyframes
+        # {pose bone name: keyframe count}
+        self.bone_keyframes = bone_keyframes
+
+    def keyframe_count(self):
+        return sum(self.channel_keyframes.values())
+
+    def max_frame(self):
+        return self.frame_range[1] if self.frame_range is not None else 0
+
+    def bone_coverage(self, armature):
+        bones = armature.data.bones
+        if len(bones) == 0:
+            return 0.0
+        return sum(1 for bone in bones if bone.name in self.bone_keyframes) / len(bones)
+
+    def __repr__(self):
+        return "ActionStatistics({}, range={}, channels={}, keyframes={}, bones={})".format(
+            self.name, self.frame_range, len(self.channel_keyframes), self.keyframe_count(), len(self.bone_keyframes))
+
+
+action_statistics_cache = {}
+
+
+def get_keyframe_coordinates(fcurve):
+    coordinates = numpy.empty(len(fcurve.keyframe_points) * 2, dtype=numpy.float32)
+    fcurve.keyframe_points.foreach_get("co", coordinates)
+    return coordinates
+
+
+# Channels and their keyframe counts, cheap enough to check on every panel redraw
+def get_action_fingerprint(action):
+    return tuple((fcurve.data_path, fcurve.array_index, len(fcurve.keyframe_points)) for fcurve in action.fcurves)
+
+
+# Keyframes moved or retimed in place keep the fingerprint, their action is reported as updated instead
+@persistent
+def invalidate_updated_actions(scene, depsgraph):
+    if not action_statistics_cache or not depsgraph.id_type_updated('ACTION'):
+        return
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Action):
+            action_statistics_cache.pop(update.id.original.as_pointer(), None)
+
+
+# Pointers of a previous file can be reused by the actions of the next one
+@persistent
+def clear_action_statistics(*args):
+    action_statistics_cache.clear()
+
+
+def action_statistics_register():
+    if invalidate_updated_actions not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(invalidate_updated_actions)
+    if clear_action_statistics not in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.append(clear_action_statistics)
+
+
+def action_statistics_unregister():
+    if invalidate_updated_actions in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(invalidate_updated_actions)
+    if clear_action_statistics in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(clear_action_statistics)
+    action_statistics_cache.clear()
+
+
+def compute_action_statistics(action):
+    channel_keyframes = {}
+    bone_keyframes = {}
+    frames = []
+    for fcurve in action.fcurves:
+        count = len(fcurve.keyframe_points)
+        channel_keyframes[(fcurve.data_path, fcurve.array_index)] = count
+        if count == 0:
+            continue
+
+        frames.append(get_keyframe_coordinates(fcurve)[0::2])
+
+        bone = pose_bone_path_re.match(fcurve.data_path)
+        if bone is not None:
+            name = bone.group(1)
+            bone_keyframes[name] = bone_keyframes.get(name, 0) + count
+
+    if frames:
+        frames = numpy.concatenate(frames)
+        frame_range = (float(frames.min()), float(frames.max()))
+    else:
+        frame_range = None
+
+    return ActionStatistics(action.name, frame_range, channel_keyframes, bone_keyframes)
+
+
+def get_action_statistics(action):
+    key = action.as_pointer()
+    fingerprint = get_action_fingerprint(action)
+    cached = action_statistics_cache.get(key)
+    if cached is not None and cached[0] == fingerprint and cached[1].name == action.name:
+        return cached[1]
+
+    statistics = compute_action_statistics(action)
+    action_statistics_cache[key] = (fingerprint, statistics)
+    return statistics
+
+
+# Statistics of every action (bpy.data.actions by default) in one pass, {action name: ActionStatistics}
+def get_all_action_statistics(actions=None):
+    if actions is None:
+        actions = bpy.data.actions
+
+    statistics = {}
+    live_keys = set()
+    for action in actions:
+        live_keys.add(action.as_pointer())
+        statistics[action.name] = get_action_statistics(action)
+
+    if actions is bpy.data.actions:
+        # Drop removed actions
+        for key in list(action_statistics_cache.keys()):
+            if key not in live_keys:
+                del action_statistics_cache[key]
+
+    return statistics
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Headless avatar conversion: runs the MMD / MakeHuman / Mixamo converter and the FST export over a folder of files.
+#
+#   blender -b --python-expr "from metaverse_tools.utils import batch; batch.main()" -- <source folder> <output folder> [--workers 4] [--type auto]
+#
+# The command above is the coordinator, it starts one "blender -b" worker per file (up to --workers at a time)
+# and writes one JSON line per file to <output folder>/batch_results.jsonl, as well as to stdout.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import addon_utils
+import bpy
+
+import metaverse_tools
+from metaverse_tools.files.fst import writer as fst_writer
+from metaverse_tools.utils.bones import bones_builder, makehuman, mixamo, mmd
+
+SOURCE_EXTENSIONS = (".blend", ".pmx")
+AVATAR_TYPES = ("auto", "mmd", "makehuman", "mixamo")
+RESULTS_FILENAME = "batch_results.jsonl"
+RESULT_PREFIX = "MVT_BATCH_RESULT "
+WORKER_EXPRESSION = "from metaverse_tools.utils import batch; batch.main()"
+
+makehuman_marker_bones = ("orbicularis03.L", "spine05", "clavicle.L")
+
+
+class BatchExportSettings:
+    # Stand-in for the FST export operator properties used by fst_writer.fst_export
+    def __init__(self, filepath, name, embed=False, script="", scale=1):
+        self.filepath = filepath
+        self.name = name
+        self.embed = embed
+        self.script = script
+        self.scale = scale
+        self.flow = False
+        self.bake = False
+
+
+def find_sources(source_directory):
+    sources = []
+    for filename in sorted(os.listdir(source_directory)):
+        if filename.lower().endswith(SOURCE_EXTENSIONS):
+            sources.append(os.path.join(source_directory, filename))
+    return sources
+
+
+def detect_avatar_type(objects):
+    for armature in bones_builder.find_armatures(objects):
+        bone_names = [bone.name for bone in armature.data.bones]
+        if any(name.startswith("mixamo") for name in bone_names):
+            return "mixamo"
+        if any(name in bone_names for name in makehuman_marker_bones):
+            return "makehuman"
+        if any(not name.isascii() for name in bone_names) or (armature.parent is not None and "mmd_type" in armature.parent):
+            return "mmd"
+    return None
+
+
+def enable_addon(name):
+    if bpy.context.preferences.addons.get(name) is None:
+        addon_utils.enable(name, default_set=False)
+    return bpy.context.preferences.addons.get(name) is not None
+
+
+def open_source(source, working_file):
+    if source.lower().endswith(".pmx"):
+        if not enable_addon("mmd_tools"):
+            raise RuntimeError("mmd_tools add-on is required to import .pmx files")
+        bpy.ops.wm.read_homefile(use_empty=True)
+        bpy.ops.mmd_tools.import_model(filepath=source)
+    else:
+        bpy.ops.wm.open_mainfile(filepath=source)
+
+    # Converters write textures next to the .blend, so work on a copy in the output folder.
+    bpy.ops.wm.save_as_mainfile(filepath=working_file)
+
+
+def convert_avatar(avatar_type):
+    if avatar_type == "mmd":
+        mmd.convert_mmd_avatar_hifi()
+    elif avatar_type == "makehuman":
+        makehuman.convert_makehuman_avatar_hifi()
+        bones_builder.retarget_armature({'apply': True}, bpy.context.view_layer.objects)
+    elif avatar_type == "mixamo":
+        mixamo.convert_mixamo_avatar_hifi()
+    else:
+        raise RuntimeError("Could not detect avatar type")
+
+
+# Runs inside a worker, converts one file and returns its result dictionary.
+def convert_file(source, output_directory, avatar_type="auto", embed=False):
+    name = os.path.splitext(os.path.basename(source))[0]
+    avatar_directory = os.path.join(output_directory, name)
+    result = {"file": source, "name": name, "type": avatar_type, "status": "failed", "timings": {}}
+    timings = result["timings"]
+    stage = "open"
+    start = time.perf_counter()
+    try:
+        os.makedirs(avatar_directory, exist_ok=True)
+        stage_start = time.perf_counter()
+        open_source(source, os.path.join(avatar_directory, name + ".blend"))
+        timings["open"] = time.perf_counter() - stage_start
+
+        stage = "convert"
+        stage_start = time.perf_counter()
+        if avatar_type == "auto":
+            avatar_type = detect_avatar_type(bpy.context.view_layer.objects)
+            result["type"] = avatar_type
+        convert_avatar(avatar_type)
+        bpy.ops.wm.save_mainfile()
+        timings["convert"] = time.perf_counter() - stage_start
+
+        stage = "export"
+        stage_start = time.perf_counter()
+        objects = list(bpy.context.view_layer.objects)
+        armatures = bones_builder.find_armatures(objects)
+        if len(armatures) != 1:
+            raise RuntimeError("Expected 1 armature, found " + str(len(armatures)))
+
+        settings = BatchExportSettings(os.path.join(output_directory, name + ".fst"), name, embed)
+        if fst_writer.fst_export(settings, objects) != {"FINISHED"}:
+            raise RuntimeError("FST export did not finish")
+        timings["export"] = time.perf_counter() - stage_start
+
+        result["bones"] = len(armatures[0].data.bones)
+        result["fst"] = os.path.join(avatar_directory, name + ".fst")
+        result["status"] = "ok"
+    except Exception as e:
+        result["stage"] = stage
+        result["error"] = str(e)
+        result["traceback"] = traceback.format_exc()
+
+    timings["total"] = time.perf_counter() - start
+    return result
+
+
+def run_worker(blender, source, output_directory, avatar_type, embed, timeout):
+    command = [blender, "-b", "--python-expr", WORKER_EXPRESSION, "--",
+               "--worker", source, output_directory, "--type", avatar_type]
+    if embed:
+        command.append("--embed")
+
+    start = time.perf_counter()
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 universal_newlines=True, encoding="utf-8", errors="replace", timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"file": source, "status": "failed", "stage": "worker", "error": "Timed out after " + str(timeout) + "s",
+                "timings": {"total": time.perf_counter() - start}}
+
+    for line in reversed(process.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            result = json.loads(line[len(RESULT_PREFIX):])
+            result["timings"]["worker"] = time.perf_counter() - start
+            return result
+
+    return {"file": source, "status": "failed", "stage": "worker", "returncode": process.returncode,
+            "error": "\n".join(process.stderr.splitlines()[-20:]),
+            "timings": {"total": time.perf_counter() - start}}
+
+
+# Coordinator, fans the files out over worker processes and streams the results as JSON lines.
+def run_batch(source_directory, output_directory, workers=1, avatar_type="auto", embed=False, blender=None, timeout=None):
+    blender = blender or bpy.app.binary_path
+    sources = find_sources(source_directory)
+    os.makedirs(output_directory, exist_ok=True)
+    results_path = os.path.join(output_directory, RESULTS_FILENAME)
+
+    print("Converting", len(sources), "files with", workers, "workers")
+    start = time.perf_counter()
+    failed = 0
+    with open(results_path, "w", encoding="utf-8") as results_file, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_worker, blender, source, output_directory, avatar_type, embed, timeout)
+                   for source in sources]
+        for future in as_completed(futures):
+            result = future.result()
+            if result["status"] != "ok":
+                failed += 1
+            line = json.dumps(result)
+            results_file.write(line + "\n")
+            results_file.flush()
+            print(line, flush=True)
+
+    summary = {"summary": True, "files": len(sources), "failed": failed,
+               "seconds": time.perf_counter() - start, "results": results_path}
+    print(json.dumps(summary), flush=True)
+    return summary
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="metaverse_tools.utils.batch",
+                                     description="Convert a folder of MMD / MakeHuman / Mixamo avatars and export them as FST")
+    parser.add_argument("source", help="Folder with .blend or .pmx files, or a single file with --worker")
+    parser.add_argument("output", help="Output folder")
+    parser.add_argument("--type", default="auto", choices=AVATAR_TYPES, help="Converter to use, detected from the bones by default")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Blender processes to run at once")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds before a worker is stopped")
+    parser.add_argument("--embed", action="store_true", help="Embed textures to the exported FBX")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    arguments = parse_arguments(argv)
+
+    if arguments.worker:
+        enable_addon(metaverse_tools.__name__)
+        result = convert_file(arguments.source, arguments.output, arguments.type, arguments.embed)
+        print(RESULT_PREFIX + json.dumps(result), flush=True)
+        return result
+
+    summary = run_batch(arguments.source, arguments.output, arguments.workers,
+                        arguments.type, arguments.embed, timeout=arguments.timeout)
+    return summary
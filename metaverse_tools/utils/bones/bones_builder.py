@@ -21,12 +21,16 @@
 # Copyright 2019 Matti 'Menithal' Lahtinen
 import bpy
 import re
+from functools import lru_cache
 from bpy.types import EditBone
 
 from math import pi, acos
 from mathutils import Quaternion, Matrix, Vector, Euler
 from metaverse_tools.utils.helpers import mesh, extra_math, common
 from metaverse_tools.armature import SkeletonTypes
+from metaverse_tools.utils import log
+
+logger = log.get_logger("bones")
 
 
 corrected_axis = {
@@ -107,6 +111,12 @@ remove_end_character = re.compile("[_\-\.\s]$")
 remove_start_character = re.compile("^[_\-\.\s]")
 remove_numbers_re = re.compile("([a-zA-Z_\-\.\s]+)")
 
+# The bone name helpers below are pure string functions called per bone (and per bone per action),
+# so their results are memoized. Keys are the full argument list, i.e. (name, flags).
+BONE_NAME_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=BONE_NAME_CACHE_SIZE)
 def get_base_bone_name(bone_name: str):
     ## Remove number
     m = remove_numbers_re.search(bone_name)
@@ -139,25 +149,39 @@ def select_chain_children(bones, active: EditBone, ignore_non_matching = False):
 
 
 # Redo this to also make use of "Center Line" bones.
+# Immutable, as the same instance is handed out by the get_bone_side_and_mirrored cache.
 class BoneMirrorableInfo():
-    side = ""
-    mirror = ""
-    name = ""
-    mirror_name = ""
-    index = None
+    __slots__ = ("side", "mirror", "name", "mirror_name", "index")
 
     def __init__(self, side, mirror, name, mirror_name):
-        self.side = side
-        self.mirror = mirror
-        self.name = name
-
         m = number_end_re.search(parse_bone_name(name))
         if m is not None:
-            self.index = m.group(0)
+            index = m.group(0)
         else:
-            self.index = None
+            index = None
+
+        object.__setattr__(self, "side", side)
+        object.__setattr__(self, "mirror", mirror)
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "mirror_name", mirror_name)
+        object.__setattr__(self, "index", index)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("BoneMirrorableInfo is immutable")
+
+    def __delattr__(self, key):
+        raise AttributeError("BoneMirrorableInfo is immutable")
 
-        self.mirror_name = mirror_name
+    def __eq__(self, other):
+        if not isinstance(other, BoneMirrorableInfo):
+            return NotImplemented
+        return (self.side, self.mirror, self.name, self.mirror_name) == (other.side, other.mirror, other.name, other.mirror_name)
+
+    def __hash__(self):
+        return hash((self.side, self.mirror, self.name, self.mirror_name))
+
+    def __repr__(self):
+        return "BoneMirrorableInfo(" + self.dump() + ")"
 
     def dump(self):
         if self is not None:
@@ -192,9 +216,8 @@ def get_bone_angle(bone, axis):
 
 
 def combine_bones(selected_bones, active_bone, active_object, use_connect=True):
-    print("----------------------")
-    print("Combining Bones", len(selected_bones),
-          "-", active_bone.name, "-", active_object.name)
+    logger.debug("Combining Bones %d - %s - %s", len(selected_bones), active_bone.name, active_object.name)
+    counters = log.Counters()
     meshes = mesh.get_mesh_from(active_object.children)
     names_to_combine = []
     active_bone_name = active_bone.name
@@ -204,7 +227,8 @@ def combine_bones(selected_bones, active_bone, active_object, use_connect=True):
     bpy.ops.object.mode_set(mode="EDIT")
     for bone in selected_bones:
         if bone.name != active_bone.name:
-            print("Now Removing ", bone.name)
+            logger.debug("Now Removing %s", bone.name)
+            counters["bones removed"] += 1
             children = list(bone.children)
             names_to_combine.append(bone.name)
             active_object.data.edit_bones.remove(bone)
@@ -212,31 +236,28 @@ def combine_bones(selected_bones, active_bone, active_object, use_connect=True):
             for child in children:
                 child.use_connect = use_connect
 
-    print("Combining weights 2.", meshes)
     bpy.ops.object.mode_set(mode="OBJECT")
     for name in names_to_combine:
         if name != active_bone_name:
             for me in meshes:
-                print("check if mesh " + me.name + "exists")
-                print(me not in bpy.context.view_layer.objects.items() )
                 if bpy.context.view_layer.objects.get(me.name):
-                    print("Mesh: ", me.name, name)
                     bpy.context.view_layer.objects.active = me
 
                     vertex_group_b = me.vertex_groups.get(name)
                     vertex_group_a = me.vertex_groups.get(active_bone_name)
 
-                    print("A", vertex_group_a, name)
-                    print("B", vertex_group_b, active_bone_name)
-
                     if vertex_group_b is not None and vertex_group_a is not None:
+                        logger.debug("Mixing %s into %s on %s", name, active_bone_name, me.name)
                         mesh.mix_weights(active_bone_name, name)
                         me.vertex_groups.remove(me.vertex_groups.get(name))
+                        counters["vertex groups merged"] += 1
+                else:
+                    counters["meshes missing"] += 1
 
 
     bpy.context.view_layer.objects.active = active_object
     bpy.ops.object.mode_set(mode="EDIT")
-    print("Done")
+    counters.log_summary(logger, "Combined into " + active_bone_name)
 
 
 def bone_connection(selected_bones, mode=False):
@@ -323,10 +344,16 @@ def find_select_armature_and_children(selection):
             child.select_set(True)
 
 
+camel_word_re = re.compile('(.)([A-Z][a-z]+)')
+camel_lower_upper_re = re.compile('([a-z0-9])([A-Z])')
+camel_number_re = re.compile('(.)(\d+)')
+
+
+@lru_cache(maxsize=BONE_NAME_CACHE_SIZE)
 def camel_case_split(name):
-    s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', name)
-    s2 = re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1)
-    return re.sub('(.)(\d+)', r'\1_\2', s2)
+    s1 = camel_word_re.sub(r'\1_\2', name)
+    s2 = camel_lower_upper_re.sub(r'\1_\2', s1)
+    return camel_number_re.sub(r'\1_\2', s2)
 
 
 def clean_ends(obj):
@@ -411,6 +438,7 @@ def pin_common_bones(obj, fix_rolls=True):
     bpy.ops.object.mode_set(mode='OBJECT')
 
 
+@lru_cache(maxsize=BONE_NAME_CACHE_SIZE)
 def get_bone_side_and_mirrored(bone_name, split_underscores=True, split_camel_case=True) -> BoneMirrorableInfo : 
 
     cleaned_bones = None
@@ -460,6 +488,7 @@ def get_bone_side_and_mirrored(bone_name, split_underscores=True, split_camel_ca
     return None
 
 
+@lru_cache(maxsize=BONE_NAME_CACHE_SIZE)
 def parse_bone_name(bone_name, remove_clones=True):
 
     cleaned_bones = camel_case_split(
@@ -21,6 +21,7 @@
 # Copyright 2019 Matti 'Menithal' Lahtinen
 import bpy
 import re
+from functools import lru_cache
 from . import bones_builder
 from metaverse_tools.utils import bpyutil
 from metaverse_tools.utils.helpers import mesh, materials
@@ -57,29 +58,118 @@ def get_bones(self, context):
     return [(bone.name, bone.name, "") for bone in armature.data.bones]
 
 
-hips_names = ["hips", "pelvis"]
+# Known bone name tokens as a single alternation, matched against lowercased
+# parse_bone_name output. Alternatives are tried in order at each position, so the
+# longer / more specific ones go first ("forearm" before "arm", "spine2" before "spine").
+# Group names are the token classes used in bone_token_roles below.
+bone_token_re = re.compile("|".join([
+    r"(?P<hand_thumb>thumb(?:finger)?1)",
+    r"(?P<hand_index>index(?:finger)?1)",
+    r"(?P<hand_middle>middle(?:finger)?1)",
+    r"(?P<hand_ring>ring(?:finger)?1)",
+    r"(?P<hand_pinky>(?:pinky|little)(?:finger)?1)",
+    r"(?P<hand>hand|wrist)",
+    r"(?P<fore_arm>lowerarm|forearm|elbow)",
+    r"(?P<arm>upperarm|arm)",
+    r"(?P<shoulder>clavicle|shoulder)",
+    r"(?P<spine2>spine2|chest|breast)",
+    r"(?P<spine1>spine1)",
+    r"(?P<spine>spine)",
+    r"(?P<hips>hips|pelvis)",
+    r"(?P<neck>neck|collar)",
+    r"(?P<head>head)",
+    r"(?P<eye>eye)",
+    r"(?P<up_leg>upleg|thigh)",
+    r"(?P<knee>knee)",
+    r"(?P<calf>calf)",
+    r"(?P<any_leg>leg)",
+    r"(?P<foot>foot|ankle)",
+    r"(?P<toe>toe)"
+]))
+
+# token class -> (binder property, rank). Lower rank wins when several bones compete
+# for the same property, then the shorter cleaned name, then armature order.
+bone_token_roles = {
+    "hand_thumb": ("hand_thumb", 0),
+    "hand_index": ("hand_index", 0),
+    "hand_middle": ("hand_middle", 0),
+    "hand_ring": ("hand_ring", 0),
+    "hand_pinky": ("hand_pinky", 0),
+    "hand": ("hand", 0),
+    "fore_arm": ("fore_arm", 0),
+    "arm": ("arm", 0),
+    "shoulder": ("shoulder", 0),
+    "spine2": ("spine2", 0),
+    "spine1": ("spine1", 0),
+    "spine": ("spine", 0),
+    "hips": ("hips", 0),
+    "neck": ("neck", 0),
+    "head": ("head", 0),
+    "eye": ("eye", 0),
+    "up_leg": ("up_leg", 0),
+    "knee": ("leg", 0),
+    "calf": ("leg", 0),
+    "foot": ("foot", 0),
+    "toe": ("toe", 0)
+}
+
+finger_token_classes = {"hand_thumb", "hand_index", "hand_middle", "hand_ring", "hand_pinky"}
+
+# Token classes that shadow others found in the same name, e.g. a finger bone is never the hand.
+shadowed_token_classes = [
+    (finger_token_classes, "hand"),
+    ({"fore_arm"}, "arm"),
+    ({"up_leg", "knee", "calf"}, "any_leg")
+]
+
+
+@lru_cache(maxsize=16)
+def normalized_bone_name_table(bone_names):
+    # Built once per armature (keyed by its tuple of bone names): (cleaned name, token classes, bone name)
+    table = []
+    for bone_name in bone_names:
+        cleaned_name = bones_builder.parse_bone_name(bone_name).lower()
+        classes = {m.lastgroup for m in bone_token_re.finditer(cleaned_name)}
+
+        for shadowing, shadowed in shadowed_token_classes:
+            if shadowed in classes and not shadowing.isdisjoint(classes):
+                classes.discard(shadowed)
 
-neck_names = ["neck", "collar"]
+        table.append((cleaned_name, frozenset(classes), bone_name))
 
-shoulder_names = ["clavicle", "shoulder"]
+    return tuple(table)
 
-foot_name = "foot"
-toe_name = "toe"
 
-hand_name = ["hand", "wrist"]
+def classify_bones(bone_names):
+    table = normalized_bone_name_table(tuple(bone_names))
 
-hand_re = re.compile("(hand)|(wrist)$")
+    has_knee = False
+    has_chest = False
+    for cleaned_name, classes, bone_name in table:
+        has_knee = has_knee or "knee" in classes
+        has_chest = has_chest or "spine2" in classes
 
-hand_thumb_re = re.compile("thumb(finger)?1")
-hand_index_re = re.compile("index(finger)?1")
-hand_middle_re = re.compile("middle(finger)?1")
-hand_ring_re = re.compile("ring(finger)?1")
-hand_pinky_re = re.compile("(pinky)|(little)(finger)?1")
+    candidates = dict()
+
+    def add_candidate(role, rank, index, cleaned_name, bone_name):
+        candidate = (rank, len(cleaned_name), index, bone_name)
+        current = candidates.get(role)
+        if current is None or candidate < current:
+            candidates[role] = candidate
+
+    for index, (cleaned_name, classes, bone_name) in enumerate(table):
+        for token_class in classes:
+            if token_class == "spine1" and not has_chest:
+                # if there is no Spine2, chest or breast, its likely that spine1 is the chest. Convert it.
+                add_candidate("spine2", 1, index, cleaned_name, bone_name)
+            elif token_class == "any_leg":
+                # If Knee exists somewhere, it is most likely that Leg is the upper leg.
+                add_candidate("up_leg" if has_knee else "leg", 1, index, cleaned_name, bone_name)
+            else:
+                role, rank = bone_token_roles[token_class]
+                add_candidate(role, rank, index, cleaned_name, bone_name)
 
-spine_name = "spine"
-spine1_name = "spine1"
-head_name = "head"
-eye_name = "eye"
+    return {role: candidate[3] for role, candidate in candidates.items()}
 
 
 class BlendShapeMapping():
@@ -109,88 +199,10 @@ common_cats_blend_mapping = [
 
 def automatic_bind_bones(self, avatar_bones):
     print('------')
-    knee_check = False
-    cleaned_bones = dict()
-    for bone in avatar_bones:
-        cleaned_bones[bones_builder.parse_bone_name(
-            bone.name).lower()] = bone
-
-    keys = list(cleaned_bones.keys())
-    for cleaned_name in keys:
-        bone = cleaned_bones[cleaned_name]
-
-        for hip_bone in hips_names:
-            if hip_bone in cleaned_name:
-                self.hips = bone.name
-
-        if "spine2" in cleaned_name or "chest" in cleaned_name or "breast" in cleaned_name:
-            self.spine2 = bone.name
-        elif spine1_name in cleaned_name:
-            # if there is no Spine2, chest or breast, its likely that spine1 is the chest. Convert it.
-            if cleaned_bones.get("spine2") is None and cleaned_bones.get("chest") is None and cleaned_bones.get("breast") is None:
-                self.spine2 = bone.name
-            else:
-                self.spine1 = bone.name
-
-        elif spine_name in cleaned_name:
-            self.spine = bone.name
-
-        for neck_bone in neck_names:
-            if neck_bone in cleaned_name:
-                self.neck = bone.name
-
-        if "lowerarm" in cleaned_name or "forearm" in cleaned_name or "elbow" in cleaned_name:
-            self.fore_arm = bone.name
-        elif "arm" in cleaned_name or "upperarm" in cleaned_name:
-            self.arm = bone.name
-
-        for shoulder_bone in shoulder_names:
-            if shoulder_bone in cleaned_name:
-                self.shoulder = bone.name
-
-        if "upleg" in cleaned_name or "thigh" in cleaned_name or "upleg" in cleaned_name:
-            self.up_leg = bone.name
-        elif "knee" in cleaned_name or "calf" in cleaned_name:
-            self.leg = bone.name
-
-        if "knee" in cleaned_name:
-            knee_check = True
-
-        # Counter: If Knee exists somewhere, it is most likely that Leg is the upper leg.
-        if knee_check and "leg" in cleaned_name and self.up_leg is None:
-            self.up_leg = bone.name
-        elif knee_check and "leg" in cleaned_name:
-            self.leg = bone.name
-
-        if foot_name in cleaned_name or "ankle" in cleaned_name:
-            self.foot = bone.name
-
-        if toe_name in cleaned_name:
-            self.toe = bone.name
-
-        if hand_thumb_re.search(cleaned_name):
-            self.hand_thumb = bone.name
-
-        elif hand_index_re.search(cleaned_name):
-            self.hand_index = bone.name
-
-        elif hand_middle_re.search(cleaned_name):
-            self.hand_middle = bone.name
-
-        elif hand_ring_re.search(cleaned_name):
-            self.hand_ring = bone.name
-
-        elif hand_pinky_re.search(cleaned_name):
-            self.hand_pinky = bone.name
-
-        elif hand_re.search(cleaned_name) is not None:
-            self.hand = bone.name
-
-        if head_name in cleaned_name:
-            self.head = bone.name
-
-        if eye_name in cleaned_name:
-            self.eye = bone.name
+    roles = classify_bones([bone.name for bone in avatar_bones])
+    for role, bone_name in roles.items():
+        print(" -", role, bone_name)
+        setattr(self, role, bone_name)
 
 
 def update_bone_name(edit_bones, from_name, to_name):
@@ -9,8 +9,9 @@ import math
 import copy
 from mathutils import Vector
 
+from metaverse_tools.utils import bpyutil
 from metaverse_tools.utils.bones import bones_builder
-from metaverse_tools.utils.helpers import materials, mesh
+from metaverse_tools.utils.helpers import materials, mesh, material_merge
 
 # DEPRICATED... :( Custom Avatar should be able to do the same thing but better.
 
@@ -220,8 +221,7 @@ def create_blink_shapes(shapekey, armature1, armature2):
 
 def convert_makehuman_avatar_hifi():
     # Should Probably have a confirmation dialog when using this.
-    original_type = bpy.context.area.type
-    bpy.context.area.type = 'VIEW_3D'
+    original_type = bpyutil.switch_area('VIEW_3D')
 
     # Change mode to object mode
 
@@ -250,7 +250,7 @@ def convert_makehuman_avatar_hifi():
                 elif obj.type == 'MESH' and obj.parent is not None and obj.parent.type == 'ARMATURE':
                     bpy.ops.object.mode_set(mode='OBJECT')
                     print(" Cleaning up Materials now. May take a while ")
-                    # materials.clean_materials(obj.material_slots)                   
+                    material_merge.clean_materials([obj])
                     remove_modifier_by_type(obj, "SUBSURF")
 
 
@@ -262,4 +262,4 @@ def convert_makehuman_avatar_hifi():
         bpy.context.view_layer.objects.active = deletion
         bpy.ops.object.delete()
 
-    bpy.context.area.type = original_type
+    bpyutil.restore_area(original_type)
@@ -24,8 +24,10 @@ import bpy
 import re
 import os
 import copy
+import json
 from mathutils import Vector
-from metaverse_tools.utils.helpers import materials, mesh
+from metaverse_tools.utils import bpyutil
+from metaverse_tools.utils.helpers import materials, mesh, material_merge
 from metaverse_tools.utils.bones import bones_builder
 # This part is Based on powroupi the MMD Translation script combined with a Hogarth-MMD Translation csv that has been modified to select names as close as possible
 # This instead uses a predefined list that is Hifi Compatable.
@@ -85,49 +87,146 @@ contains_to_remove = [
     "Return"
 ]
 
+# Leftmost-longest replacement over a character trie of the translation keys.
+# Names are short, so walking the trie from each position replaces the Aho-Corasick failure links
+# without changing the result, and every name is translated in a single left-to-right pass.
+TRIE_MATCH = ""
+
+
+class MMDTranslationTable:
+    def __init__(self, tuples=(), root=None):
+        self.root = root if root is not None else {}
+        for pair in tuples:
+            self.add(pair[0], pair[1])
+
+    def add(self, key, value):
+        if not key:
+            return
+        node = self.root
+        for character in key:
+            node = node.setdefault(character, {})
+        # First row wins for duplicated keys, same as the sequential replace used to do.
+        if TRIE_MATCH not in node:
+            node[TRIE_MATCH] = value
+
+    def replace(self, name):
+        root = self.root
+        result = []
+        index = 0
+        length = len(name)
+        while index < length:
+            node = root
+            cursor = index
+            match = None
+            match_end = index
+            while cursor < length:
+                node = node.get(name[cursor])
+                if node is None:
+                    break
+                cursor += 1
+                if TRIE_MATCH in node:
+                    match = node[TRIE_MATCH]
+                    match_end = cursor
+
+            if match is None:
+                result.append(name[index])
+                index += 1
+            else:
+                result.append(match)
+                index = match_end
+
+        return "".join(result)
+
+
+TRANSLATION_CACHE_VERSION = 2
+TRANSLATION_CACHE_FILE = "mmd_hifi_dict.json"
+
+half_to_full_table = MMDTranslationTable(jp_half_to_full_tuples)
+compiled_translation_table = None
+
+
+def read_translation_csv(filename):
+    with open(filename, 'r', encoding='utf-8', errors='ignore') as f:
+        stream = csv.reader(
+            f, delimiter=',', quotechar='"', skipinitialspace=True)
+        return [tuple(row) for row in stream if len(row) >= 2]
+
+
+def read_translation_editor_text():
+    split_pattern = re.compile(r",\s")
+    remove_end = re.compile(",$")
+    rows = []
+    for line in bpy.data.texts["mmd_hifi_dict.csv"].lines:
+        body = line.body
+        body = body.replace('"', '')
+        body = re.sub(remove_end, "", body)
+        rows.append(tuple(split_pattern.split(body)))
+    return rows
+
+
+def get_translation_cache_path():
+    return os.path.join(bpyutil.get_cache_directory("mmd"), TRANSLATION_CACHE_FILE)
+
+
+# Compiled trie is stored as JSON in the per-user cache directory, keyed by the source csv path, size and modification time.
+def load_translation_cache(key):
+    try:
+        with open(get_translation_cache_path(), 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(cached, dict) or cached.get("key") != list(key) or not isinstance(cached.get("root"), dict):
+        return None
+    return MMDTranslationTable(root=cached["root"])
+
+
+def save_translation_cache(key, table):
+    try:
+        cache_path = get_translation_cache_path()
+        temporary_path = cache_path + "." + str(os.getpid())
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump({"key": list(key), "root": table.root}, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporary_path, cache_path)
+    except OSError as e:
+        print("Could not write translation cache", e)
+
+
+def load_translation_table():
+    global compiled_translation_table
+    if compiled_translation_table is not None:
+        return compiled_translation_table
+
+    local = os.path.dirname(os.path.abspath(__file__))
+    filename = os.path.join(local, 'mmd_hifi_dict.csv')
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:  # Probably just developing then
+        print("Reading Editor file: This only should show when developing")
+        # Editor text can change between runs, so it is never cached.
+        return MMDTranslationTable(read_translation_editor_text())
+
+    key = (TRANSLATION_CACHE_VERSION, filename, stat.st_size, stat.st_mtime_ns)
+    table = load_translation_cache(key)
+    if table is None:
+        table = MMDTranslationTable(read_translation_csv(filename))
+        save_translation_cache(key, table)
+        print("Translation File Loaded")
+    else:
+        print("Translation Cache Loaded")
+
+    compiled_translation_table = table
+    return table
+
+
 # Simplified Translator based on powroupi MMDTranslation
 class MMDTranslator:
     def __init__(self):
-        self.translation_dict = []
-        split_pattern = re.compile(",\s")
-        remove_end = re.compile(",$")
-
-        try:
-            local = os.path.dirname(os.path.abspath(__file__))
-            filename = os.path.join(local, 'mmd_hifi_dict.csv')
-            with open(filename, 'r', encoding='utf-8', errors='ignore') as f:
-                try:
-                    stream = csv.reader(
-                        f, delimiter=',', quotechar='"', skipinitialspace=True)
-                    self.translation_dict = [tuple(row)
-                                             for row in stream if len(row) >= 2]
-                finally:
-                    f.close()
-                    print("Translation File Loaded")
-        except FileNotFoundError:  # Probably just developing then
-            print("Reading Editor file: This only should show when developing")
-            stream = bpy.data.texts["mmd_hifi_dict.csv"].lines
-            for line in stream:
-                body = line.body
-                body = body.replace('"', '')
-                body = re.sub(remove_end, "", body)
-
-                tup = split_pattern.split(body)
-                self.translation_dict.append(tuple(tup))
-
-            print("Done Reading List")
-            print("|||||||||||||||||||||||||||||||||||||||||")
-
-    @staticmethod
-    def replace_from_tuples(name, tuples):
-        for pair in tuples:
-            if pair[0] in name:
-                updated_name = name.replace(pair[0], pair[1])
-                name = updated_name
-        return name
+        self.translation_table = load_translation_table()
+        self.translated_names = {}
 
     def half_to_full(self, name):
-        return self.replace_from_tuples(name, jp_half_to_full_tuples)
+        return half_to_full_table.replace(name)
 
     def is_translated(self, name):
         try:
@@ -137,16 +236,18 @@ class MMDTranslator:
         return True
 
     def translate(self, name):
-        if not self.is_translated(name):
+        if self.is_translated(name):
+            return name
+
+        translated_name = self.translated_names.get(name)
+        if translated_name is None:
             # First Updates short hand to full
             full_name = self.half_to_full(name)
+            translated_name = purge_string(
+                self.translation_table.replace(full_name))
+            self.translated_names[name] = translated_name
 
-            translated_name = self.replace_from_tuples(
-                full_name, self.translation_dict)
-
-            return purge_string(translated_name)
-
-        return name
+        return translated_name
 
 
 def purge_string(string):
@@ -333,81 +434,87 @@ def translate_shape_keys(Translator, shape_keys):
             shape_key.name = "BrowsD_C"
 
 
+# Vertex group consolidation rules, first match wins.
+# (pattern, target, only when target exists). Target is a re.sub template, None drops the group and its weights.
+vertex_group_merge_rules = [
+    (re.compile(r"IK"), None, False),
+    (re.compile(r"^.*RightEyeReturn.*$"), "RightEye", False),
+    (re.compile(r"^.*LeftEyeReturn.*$"), "LeftEye", False),
+    (re.compile(r"^Eyes$"), "Head", False),
+    (re.compile(r"^.*Waist.*$"), "Hips", False),
+    (re.compile(r"^.*Head2.*$"), "Head", False),
+    (re.compile(r"ArmTwist\d?$"), "Arm", True),
+    (re.compile(r"Shoulder[PC]$"), "Shoulder", True),
+    (re.compile(r"LegD$"), "Leg", True),
+    (re.compile(r"FootD$"), "Foot", True),
+    (re.compile(r"HandTwist\d?$"), "ForeArm", True),
+]
+
+
+# Returns {source: target} for the given vertex group names, with chained merges resolved to their final target.
+def plan_vertex_group_merges(group_names):
+    existing = set(group_names)
+    plan = {}
+    for name in group_names:
+        for pattern, target, requires_target in vertex_group_merge_rules:
+            if pattern.search(name) is None:
+                continue
+            if target is not None:
+                target = pattern.sub(target, name, count=1)
+                if target == name or (requires_target and target not in existing):
+                    break
+            plan[name] = target
+            break
+
+    for name, target in plan.items():
+        seen = set([name])
+        while target in plan and target not in seen:
+            seen.add(target)
+            target = plan[target]
+        plan[name] = target
+
+    return dict((name, target) for name, target in plan.items() if target != name)
+
+
+# Consolidates the vertex groups of every mesh in one call, returns {object name: {source: (target, vertices)}}
+def consolidate_vertex_groups(objects):
+    report = {}
+    for obj in objects:
+        if obj.type != 'MESH':
+            continue
+        plan = plan_vertex_group_merges([group.name for group in obj.vertex_groups])
+        report[obj.name] = mesh.merge_vertex_groups(obj, plan)
+
+    for name, merges in report.items():
+        print(" Vertex groups of", name, ":", len(merges), "merged")
+        for source, (target, count) in sorted(merges.items()):
+            print("  -", source, "->", target if target is not None else "(removed)", count, "vertices")
+
+    return report
+
+
 def fix_vertex_groups(obj):
-    vertex_groups = obj.vertex_groups
-    arm_re = re.compile("ArmTwist\d?$")
-    hand_re = re.compile("HandTwist\d?$")
-
-    shoulder_re = re.compile("ShoulderP|C$")
-    leg_re = re.compile("LegD$")
-    foot_re = re.compile("FootD$")
-
-    remove_list = []
-    for vertex_group in vertex_groups:
-        if "IK" in vertex_group.name:
-            remove_list.append(vertex_group)
-
-        if "RightEyeReturn" in vertex_group.name:
-            mesh.mix_weights("RightEye", "RightEyeReturn")
-            remove_list.append(vertex_group)
-
-        elif "LeftEyeReturn" in vertex_group.name:
-            mesh.mix_weights("LeftEye", "LeftEyeReturn")
-            remove_list.append(vertex_group)
-        elif "Eyes" == vertex_group.name:
-            mesh.mix_weights("Head", "Eyes")
-            remove_list.append(vertex_group)
-
-        elif "Waist" in vertex_group.name:
-            mesh.mix_weights("Hips", "Waist")
-            remove_list.append(vertex_group)
-        elif "Head2" in vertex_group.name:
-            mesh.mix_weights("Head", "Head2")
-            remove_list.append(vertex_group)
-
-        elif "ArmTwist" in vertex_group.name:
-            root = re.sub(arm_re, "Arm", vertex_group.name)
-            parent = vertex_groups.get(root)
-            if parent is not None:
-                mesh.mix_weights(root, vertex_group.name)
-                remove_list.append(vertex_group)
-        elif re.search(shoulder_re, vertex_group.name) != None:
-            root = re.sub(shoulder_re, "Shoulder", vertex_group.name)
-            parent = vertex_groups.get(root)
-            if parent is not None:
-                mesh.mix_weights(root, vertex_group.name)
-                remove_list.append(vertex_group)
-        elif re.search(leg_re, vertex_group.name) != None:
-            root = re.sub(leg_re, "Leg", vertex_group.name)
-            parent = vertex_groups.get(root)
-            if parent is not None:
-                mesh.mix_weights(root, vertex_group.name)
-                remove_list.append(vertex_group)
-        elif re.search(foot_re, vertex_group.name) != None:
-            root = re.sub(foot_re, "Foot", vertex_group.name)
-            parent = vertex_groups.get(root)
-            if parent is not None:
-                mesh.mix_weights(root, vertex_group.name)
-                remove_list.append(vertex_group)
-        elif "HandTwist" in vertex_group.name:
-            root = re.sub(hand_re, "ForeArm", vertex_group.name)
-            parent = vertex_groups.get(root)
-            if parent is not None:
-                mesh.mix_weights(root, vertex_group.name)
-                remove_list.append(vertex_group)
-
-    for group in remove_list:
-        print("Removing Vertex Groups", group.name)
-        vertex_groups.remove(group)
+    return consolidate_vertex_groups([obj])
 
 
 def clean_mesh(Translator, obj):
+    clean_meshes(Translator, [obj])
+
+
+def clean_meshes(Translator, objects):
     bpy.ops.object.mode_set(mode='OBJECT')
-    print(" Converting", obj.name, "Mesh")
-    translate_shape_keys(Translator, obj.data.shape_keys.key_blocks)
-    fix_vertex_groups(obj)
-    print(" Removing unused vertex groups")
-    mesh.clean_unused_vertex_groups(obj)
+    for obj in objects:
+        print(" Converting", obj.name, "Mesh")
+        if obj.data.shape_keys is not None:
+            translate_shape_keys(Translator, obj.data.shape_keys.key_blocks)
+
+    consolidate_vertex_groups(objects)
+
+    for obj in objects:
+        print(" Removing unused vertex groups", obj.name)
+        bpy.context.view_layer.objects.active = obj
+        mesh.clean_unused_vertex_groups(obj)
+        bpy.ops.object.mode_set(mode='OBJECT')
 
 # --------------------
 
@@ -431,8 +538,7 @@ def convert_mmd_avatar_hifi():
 
     print("Converting MMD Avatar to be Blender-High Fidelity compliant")
     # Should Probably have a confirmation dialog when using this.
-    original_type = bpy.context.area.type
-    bpy.context.area.type = 'VIEW_3D'
+    original_type = bpyutil.switch_area('VIEW_3D')
 
     Translator = MMDTranslator()
     # Change mode to object mode
@@ -448,6 +554,7 @@ def convert_mmd_avatar_hifi():
 
     marked_for_purge = []
     marked_for_deletion = []
+    avatar_meshes = []
 
     bpy.ops.object.mode_set(mode='OBJECT')
     for scene in bpy.data.scenes:
@@ -470,10 +577,14 @@ def convert_mmd_avatar_hifi():
                     bones_builder.scale_helper(obj)
 
                 elif obj.type == 'MESH' and obj.parent is not None and obj.parent.type == 'ARMATURE':
-                    clean_mesh(Translator, obj)
-                    bpy.ops.object.mode_set(mode='OBJECT')
+                    if obj not in avatar_meshes:
+                        avatar_meshes.append(obj)
 
-                    # materials.clean_materials(obj.material_slots)
+    # Meshes are cleaned after every armature is converted, so their vertex groups already use the translated names
+    bpy.ops.object.select_all(action='DESELECT')
+    clean_meshes(Translator, avatar_meshes)
+    # Lossless merge of duplicate material slots, atlasing is left to the Mesh Tools panel
+    material_merge.clean_materials(avatar_meshes)
 
     bpy.ops.object.select_all(action='DESELECT')
     for deletion in marked_for_deletion:
@@ -488,7 +599,7 @@ def convert_mmd_avatar_hifi():
     materials.convert_to_png(bpy.data.images)
     materials.convert_images_to_mask(bpy.data.images)
 
-    bpy.context.area.type = original_type
+    bpyutil.restore_area(original_type)
 
     bpy.ops.file.make_paths_absolute()
 
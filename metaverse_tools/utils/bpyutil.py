@@ -19,6 +19,7 @@
 # ##### END GPL LICENSE BLOCK #####
 # Copyright 2019 Matti 'Menithal' Lahtinen
 import bpy
+import os
 
 
 def list_has_item(list_var: list, item):
@@ -34,6 +35,30 @@ def get_selected_or_all():
         selected = bpy.context.view_layer.objects
     return selected
 
+# Switches the current area to area_type and returns the previous type.
+# Returns None when there is no area (blender -b), in which case restore_area does nothing.
+def switch_area(area_type):
+    area = bpy.context.area
+    if area is None:
+        return None
+    original_type = area.type
+    area.type = area_type
+    return original_type
+
+
+def restore_area(original_type):
+    if original_type is not None and bpy.context.area is not None:
+        bpy.context.area.type = original_type
+
+
+# Per-user cache directory of the add-on inside the Blender config folder, never the shared temp directory
+def get_cache_directory(name):
+    config_directory = bpy.utils.user_resource('CONFIG', path="metaverse_tools", create=True)
+    directory = os.path.join(config_directory, "cache", name)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    return directory
+
+
 # https://blenderartists.org/t/how-to-know-if-an-operator-is-registered/638803/4
 def operator_exists(idname):
     from bpy.ops import op_as_string
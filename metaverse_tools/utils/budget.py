@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Avatar performance budget: bones, draw calls, materials, triangles, blend shapes, texture memory
+# and skinned vertices, rated against per platform thresholds before export.
+#
+#   blender -b avatar.blend --python-expr "from metaverse_tools.utils import budget; budget.main()" -- [--platform vircadia] [--report report.json]
+#
+# Exits with 1 when any metric is over the limit of a checked platform, so it can gate uploads in CI.
+
+import argparse
+import json
+import sys
+import numpy
+import bpy
+
+from metaverse_tools.utils.bones.bones_builder import find_armature
+from metaverse_tools.utils.helpers.materials import get_material_images, get_texture_memory
+
+BUDGET_METRICS = ("bones", "draw_calls", "materials", "triangles", "blend_shapes", "texture_memory", "skinned_vertices")
+
+# {platform: {metric: (recommended, limit)}}, texture memory in bytes
+PLATFORM_BUDGETS = {
+    "vircadia": {
+        "bones": (100, 256),
+        "draw_calls": (8, 32),
+        "materials": (8, 32),
+        "triangles": (70000, 150000),
+        "blend_shapes": (64, 128),
+        "texture_memory": (75 * 1024 ** 2, 150 * 1024 ** 2),
+        "skinned_vertices": (70000, 150000)
+    },
+    "vrc": {
+        "bones": (150, 400),
+        "draw_calls": (8, 32),
+        "materials": (8, 32),
+        "triangles": (70000, 70000),
+        "blend_shapes": (64, 128),
+        "texture_memory": (75 * 1024 ** 2, 150 * 1024 ** 2),
+        "skinned_vertices": (70000, 100000)
+    },
+    "tu": {
+        "bones": (100, 256),
+        "draw_calls": (4, 16),
+        "materials": (4, 16),
+        "triangles": (40000, 80000),
+        "blend_shapes": (64, 128),
+        "texture_memory": (40 * 1024 ** 2, 100 * 1024 ** 2),
+        "skinned_vertices": (40000, 80000)
+    }
+}
+
+RATINGS = ("ok", "warning", "over")
+
+# Last analysis per armature name, shown by the Avatar Budget panel
+last_reports = {}
+
+
+def get_avatar_meshes(objects, armature):
+    meshes = []
+    for obj in objects:
+        if obj.type != "MESH":
+            continue
+        if armature is None or obj.parent == armature or any(
+                modifier.type == "ARMATURE" and modifier.object == armature for modifier in obj.modifiers):
+            meshes.append(obj)
+    return meshes
+
+
+def get_mesh_metrics(obj):
+    mesh = obj.data
+    polygon_count = len(mesh.polygons)
+
+    loop_totals = numpy.empty(polygon_count, dtype=numpy.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    material_indices = numpy.empty(polygon_count, dtype=numpy.int32)
+    mesh.polygons.foreach_get("material_index", material_indices)
+
+    # Only slots with faces end up as draw calls
+    used_slots = numpy.unique(material_indices) if polygon_count > 0 else numpy.empty(0, dtype=numpy.int32)
+    materials = [obj.material_slots[index].material for index in used_slots if index < len(obj.material_slots)]
+
+    shape_keys = []
+    if mesh.shape_keys is not None:
+        reference = mesh.shape_keys.reference_key
+        shape_keys = [key.name for key in mesh.shape_keys.key_blocks if key != reference]
+
+    skinned = len(obj.vertex_groups) > 0 and any(modifier.type == "ARMATURE" for modifier in obj.modifiers)
+
+    return {
+        "triangles": int(numpy.maximum(loop_totals - 2, 0).sum()),
+        "vertices": len(mesh.vertices),
+        "skinned_vertices": len(mesh.vertices) if skinned else 0,
+        "draw_calls": max(len(used_slots), 1) if polygon_count > 0 else 0,
+        "materials": materials,
+        "shape_keys": shape_keys
+    }
+
+
+def compute_metrics(objects):
+    armature = find_armature(objects)
+    meshes = get_avatar_meshes(objects, armature)
+
+    metrics = dict.fromkeys(BUDGET_METRICS, 0)
+    metrics["bones"] = len(armature.data.bones) if armature is not None else 0
+    materials = set()
+    shape_keys = set()
+    meshes_report = {}
+    for obj in meshes:
+        mesh_metrics = get_mesh_metrics(obj)
+        metrics["triangles"] += mesh_metrics["triangles"]
+        metrics["skinned_vertices"] += mesh_metrics["skinned_vertices"]
+        metrics["draw_calls"] += mesh_metrics["draw_calls"]
+        materials.update(material for material in mesh_metrics["materials"] if material is not None)
+        shape_keys.update(mesh_metrics["shape_keys"])
+        meshes_report[obj.name] = {
+            "triangles": mesh_metrics["triangles"],
+            "vertices": mesh_metrics["vertices"],
+            "draw_calls": mesh_metrics["draw_calls"],
+            "blend_shapes": len(mesh_metrics["shape_keys"])
+        }
+
+    images = set()
+    for material in materials:
+        images.update(get_material_images(material))
+
+    metrics["materials"] = len(materials)
+    # Blend shapes are streamed by name, the same name on several meshes counts once
+    metrics["blend_shapes"] = len(shape_keys)
+    metrics["texture_memory"] = sum(get_texture_memory(image) for image in images)
+
+    return armature, metrics, meshes_report
+
+
+def rate(value, recommended, limit):
+    if value <= recommended:
+        return "ok"
+    if value <= limit:
+        return "warning"
+    return "over"
+
+
+def rate_metrics(metrics, platform):
+    budgets = PLATFORM_BUDGETS[platform]
+    rated = {}
+    for metric in BUDGET_METRICS:
+        recommended, limit = budgets[metric]
+        rated[metric] = {"value": metrics[metric], "recommended": recommended, "limit": limit,
+                         "rating": rate(metrics[metric], recommended, limit)}
+    worst = max((entry["rating"] for entry in rated.values()), key=RATINGS.index)
+    return {"rating": worst, "metrics": rated}
+
+
+def analyze_avatar(objects, platforms=None):
+    if platforms is None:
+        platforms = list(PLATFORM_BUDGETS.keys())
+
+    armature, metrics, meshes_report = compute_metrics(objects)
+    name = armature.name if armature is not None else ""
+    report = {
+        "avatar": name,
+        "metrics": metrics,
+        "meshes": meshes_report,
+        "platforms": {platform: rate_metrics(metrics, platform) for platform in platforms}
+    }
+    last_reports[name] = report
+    return report
+
+
+def write_report(filepath, report):
+    with open(filepath, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=4)
+
+
+def format_metric(metric, value):
+    if metric == "texture_memory":
+        return "{:.1f} MB".format(value / 1024 ** 2)
+    return str(value)
+
+
+def print_report(report):
+    print("Avatar budget:", report["avatar"])
+    for platform, result in report["platforms"].items():
+        print(" {} ({})".format(platform, result["rating"]))
+        for metric, entry in result["metrics"].items():
+            print("   {:<18} {:>12} / {:>12}  {}".format(metric, format_metric(metric, entry["value"]),
+                                                       format_metric(metric, entry["limit"]), entry["rating"]))
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="metaverse_tools.utils.budget",
+                                     description="Check the avatar in the open .blend against platform performance budgets")
+    parser.add_argument("--platform", action="append", choices=list(PLATFORM_BUDGETS.keys()),
+                        help="Platform to check, can be repeated. All platforms by default")
+    parser.add_argument("--report", default=None, help="Write the JSON report to this file")
+    parser.add_argument("--selected", action="store_true", help="Only analyze the selected objects")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    arguments = parse_arguments(argv)
+
+    objects = list(bpy.context.selected_objects if arguments.selected else bpy.context.view_layer.objects)
+    report = analyze_avatar(objects, arguments.platform)
+    print_report(report)
+    if arguments.report:
+        write_report(arguments.report, report)
+
+    over = [platform for platform, result in report["platforms"].items() if result["rating"] == "over"]
+    if over:
+        print("Over budget for", ", ".join(over))
+        if bpy.app.background:
+            sys.exit(1)
+    return report
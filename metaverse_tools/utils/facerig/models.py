@@ -45,6 +45,13 @@ class FaceRigAnimationSet:
         self.options = options
 
 
+class FaceRigActionRoute:
+    def __init__(self, directory:str, frame_range:(int, int), mirrored:bool=False):
+        self.directory = directory
+        self.frame_range = frame_range
+        self.mirrored = mirrored
+
+
 class FaceRigMaterialOptions:
     def __init__(self, material_type:str = "", both_normals:bool = False, alpha_enabled:bool = False, alpha_mask:bool = False):
         self.material_type = material_type
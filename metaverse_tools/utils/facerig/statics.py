@@ -195,6 +195,26 @@ visemes = [
 ]
 
 viseme_names = set_to_list(visemes)
+
+
+# Exported action name -> FaceRigActionRoute, first set listing a name wins.
+def build_action_routes(directory_sets):
+    routes = {}
+    for directory, animation_sets in directory_sets:
+        for animation_set in animation_sets:
+            frames = animation_set.frames
+            route = FaceRigActionRoute(directory, (frames.aPose, frames.bPose), animation_set.options.mirrorable)
+            for name in set_to_list([animation_set]):
+                routes.setdefault(name, route)
+    return routes
+
+
+action_routes = build_action_routes([
+    (general_movement_directory, general_movement),
+    (eye_and_eyebrows_directory, eye_and_eyebrows),
+    (mouth_and_nose_directory, mouth_and_nose),
+    (viseme_directory, visemes),
+])
 weighted_geometry_append = "_skin"
 
 # Left is Biggest Value (frist frame)
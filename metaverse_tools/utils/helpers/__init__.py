@@ -1,4 +1,5 @@
 from . import (
+    axis_conversion,
     extra_math,
     mesh,
     materials,
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Texture atlas packing: shelf packed rectangles, pixels copied with numpy and UVs remapped in bulk.
+
+import bpy
+import os
+import numpy
+
+ATLAS_PADDING = 2
+ATLAS_MAX_SIZE = 4096
+
+
+def next_power_of_two(value):
+    size = 1
+    while size < value:
+        size *= 2
+    return size
+
+
+# Shelf packer: tallest first, left to right, a new shelf when the row is full.
+# Returns ((width, height), [(x, y) per size]) or None when it does not fit in max_size.
+def pack_rectangles(sizes, padding=ATLAS_PADDING, max_size=ATLAS_MAX_SIZE):
+    if not sizes:
+        return None
+
+    padded = [(width + padding * 2, height + padding * 2) for width, height in sizes]
+    area = sum(width * height for width, height in padded)
+    widest = max(width for width, _ in padded)
+    atlas_width = next_power_of_two(max(widest, int(numpy.ceil(numpy.sqrt(area)))))
+    if atlas_width > max_size:
+        return None
+
+    order = sorted(range(len(padded)), key=lambda index: (-padded[index][1], -padded[index][0]))
+    positions = [None] * len(padded)
+    x = 0
+    y = 0
+    shelf_height = 0
+    for index in order:
+        width, height = padded[index]
+        if x + width > atlas_width:
+            y += shelf_height
+            x = 0
+            shelf_height = 0
+        positions[index] = (x + padding, y + padding)
+        x += width
+        shelf_height = max(shelf_height, height)
+
+    atlas_height = next_power_of_two(y + shelf_height)
+    if atlas_height > max_size:
+        return None
+    return (atlas_width, atlas_height), positions
+
+
+def read_image_pixels(image):
+    width, height = image.size
+    pixels = numpy.empty(width * height * 4, dtype=numpy.float32)
+    try:
+        image.pixels.foreach_get(pixels)
+    except AttributeError:
+        # Before 2.83
+        pixels[:] = image.pixels[:]
+    return pixels.reshape((height, width, 4))
+
+
+def write_image_pixels(image, pixels):
+    try:
+        image.pixels.foreach_set(pixels.ravel())
+    except AttributeError:
+        image.pixels[:] = pixels.ravel().tolist()
+
+
+# Copies the images into one atlas, edges are extended into the padding to avoid bleeding when mip mapped.
+# Returns (atlas image, {image name: (u offset, v offset, u scale, v scale)}) or None.
+# The atlas is saved to directory when given, see save_atlas otherwise.
+def build_atlas(name, images, padding=ATLAS_PADDING, max_size=ATLAS_MAX_SIZE, directory=None):
+    images = [image for image in images if image.size[0] > 0 and image.size[1] > 0]
+    packing = pack_rectangles([tuple(image.size) for image in images], padding, max_size)
+    if packing is None:
+        return None
+
+    (atlas_width, atlas_height), positions = packing
+    atlas_pixels = numpy.zeros((atlas_height, atlas_width, 4), dtype=numpy.float32)
+    transforms = {}
+    for image, (x, y) in zip(images, positions):
+        width, height = image.size
+        pixels = read_image_pixels(image)
+        padded = numpy.pad(pixels, ((padding, padding), (padding, padding), (0, 0)), mode="edge")
+        atlas_pixels[y - padding:y + height + padding, x - padding:x + width + padding] = padded
+        transforms[image.name] = (x / atlas_width, y / atlas_height, width / atlas_width, height / atlas_height)
+
+    atlas = bpy.data.images.new(name, atlas_width, atlas_height, alpha=True)
+    write_image_pixels(atlas, atlas_pixels)
+    save_atlas(atlas, directory)
+    return atlas, transforms
+
+
+# Next to the .blend in textures/ by default, packed into the file when it has not been saved yet
+def save_atlas(atlas, directory=None):
+    atlas.file_format = 'PNG'
+    if directory is None and bpy.data.is_saved:
+        directory = os.path.join(os.path.dirname(bpy.data.filepath), "textures")
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        atlas.filepath_raw = os.path.join(directory, atlas.name + ".png")
+        atlas.save()
+    else:
+        atlas.pack()
+
+
+def get_loop_polygons(mesh):
+    # Polygon index of every loop, loops of a polygon are the contiguous range from its loop_start
+    polygon_count = len(mesh.polygons)
+    loop_starts = numpy.empty(polygon_count, dtype=numpy.int32)
+    loop_totals = numpy.empty(polygon_count, dtype=numpy.int32)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    order = numpy.argsort(loop_starts, kind="stable")
+    return numpy.repeat(order, loop_totals[order])
+
+
+def get_polygon_material_indices(mesh):
+    material_indices = numpy.empty(len(mesh.polygons), dtype=numpy.int32)
+    mesh.polygons.foreach_get("material_index", material_indices)
+    return material_indices
+
+
+def read_uvs(uv_layer, loop_count):
+    uvs = numpy.empty(loop_count * 2, dtype=numpy.float32)
+    uv_layer.data.foreach_get("uv", uvs)
+    return uvs.reshape((loop_count, 2))
+
+
+# True when every UV of the polygons using the slot is inside 0 - 1, tiled UVs can not be atlased
+def slot_uvs_in_range(mesh, slot_index, tolerance=1e-3):
+    uv_layer = mesh.uv_layers.active
+    if uv_layer is None:
+        return False
+    loop_materials = get_polygon_material_indices(mesh)[get_loop_polygons(mesh)]
+    uvs = read_uvs(uv_layer, len(mesh.loops))[loop_materials == slot_index]
+    return bool(numpy.all((uvs >= -tolerance) & (uvs <= 1 + tolerance)))
+
+
+# slot_transforms: {material slot index: (u offset, v offset, u scale, v scale)}
+def remap_uvs(mesh, slot_transforms):
+    uv_layer = mesh.uv_layers.active
+    if uv_layer is None or not slot_transforms:
+        return 0
+
+    loop_materials = get_polygon_material_indices(mesh)[get_loop_polygons(mesh)]
+    uvs = read_uvs(uv_layer, len(mesh.loops))
+    remapped = 0
+    for slot_index, (u_offset, v_offset, u_scale, v_scale) in slot_transforms.items():
+        loops = loop_materials == slot_index
+        uvs[loops] = numpy.clip(uvs[loops], 0.0, 1.0) * (u_scale, v_scale) + (u_offset, v_offset)
+        remapped += int(loops.sum())
+
+    uv_layer.data.foreach_set("uv", uvs.ravel())
+    return remapped
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Coordinate conversion between Hifi / Vircadia (Y up, -Z forward) and Blender (Z up, -Y forward).
+# The basis change is a 90 degree rotation around X, so quaternions convert by conjugation:
+# the angle is kept and only the axis (x, y, z part) is rotated, with no axis / angle round trip.
+
+import numpy
+from math import sqrt
+from mathutils import Matrix, Quaternion, Vector
+
+# (x, y, z) -> (x, -z, y)
+HIFI_TO_BLENDER_MATRIX = Matrix(((1, 0, 0), (0, 0, -1), (0, 1, 0)))
+# (x, y, z) -> (x, z, -y)
+BLENDER_TO_HIFI_MATRIX = HIFI_TO_BLENDER_MATRIX.transposed()
+
+HIFI_TO_BLENDER_QUATERNION = Quaternion((sqrt(0.5), sqrt(0.5), 0, 0))
+BLENDER_TO_HIFI_QUATERNION = HIFI_TO_BLENDER_QUATERNION.conjugated()
+
+HIFI_TO_BLENDER_ARRAY = numpy.array(HIFI_TO_BLENDER_MATRIX, dtype=numpy.float64)
+BLENDER_TO_HIFI_ARRAY = HIFI_TO_BLENDER_ARRAY.T.copy()
+
+
+def hifi_to_blender_vector(v):
+    return HIFI_TO_BLENDER_MATRIX @ Vector(v)
+
+
+def blender_to_hifi_vector(v):
+    return BLENDER_TO_HIFI_MATRIX @ Vector(v)
+
+
+def hifi_to_blender_quaternion(q):
+    return HIFI_TO_BLENDER_QUATERNION @ Quaternion(q) @ BLENDER_TO_HIFI_QUATERNION
+
+
+def blender_to_hifi_quaternion(q):
+    return BLENDER_TO_HIFI_QUATERNION @ Quaternion(q) @ HIFI_TO_BLENDER_QUATERNION
+
+
+# Batched versions, positions as (n, 3) and rotations as (n, 4) w, x, y, z arrays
+
+def hifi_to_blender_positions(positions):
+    return numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 3) @ BLENDER_TO_HIFI_ARRAY
+
+
+def blender_to_hifi_positions(positions):
+    return numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 3) @ HIFI_TO_BLENDER_ARRAY
+
+
+def hifi_to_blender_rotations(rotations):
+    converted = numpy.array(rotations, dtype=numpy.float64).reshape(-1, 4)
+    converted[:, 1:4] = converted[:, 1:4] @ BLENDER_TO_HIFI_ARRAY
+    return converted
+
+
+def blender_to_hifi_rotations(rotations):
+    converted = numpy.array(rotations, dtype=numpy.float64).reshape(-1, 4)
+    converted[:, 1:4] = converted[:, 1:4] @ HIFI_TO_BLENDER_ARRAY
+    return converted
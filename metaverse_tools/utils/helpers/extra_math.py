@@ -22,6 +22,8 @@
 
 from mathutils import Quaternion, Vector, Euler, Matrix
 from math import sqrt, acos, pow, sin, cos
+from metaverse_tools.utils.helpers.axis_conversion import (
+    hifi_to_blender_vector, blender_to_hifi_vector, hifi_to_blender_quaternion, blender_to_hifi_quaternion)
 
 NEAREST_DIGIT = 10000
 'x,y,z'
@@ -34,8 +36,18 @@ ZERO_QUAT = (1,0,0,0)
 
 # Utility to round to nearest digit. Hifi exports some times so fairly erroronious floats, so truncating them can help
 ## TODO: Allow scene to set to what digit should everything be rouded to
-def round_nearest(val):
-    return round(val * NEAREST_DIGIT)/NEAREST_DIGIT
+def round_nearest(val, nearest=NEAREST_DIGIT):
+    return round(val * nearest)/nearest
+
+# Rounds every float in nested dicts / lists with round_nearest, used before writing json
+def round_floats(data, nearest=NEAREST_DIGIT):
+    if isinstance(data, float):
+        return round_nearest(data, nearest)
+    if isinstance(data, dict):
+        return {key: round_floats(value, nearest) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [round_floats(value, nearest) for value in data]
+    return data
 
 # Utility to make sure a tuple is returned from a dict
 def parse_dict_vector(entity, index, default = ZERO_VECTOR):
@@ -62,12 +74,13 @@ def swap_yz(v):
     return Vector((v[0], v[2], v[1]))
 
 
-# Utility to swap y and -z
+# Utility to swap y and -z, Hifi to Blender coordinates
 def swap_nyz(vector):
-    return Vector((vector[0], -vector[2], vector[1]))
+    return hifi_to_blender_vector(vector)
 
+# Blender to Hifi coordinates
 def swap_nzy(vector):
-    return Vector((vector[0], vector[2], -vector[1]))
+    return blender_to_hifi_vector(vector)
 
 def matrix4_to_dict(m):
     return [vec4_to_list(m[0]),
@@ -82,29 +95,13 @@ def vec4_to_list(v):
 def vec_to_list(v):
     return [v.x,v.y,v.z]
 
-# Utility to swap quaternion axis to -zy
+# Utility to swap quaternion axis to -zy, see axis_conversion
 def quat_swap_nyz(q):
-    q1 = Quaternion(q)
-    
-    axis = q1.axis
-    angle = q1.angle
-    
-    temp = axis.z
-    axis.z = axis.y
-    axis.y = -temp
-    return Quaternion(axis, angle)
+    return hifi_to_blender_quaternion(q)
 
 
 def quat_swap_nzy(q):
-    q1 = Quaternion(q)
-
-    axis = q1.axis
-    angle = q1.angle
-    
-    temp = axis.z
-    axis.z = -axis.y
-    axis.y = temp
-    return Quaternion(axis, angle)
+    return blender_to_hifi_quaternion(q)
 
 
 def list_tuple(l):
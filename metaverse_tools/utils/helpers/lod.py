@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Level of detail meshes for the scene JSON and FST exporters.
+# Levels are made with the Decimate modifier in Collapse mode (quadric edge collapse) and cached
+# by the content hash of the source mesh, so instanced or unchanged meshes are only decimated once.
+
+import bpy
+import os
+import json
+import logging
+import numpy
+from hashlib import sha256
+
+from metaverse_tools.utils import log
+
+logger = log.get_logger("export")
+
+LOD_MANIFEST = "lod_manifest.json"
+LOD_MODIFIER_NAME = "MVT_LOD"
+# Levels below this are not worth a separate asset
+MIN_LOD_TRIANGLES = 12
+# Meters, where a level keeping half of the triangles is switched to
+DEFAULT_LOD_DISTANCE = 5.0
+
+# {(content hash, ratio): decimated mesh}
+lod_mesh_cache = {}
+
+
+def count_triangles(mesh):
+    loop_totals = numpy.empty(len(mesh.polygons), dtype=numpy.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    return int(numpy.maximum(loop_totals - 2, 0).sum())
+
+
+def get_mesh_content_hash(mesh):
+    content = sha256()
+    coordinates = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+    mesh.vertices.foreach_get("co", coordinates)
+    content.update(coordinates.tobytes())
+
+    loop_vertices = numpy.empty(len(mesh.loops), dtype=numpy.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    content.update(loop_vertices.tobytes())
+
+    loop_totals = numpy.empty(len(mesh.polygons), dtype=numpy.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    content.update(loop_totals.tobytes())
+
+    material_indices = numpy.empty(len(mesh.polygons), dtype=numpy.int32)
+    mesh.polygons.foreach_get("material_index", material_indices)
+    content.update(material_indices.tobytes())
+
+    for uv_layer in mesh.uv_layers:
+        uvs = numpy.empty(len(mesh.loops) * 2, dtype=numpy.float32)
+        uv_layer.data.foreach_get("uv", uvs)
+        content.update(uvs.tobytes())
+
+    return content.hexdigest()
+
+
+# [(level, ratio of the source triangles kept)], levels counted from 1. The first level keeps ratio,
+# or triangle_budget triangles when set, and every level after that keeps ratio of the previous one.
+# A level the budget does not reduce is left out without renumbering the ones after it,
+# and levels stop once they would go under MIN_LOD_TRIANGLES.
+def get_lod_ratios(triangles, levels, ratio=0.5, triangle_budget=0):
+    if triangle_budget > 0 and triangles > 0:
+        first = triangle_budget / triangles
+    else:
+        first = ratio
+
+    ratios = []
+    for level in range(1, levels + 1):
+        level_ratio = first * ratio ** (level - 1)
+        if level_ratio >= 1.0:
+            # Already under the budget
+            continue
+        if triangles * level_ratio < MIN_LOD_TRIANGLES:
+            break
+        ratios.append((level, round(level_ratio, 4)))
+    return ratios
+
+
+# Distance the level is switched to, lod_distance for a level keeping half of the triangles.
+# Triangle edges grow with the square root of the triangles removed, so the distance grows with it
+# to keep the same error on screen.
+def get_lod_distance(lod_distance, ratio):
+    return round(lod_distance * (0.5 / ratio) ** 0.5, 2)
+
+
+def decimate_mesh(obj, ratio):
+    # Only the decimation is evaluated, the armature and other modifiers stay as they are on the object.
+    modifier_states = [(modifier, modifier.show_viewport) for modifier in obj.modifiers]
+    for modifier, _ in modifier_states:
+        modifier.show_viewport = False
+
+    decimate = obj.modifiers.new(LOD_MODIFIER_NAME, 'DECIMATE')
+    decimate.decimate_type = 'COLLAPSE'
+    decimate.ratio = ratio
+    decimate.use_collapse_triangulate = True
+    try:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        mesh = bpy.data.meshes.new_from_object(obj.evaluated_get(depsgraph))
+    finally:
+        obj.modifiers.remove(decimate)
+        for modifier, show_viewport in modifier_states:
+            modifier.show_viewport = show_viewport
+
+    mesh.name = obj.data.name + "_LOD"
+    return mesh
+
+
+def get_lod_mesh(obj, ratio, content_hash=None):
+    if content_hash is None:
+        content_hash = get_mesh_content_hash(obj.data)
+    key = (content_hash, ratio)
+
+    mesh = lod_mesh_cache.get(key)
+    if mesh is not None:
+        try:
+            mesh.name
+            return mesh
+        except ReferenceError:
+            # Removed with the file or by the user
+            del lod_mesh_cache[key]
+
+    mesh = decimate_mesh(obj, ratio)
+    lod_mesh_cache[key] = mesh
+    return mesh
+
+
+def clear_lod_cache():
+    for mesh in lod_mesh_cache.values():
+        try:
+            if mesh.users == 0:
+                bpy.data.meshes.remove(mesh)
+        except ReferenceError:
+            pass
+    lod_mesh_cache.clear()
+
+
+# Manifest of the LOD files already written to an export folder, {file name: {hash, ratio, triangles}}
+def load_lod_manifest(directory):
+    try:
+        with open(os.path.join(directory, LOD_MANIFEST), "r", encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_lod_manifest(directory, manifest):
+    try:
+        with open(os.path.join(directory, LOD_MANIFEST), "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=4, sort_keys=True)
+    except OSError as e:
+        logger.warning("Could not write LOD manifest %s", e)
+
+
+# options: the export settings the LOD file depends on besides the mesh, as a JSON compatible dict
+def is_lod_file_current(directory, file_name, manifest, content_hash, ratio, options=None):
+    entry = manifest.get(file_name)
+    return (entry is not None and entry.get("hash") == content_hash and entry.get("ratio") == ratio
+            and entry.get("options") == options and os.path.exists(os.path.join(directory, file_name)))
+
+
+# LOD files of one export folder: the manifest read at the start of the export and the triangles per level written in it
+class LODExport:
+    def __init__(self, directory, options=None):
+        self.directory = directory
+        self.options = options
+        self.manifest = load_lod_manifest(directory)
+        # [(name, [triangles of the source, LOD1, LOD2, ...])]
+        self.report = []
+
+    def get_current_triangles(self, file_name, content_hash, ratio):
+        if is_lod_file_current(self.directory, file_name, self.manifest, content_hash, ratio, self.options):
+            return self.manifest[file_name]["triangles"]
+        return None
+
+    def add(self, file_name, content_hash, ratio, triangles):
+        self.manifest[file_name] = {"hash": content_hash, "ratio": ratio, "triangles": triangles, "options": self.options}
+
+    def save(self):
+        save_lod_manifest(self.directory, self.manifest)
+        log_lod_report(self.report)
+
+
+# rows: [(name, [triangles of the source, LOD1, LOD2, ...])], a row per mesh at debug and the totals at info
+def log_lod_report(rows):
+    if not rows:
+        return
+    if logger.isEnabledFor(logging.DEBUG):
+        for name, triangles in rows:
+            logger.debug("LOD %-40s %s", name[:40], " ".join("{:>9}".format(count) for count in triangles))
+
+    levels = max(len(triangles) for _, triangles in rows)
+    totals = [sum(triangles[level] for _, triangles in rows if level < len(triangles)) for level in range(levels)]
+    logger.info("LOD triangles of %d meshes: %s", len(rows), " -> ".join(str(count) for count in totals))
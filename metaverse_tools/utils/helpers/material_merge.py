@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Material slot consolidation, every slot is a draw call in Vircadia.
+# Materials with identical Principled BSDF parameters and textures are merged as is. With atlas enabled,
+# materials that only differ by their base color texture get their textures baked into a shared atlas
+# and the UVs of their polygons moved into the atlas.
+
+import bpy
+import logging
+import numpy
+
+from metaverse_tools.utils import log
+from metaverse_tools.utils.helpers import atlas
+from metaverse_tools.utils.helpers.materials import HifiShaderWrapper, get_material_images, get_texture_memory
+
+logger = log.get_logger("export")
+
+PARAMETER_PRECISION = 3
+TEXTURE_SLOTS = ("base_color_texture", "specular_texture", "roughness_texture", "metallic_texture",
+                 "alpha_texture", "normalmap_texture", "emission_texture")
+
+
+def round_parameter(value):
+    if isinstance(value, (int, float)):
+        return round(value, PARAMETER_PRECISION)
+    return tuple(round(component, PARAMETER_PRECISION) for component in value)
+
+
+# (base color, other shader parameters, {texture slot: image}), None when the material is not a Principled BSDF
+def get_material_signature(material):
+    if material is None or not material.use_nodes:
+        return None
+    wrapper = HifiShaderWrapper(material)
+    if wrapper.node_principled_bsdf is None:
+        return None
+
+    parameters = (round_parameter(wrapper.metallic), round_parameter(wrapper.roughness),
+                  round_parameter(wrapper.specular), round_parameter(wrapper.alpha),
+                  round_parameter(wrapper.emission), round_parameter(wrapper.normalmap_strength),
+                  material.blend_method)
+    textures = {}
+    for slot in TEXTURE_SLOTS:
+        texture = getattr(wrapper, slot)
+        if texture is not None and texture.image is not None:
+            textures[slot] = texture.image
+    return round_parameter(wrapper.base_color), parameters, textures
+
+
+def get_identical_key(signature):
+    base_color, parameters, textures = signature
+    return base_color, parameters, tuple(sorted((slot, image.name) for slot, image in textures.items()))
+
+
+# Atlas candidates only use a base color texture, so swapping that texture is the only difference between them
+def get_atlas_key(signature):
+    _, parameters, textures = signature
+    if list(textures.keys()) != ["base_color_texture"]:
+        return None
+    return parameters
+
+
+def get_used_slots(mesh):
+    if len(mesh.polygons) == 0:
+        return []
+    return [int(index) for index in numpy.unique(atlas.get_polygon_material_indices(mesh))]
+
+
+def get_draw_call_report(objects):
+    draw_calls = 0
+    materials = set()
+    for obj in objects:
+        used_slots = get_used_slots(obj.data)
+        draw_calls += len(used_slots)
+        materials.update(obj.data.materials[index] for index in used_slots
+                         if index < len(obj.data.materials) and obj.data.materials[index] is not None)
+
+    images = set()
+    for material in materials:
+        images.update(get_material_images(material))
+    return {"draw_calls": draw_calls, "materials": len(materials),
+            "texture_memory": sum(get_texture_memory(image) for image in images)}
+
+
+def plan_identical_merges(materials, signatures):
+    canonical = {}
+    first_by_key = {}
+    for material in materials:
+        signature = signatures.get(material)
+        if signature is None:
+            canonical[material] = material
+            continue
+        key = get_identical_key(signature)
+        canonical[material] = first_by_key.setdefault(key, material)
+    return canonical
+
+
+# max_texture_size: only textures up to this size on both sides are atlased, 0 for any size
+def plan_atlas_groups(meshes, materials, signatures, max_texture_size=0):
+    groups = {}
+    for material in materials:
+        signature = signatures.get(material)
+        if signature is None:
+            continue
+        key = get_atlas_key(signature)
+        if key is not None and max_texture_size > 0:
+            if max(signature[2]["base_color_texture"].size) > max_texture_size:
+                key = None
+        if key is not None:
+            groups.setdefault(key, []).append(material)
+
+    # Tiled UVs would sample the neighbouring textures in the atlas
+    tiled = set()
+    for mesh in meshes:
+        for index in get_used_slots(mesh):
+            if index < len(mesh.materials) and mesh.materials[index] is not None:
+                if not atlas.slot_uvs_in_range(mesh, index):
+                    tiled.add(mesh.materials[index])
+
+    return [[material for material in group if material not in tiled] for group in groups.values()
+            if len([material for material in group if material not in tiled]) > 1]
+
+
+def build_atlas_material(group, signatures, directory=None):
+    images = []
+    for material in group:
+        image = signatures[material][2]["base_color_texture"]
+        if image not in images:
+            images.append(image)
+
+    result = atlas.build_atlas(group[0].name + "_atlas", images, directory=directory)
+    if result is None:
+        logger.debug("Skipping atlas of %d materials, textures do not fit in %d", len(group), atlas.ATLAS_MAX_SIZE)
+        return None
+
+    atlas_image, transforms = result
+    atlas_material = group[0].copy()
+    atlas_material.name = group[0].name + "_atlas"
+    HifiShaderWrapper(atlas_material).base_color_texture.node_image.image = atlas_image
+    return atlas_material, {material: transforms[signatures[material][2]["base_color_texture"].name] for material in group}
+
+
+def collapse_slots(mesh, targets, uv_transforms):
+    # targets: {material: merged material}, uv_transforms: {material: atlas transform}
+    old_materials = list(mesh.materials)
+    new_materials = []
+    slot_map = numpy.arange(max(len(old_materials), 1), dtype=numpy.int32)
+    slot_transforms = {}
+    used = set(get_used_slots(mesh))
+    for index, material in enumerate(old_materials):
+        target = targets.get(material, material)
+        if index in used and material in uv_transforms:
+            slot_transforms[index] = uv_transforms[material]
+        if index not in used:
+            continue
+        if target not in new_materials:
+            new_materials.append(target)
+        slot_map[index] = new_materials.index(target)
+
+    atlas.remap_uvs(mesh, slot_transforms)
+
+    material_indices = atlas.get_polygon_material_indices(mesh)
+    material_indices = slot_map[numpy.clip(material_indices, 0, len(slot_map) - 1)]
+    mesh.polygons.foreach_set("material_index", material_indices)
+
+    mesh.materials.clear()
+    for material in new_materials:
+        mesh.materials.append(material)
+    return len(old_materials), len(new_materials)
+
+
+# atlas_directory: where the atlas images are saved, next to the .blend when None.
+# The report lists the created atlas images and materials so a temporary merge can remove them again.
+def merge_materials(objects, use_atlas=True, max_texture_size=0, atlas_directory=None):
+    mesh_objects = [obj for obj in objects if obj.type == "MESH"]
+    before = get_draw_call_report(mesh_objects)
+
+    meshes = []
+    materials = []
+    for obj in mesh_objects:
+        if obj.data in meshes:
+            continue
+        meshes.append(obj.data)
+        for index in get_used_slots(obj.data):
+            if index < len(obj.data.materials):
+                material = obj.data.materials[index]
+                if material is not None and material not in materials:
+                    materials.append(material)
+
+    signatures = {material: get_material_signature(material) for material in materials}
+    targets = plan_identical_merges(materials, signatures)
+
+    uv_transforms = {}
+    atlases = 0
+    created_images = []
+    created_materials = []
+    if use_atlas:
+        canonical_materials = [material for material in materials if targets[material] == material]
+        for group in plan_atlas_groups(meshes, canonical_materials, signatures, max_texture_size):
+            result = build_atlas_material(group, signatures, atlas_directory)
+            if result is None:
+                continue
+            atlas_material, transforms = result
+            atlases += 1
+            created_materials.append(atlas_material)
+            created_images.append(HifiShaderWrapper(atlas_material).base_color_texture.node_image.image)
+            for material in group:
+                targets[material] = atlas_material
+            # Merged duplicates follow their canonical material into the atlas
+            for material, target in list(targets.items()):
+                if target in transforms:
+                    targets[material] = atlas_material
+                    transforms.setdefault(material, transforms[target])
+            uv_transforms.update(transforms)
+
+    for mesh in meshes:
+        collapse_slots(mesh, targets, uv_transforms)
+
+    after = get_draw_call_report(mesh_objects)
+    report = {"before": before, "after": after, "atlases": atlases, "meshes": len(meshes),
+              "images": created_images, "materials": created_materials}
+    log_merge_report(report)
+    return report
+
+
+def log_merge_report(report):
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    changes = []
+    for key in ("draw_calls", "materials", "texture_memory"):
+        before = report["before"][key]
+        after = report["after"][key]
+        if key == "texture_memory":
+            before = "{:.1f} MB".format(before / 1024 ** 2)
+            after = "{:.1f} MB".format(after / 1024 ** 2)
+        changes.append("{} {} -> {}".format(key, before, after))
+    logger.info("Material merge of %d meshes, %d atlases: %s", report["meshes"], report["atlases"], ", ".join(changes))
+
+
+def clean_materials(objects, use_atlas=False):
+    return merge_materials(objects, use_atlas)
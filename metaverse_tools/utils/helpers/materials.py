@@ -27,25 +27,39 @@ from bpy_extras.node_shader_utils import (
 )
 from bpy.app.handlers import persistent
 import metaverse_tools
+from metaverse_tools.utils import log
 from mathutils import Euler
 
+logger = log.get_logger("materials")
+
 
 def get_images_from(meshes):
     images = []
     for mesh in meshes:
         if(mesh.type == "MESH"):
             for material_slot in mesh.material_slots:
-                print("Iterating material", material_slot)
                 if material_slot is not None:
                     material = material_slot.material
                     if material.use_nodes:
                         for node in material.node_tree.nodes:
-                            print("Iterating material node", node, node.name)
                             if node is not None and node.type == 'TEX_IMAGE' and node.image is not None:
                                 images.append(node.image)
+    logger.debug("Found %d images in %d objects", len(images), len(meshes))
     return images
 
 
+def get_material_images(material):
+    if material is None or not material.use_nodes or material.node_tree is None:
+        return []
+    return [node.image for node in material.node_tree.nodes if node.type == 'TEX_IMAGE' and node.image is not None]
+
+
+# GPU memory of an image uploaded as RGBA8 with a full mip chain
+def get_texture_memory(image):
+    width, height = image.size
+    return int(width * height * 4 * 4 / 3)
+
+
 def cleanup_unused(images):
     for image in images:
         pixel_count = len(image.pixels)
@@ -59,10 +73,29 @@ def convert_to_png(images):
         bpy.ops.metaverse_toolset_messages.remind_save('INVOKE_DEFAULT')
         return
 
-    if pack_images(images):
+    if bpy.context.area is None:
+        save_images_as_png(images)
+    elif pack_images(images):
         unpack_images(images)
 
 
+# Data API version of pack_images / unpack_images for when there is no area to host the image editor (blender -b)
+def save_images_as_png(images):
+    filename_re = re.compile("\\.[a-zA-Z]{2,4}$")
+    for image in list(images):
+        if image.users > 0 and len(image.pixels) > 0:
+            if image.packed_file is not None:
+                image.unpack(method='WRITE_LOCAL')
+            image.name = filename_re.sub(".png", image.name)
+            image.filepath_raw = filename_re.sub(".png", image.filepath_raw)
+            image.file_format = 'PNG'
+            image.save()
+            image.reload()
+            print("+ Saving", image.name, image.filepath)
+        else:
+            bpy.data.images.remove(image)
+
+
 def pack_images(images):
     mode = bpy.context.area.type
     success = False
@@ -119,9 +152,6 @@ def convert_image_to_mask(image, threshold):
     pixels = list(image.pixels)
     size = len(pixels)
 
-    mode = bpy.context.area.type
-    bpy.context.area.type = 'IMAGE_EDITOR'
-    bpy.context.area.spaces.active.image = image
     if size == 0:
         return
     pxs = range(0, int(size/4))
@@ -135,9 +165,7 @@ def convert_image_to_mask(image, threshold):
     image.pixels = pixels
 
     if image.source != "GENERATED":
-        bpy.ops.image.save()
-
-    bpy.context.area.type = mode
+        image.save()
 
 
 def convert_images_to_mask(images, threshold=0.3):
@@ -165,10 +193,6 @@ def clean_textures(material):
     return textures
 
 
-def clean_materials(materials_slots):
-    print("TODO: IMPLEMENT ME materials.clean_materials")
-
-
 def rgb_to_bw(rgb):
     return (rgb[0] + rgb[1] + rgb[2])/3
 
@@ -226,7 +250,7 @@ class HifiShaderWrapper(PrincipledBSDFWrapper):
 
     def update(self):
         PrincipledBSDFWrapper.update(self)
-        print("HifiShaderWrapper", self.use_nodes, self.node_principled_bsdf)
+        logger.debug("HifiShaderWrapper %s %s", self.use_nodes, self.node_principled_bsdf)
 
 
     def emission_get(self):
@@ -243,7 +267,6 @@ class HifiShaderWrapper(PrincipledBSDFWrapper):
 
     # Will only be used as gray-scale one...
     def emission_texture_get(self):
-        print("Emission Texture Get", self.use_nodes, self.node_principled_bsdf)
         if not self.use_nodes or self.node_principled_bsdf is None:
             return None
         return ShaderImageTextureWrapper(
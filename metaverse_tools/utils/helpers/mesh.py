@@ -20,6 +20,9 @@
 import bpy
 import copy
 from metaverse_tools.utils.helpers import common
+from metaverse_tools.utils import log
+
+logger = log.get_logger("mesh")
 
 
 def get_mesh_from(selected):
@@ -43,6 +46,68 @@ def mix_weights(a, b):
     bpy.ops.object.modifier_apply(modifier="VertexWeightMix")
 
 
+# Merges vertex groups in a single pass over the vertices instead of a weight mix modifier per group.
+# merges maps source group name to target group name, or None to drop the source without keeping its weights.
+# Weights are added and clamped to 1.0 like the ADD mode of mix_weights. Returns {source: (target, vertices)}.
+def merge_vertex_groups(obj, merges):
+    vertex_groups = obj.vertex_groups
+    group_targets = {}
+    report = {}
+    for source, target in merges.items():
+        source_group = vertex_groups.get(source)
+        if source_group is None:
+            continue
+
+        report[source] = (target, 0)
+        if target is None:
+            group_targets[source_group.index] = None
+            continue
+
+        target_group = vertex_groups.get(target)
+        if target_group is None:
+            target_group = vertex_groups.new(name=target)
+        group_targets[source_group.index] = target_group.index
+
+    if not group_targets:
+        return report
+
+    target_indices = set(index for index in group_targets.values() if index is not None)
+    group_names = dict((group.index, group.name) for group in vertex_groups)
+    source_counts = dict((index, 0) for index in group_targets)
+
+    merged_weights = {}
+    for vertex in obj.data.vertices:
+        for element in vertex.groups:
+            group = element.group
+            if group in group_targets:
+                source_counts[group] += 1
+                target = group_targets[group]
+                if target is None:
+                    continue
+            elif group in target_indices:
+                target = group
+            else:
+                continue
+
+            key = (target, vertex.index)
+            merged_weights[key] = merged_weights.get(key, 0.0) + element.weight
+
+    # Batch the writes: one add call per target and resulting weight.
+    batches = {}
+    for (target, vertex_index), weight in merged_weights.items():
+        batches.setdefault((target, min(weight, 1.0)), []).append(vertex_index)
+
+    for (target, weight), indices in batches.items():
+        vertex_groups[group_names[target]].add(indices, weight, 'REPLACE')
+
+    for index, count in source_counts.items():
+        source = group_names[index]
+        report[source] = (report[source][0], count)
+        vertex_groups.remove(vertex_groups[source])
+
+    return report
+
+
 def clean_unused_vertex_groups(obj):
     # This part is generic:
     bpy.ops.object.mode_set(mode='OBJECT')
@@ -68,7 +133,7 @@ def clean_unused_vertex_groups(obj):
         for used in has_use:
             vertex_groups.remove(used)
 
-    print(" Removing Unused Bones")
+    logger.debug("Removing Unused Bones")
 
     parent = obj.parent
     _to_remove_bones = []
@@ -81,23 +146,23 @@ def clean_unused_vertex_groups(obj):
         mapped = [(x.name) for x in vertex_groups]
 
         bpy.ops.object.mode_set(mode='EDIT')
-        print(" Iterating edit bones", len(parent.data.edit_bones))
+        logger.debug("Iterating %d edit bones", len(parent.data.edit_bones))
         for edit_bone in parent.data.edit_bones:
             if edit_bone.name in mapped and edit_bone.name != "HeadTop":
-                print("  - Removing Unused Bone", edit_bone.name)
+                logger.debug(" - Removing Unused Bone %s", edit_bone.name)
                 _to_remove_bones.append(edit_bone)
 
         for bone_to_remove in _to_remove_bones:
             parent.data.edit_bones.remove(bone_to_remove)
 
-    print(" Found ", len(vertex_groups),
-          " without weights, cleaning up", obj.parent)
+    logger.info("Found %d vertex groups without weights on %s, %d unused bones removed from %s",
+                len(vertex_groups), obj.name, len(_to_remove_bones), parent.name if parent is not None else None)
     for group in vertex_groups:
-        print("  - Removing Vertex Groups ", group)
+        logger.debug(" - Removing Vertex Group %s", group.name)
         obj.vertex_groups.remove(group)
 
     bpy.ops.object.mode_set(mode='OBJECT')
-    print(" Found", len(empty_vertex), " Unused Vertices")
+    logger.info("Found %d Unused Vertices", len(empty_vertex))
 
     bpy.context.view_layer.objects.active = obj
 
@@ -110,10 +175,9 @@ def get_shape_keys(mesh):
 
 
 def generate_empty_shapekeys(obj, target_shapekey_list):
-    print("generate_empty_shapekeys", obj)
+    logger.debug("generate_empty_shapekeys %s", obj.name)
     shape_keys = get_shape_keys(obj)
     for key in target_shapekey_list:
-        print(key, shape_keys.find(key))
         if shape_keys.find(key) is -1:
             bpy.ops.object.shape_key_clear()
             obj.shape_key_add(name=key)
@@ -147,9 +211,8 @@ def boolean_union_objects(active, meshes):
 
 
 def sort_shapekeys(obj, target_shapekey_list):
-    print("sort_shapekeys", obj)
+    logger.debug("sort_shapekeys %s", obj.name)
     shape_keys = get_shape_keys(obj)
-    print(shape_keys)
     name_list = [sk.name for sk in shape_keys]
     moved = 0
 
@@ -163,4 +226,4 @@ def sort_shapekeys(obj, target_shapekey_list):
             # Simple upkeep for indexes from changing. They are ALWAYS added to top first, so technically "gone"
             name_list.pop(index)
         except Exception as e:
-            print("Could not find shapekey ", key, " Skipping: Full: ", e)
+            logger.debug("Could not find shapekey %s Skipping: Full: %s", key, e)
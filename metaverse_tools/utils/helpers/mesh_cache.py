@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# On disk cache of meshes with their modifiers applied.
+# Entries are keyed by a hash of every base mesh input the modifiers or the cached buffers depend on and
+# the fingerprint of every modifier setting, so re-exports and instances of the same mesh with the same modifiers skip applying the modifiers.
+# Least recently used entries are evicted once the cache grows past its size limit.
+
+import bpy
+import os
+import numpy
+from hashlib import sha256
+
+from metaverse_tools.utils import bpyutil, log
+
+MESH_CACHE_VERSION = 2
+MESH_CACHE_MAX_SIZE = 512 * 1024 ** 2
+
+# UI state of the modifier, does not change the result
+SKIPPED_PROPERTIES = {"rna_type", "name", "show_expanded", "show_in_editmode", "show_on_cage", "show_render",
+                      "is_active", "is_override_data_editable", "persistent_uid", "execution_time"}
+FLOAT_PRECISION = 6
+# Single value generic attributes hashed with the base mesh
+ATTRIBUTE_TYPES = {'FLOAT': numpy.float32, 'INT': numpy.int32, 'INT8': numpy.int8, 'BOOLEAN': bool}
+
+logger = log.get_logger("export")
+
+
+def get_value_fingerprint(value):
+    if isinstance(value, bpy.types.Object):
+        # Offset, mirror and other helper objects change the result by where they are
+        return value.name + str([round(component, FLOAT_PRECISION) for row in value.matrix_world for component in row])
+    if isinstance(value, bpy.types.ID):
+        return value.name
+    if isinstance(value, float):
+        return repr(round(value, FLOAT_PRECISION))
+    if isinstance(value, (str, int, bool)):
+        return repr(value)
+    if isinstance(value, set):
+        return repr(sorted(value))
+    try:
+        return "(" + ",".join(get_value_fingerprint(component) for component in value) + ")"
+    except TypeError:
+        return repr(value)
+
+
+def get_modifier_fingerprint(modifier):
+    fingerprint = "m:" + modifier.type
+    for rna_property in modifier.bl_rna.properties:
+        identifier = rna_property.identifier
+        if identifier in SKIPPED_PROPERTIES or rna_property.type == 'COLLECTION':
+            continue
+        value = getattr(modifier, identifier, None)
+        if rna_property.type == 'POINTER' and not isinstance(value, bpy.types.ID):
+            # Nested settings structs, point caches and the like
+            continue
+        fingerprint += "|" + identifier + ":" + get_value_fingerprint(value)
+    return fingerprint
+
+
+def references_objects(modifier):
+    return any(rna_property.type == 'POINTER' and isinstance(getattr(modifier, rna_property.identifier, None), bpy.types.Object)
+               for rna_property in modifier.bl_rna.properties)
+
+
+def get_modifiers_fingerprint(modifiers):
+    return "".join("|" + str(index) + "|" + get_modifier_fingerprint(modifier) for index, modifier in enumerate(modifiers))
+
+
+# Per item values of a mesh collection, None when the property does not exist in this Blender version
+def read_collection_values(collection, attribute, width, dtype):
+    values = numpy.empty(len(collection) * width, dtype=dtype)
+    try:
+        collection.foreach_get(attribute, values)
+    except (AttributeError, TypeError, RuntimeError):
+        return None
+    return values
+
+
+# Hash of the base mesh: geometry, shading, edge data read by Edge Split, Subdivision and Bevel,
+# custom normals, UV and vertex color layers
+def get_mesh_input_hash(mesh):
+    content = sha256()
+
+    def update(name, values):
+        content.update(name.encode("utf-8"))
+        if values is not None:
+            content.update(values.tobytes())
+
+    update("co", read_collection_values(mesh.vertices, "co", 3, numpy.float32))
+    update("vertex_bevel_weight", read_collection_values(mesh.vertices, "bevel_weight", 1, numpy.float32))
+    update("edge_vertices", read_collection_values(mesh.edges, "vertices", 2, numpy.int32))
+    for attribute, dtype in (("use_edge_sharp", bool), ("use_seam", bool), ("crease", numpy.float32),
+                             ("bevel_weight", numpy.float32)):
+        update("edge_" + attribute, read_collection_values(mesh.edges, attribute, 1, dtype))
+    update("loop_vertices", read_collection_values(mesh.loops, "vertex_index", 1, numpy.int32))
+    for attribute, dtype in (("loop_total", numpy.int32), ("material_index", numpy.int32), ("use_smooth", bool)):
+        update("polygon_" + attribute, read_collection_values(mesh.polygons, attribute, 1, dtype))
+
+    # Generic attributes, where newer versions keep creases, bevel weights and sharp edges
+    for attribute in getattr(mesh, "attributes", ()):
+        dtype = ATTRIBUTE_TYPES.get(attribute.data_type)
+        if dtype is not None:
+            update("attribute_" + attribute.domain + "_" + attribute.name,
+                   read_collection_values(attribute.data, "value", 1, dtype))
+
+    update("auto_smooth", numpy.array([getattr(mesh, "use_auto_smooth", False),
+                                       getattr(mesh, "auto_smooth_angle", 0.0)], dtype=numpy.float32))
+    if mesh.has_custom_normals:
+        if hasattr(mesh, "calc_normals_split"):
+            mesh.calc_normals_split()
+        update("custom_normals", read_collection_values(mesh.loops, "normal", 3, numpy.float32))
+
+    for uv_layer in mesh.uv_layers:
+        update("uv_" + uv_layer.name, read_collection_values(uv_layer.data, "uv", 2, numpy.float32))
+    for color_layer in mesh.vertex_colors:
+        update("color_" + color_layer.name, read_collection_values(color_layer.data, "color", 4, numpy.float32))
+
+    return content.hexdigest()
+
+
+# Only the mesh buffers are cached, so vertex groups, shape keys and other data the export still needs can not be
+def is_cacheable(blender_object):
+    if blender_object.data.shape_keys is not None:
+        return False
+    for modifier in blender_object.modifiers:
+        if modifier.type == 'ARMATURE' or getattr(modifier, "vertex_group", ""):
+            return False
+    return True
+
+
+def read_mesh_buffers(mesh):
+    vertex_count = len(mesh.vertices)
+    loop_count = len(mesh.loops)
+    polygon_count = len(mesh.polygons)
+
+    buffers = {"version": numpy.array([MESH_CACHE_VERSION])}
+    buffers["co"] = numpy.empty(vertex_count * 3, dtype=numpy.float32)
+    mesh.vertices.foreach_get("co", buffers["co"])
+    buffers["loop_vertices"] = numpy.empty(loop_count, dtype=numpy.int32)
+    mesh.loops.foreach_get("vertex_index", buffers["loop_vertices"])
+
+    for attribute, dtype in (("loop_start", numpy.int32), ("loop_total", numpy.int32),
+                             ("material_index", numpy.int32), ("use_smooth", bool)):
+        buffers[attribute] = numpy.empty(polygon_count, dtype=dtype)
+        mesh.polygons.foreach_get(attribute, buffers[attribute])
+
+    mesh.calc_normals_split()
+    buffers["normals"] = numpy.empty(loop_count * 3, dtype=numpy.float32)
+    mesh.loops.foreach_get("normal", buffers["normals"])
+
+    buffers["uv_names"] = numpy.array([uv_layer.name for uv_layer in mesh.uv_layers], dtype=str)
+    for index, uv_layer in enumerate(mesh.uv_layers):
+        buffers["uv_" + str(index)] = numpy.empty(loop_count * 2, dtype=numpy.float32)
+        uv_layer.data.foreach_get("uv", buffers["uv_" + str(index)])
+
+    buffers["color_names"] = numpy.array([color_layer.name for color_layer in mesh.vertex_colors], dtype=str)
+    for index, color_layer in enumerate(mesh.vertex_colors):
+        buffers["color_" + str(index)] = numpy.empty(loop_count * 4, dtype=numpy.float32)
+        color_layer.data.foreach_get("color", buffers["color_" + str(index)])
+
+    return buffers
+
+
+def build_mesh(name, buffers, materials):
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(buffers["co"]) // 3)
+    mesh.vertices.foreach_set("co", buffers["co"])
+    mesh.loops.add(len(buffers["loop_vertices"]))
+    mesh.loops.foreach_set("vertex_index", buffers["loop_vertices"])
+    mesh.polygons.add(len(buffers["loop_start"]))
+    for attribute in ("loop_start", "loop_total", "material_index", "use_smooth"):
+        mesh.polygons.foreach_set(attribute, buffers[attribute])
+    mesh.update(calc_edges=True)
+
+    for index, uv_name in enumerate(buffers["uv_names"]):
+        uv_layer = mesh.uv_layers.new(name=str(uv_name))
+        uv_layer.data.foreach_set("uv", buffers["uv_" + str(index)])
+    for index, color_name in enumerate(buffers["color_names"]):
+        color_layer = mesh.vertex_colors.new(name=str(color_name))
+        color_layer.data.foreach_set("color", buffers["color_" + str(index)])
+
+    # Normals are kept as they were after the modifiers, including the result of auto smooth and edge split
+    if hasattr(mesh, "use_auto_smooth"):
+        mesh.use_auto_smooth = True
+    mesh.normals_split_custom_set(buffers["normals"].reshape((-1, 3)))
+
+    for material in materials:
+        mesh.materials.append(material)
+    return mesh
+
+
+class MeshCache:
+    # directory defaults to the per-user cache folder of the add-on, never the shared temp directory
+    def __init__(self, directory=None, max_size=MESH_CACHE_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # Loaded entries and base mesh hashes of this export, instances share them
+        self.buffers = {}
+        self.mesh_hashes = {}
+
+    def get_key(self, blender_object):
+        mesh = blender_object.data
+        mesh_hash = self.mesh_hashes.get(mesh)
+        if mesh_hash is None:
+            mesh_hash = get_mesh_input_hash(mesh)
+            self.mesh_hashes[mesh] = mesh_hash
+        key = mesh_hash + get_modifiers_fingerprint(blender_object.modifiers)
+        if any(references_objects(modifier) for modifier in blender_object.modifiers):
+            # Results relative to another object also depend on where this one is
+            key += get_value_fingerprint(blender_object)
+        return sha256(key.encode("utf-8")).hexdigest()
+
+    def get_directory(self):
+        if self.directory is None:
+            self.directory = bpyutil.get_cache_directory("meshes")
+        return self.directory
+
+    def get_path(self, key):
+        return os.path.join(self.get_directory(), key + ".npz")
+
+    def load(self, key):
+        buffers = self.buffers.get(key)
+        if buffers is not None:
+            return buffers
+
+        path = self.get_path(key)
+        try:
+            with numpy.load(path, allow_pickle=False) as entry:
+                buffers = {name: entry[name] for name in entry.files}
+            # Modification time is the last use for the eviction
+            os.utime(path, None)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if int(buffers["version"][0]) != MESH_CACHE_VERSION:
+            return None
+        self.buffers[key] = buffers
+        return buffers
+
+    def store(self, key, mesh):
+        buffers = read_mesh_buffers(mesh)
+        self.buffers[key] = buffers
+        try:
+            os.makedirs(self.get_directory(), mode=0o700, exist_ok=True)
+            temp_path = self.get_path(key) + ".tmp"
+            with open(temp_path, "wb") as entry:
+                numpy.savez(entry, **buffers)
+            os.replace(temp_path, self.get_path(key))
+        except OSError as e:
+            logger.warning("Could not write mesh cache entry %s", e)
+
+    # Returns a new mesh with the modifiers applied to source_mesh, or None when it is not cached
+    def get_mesh(self, key, source_mesh):
+        buffers = self.load(key)
+        if buffers is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return build_mesh(source_mesh.name, buffers, source_mesh.materials)
+
+    def evict(self):
+        try:
+            entries = [entry for entry in os.scandir(self.get_directory()) if entry.name.endswith(".npz")]
+        except OSError:
+            return 0
+
+        entries = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        self.buffers.clear()
+        self.mesh_hashes.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def report(self):
+        logger.info("Mesh cache: %d hits, %d misses", self.hits, self.misses)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Octree over axis aligned bounds, used by the Hifi JSON importer to group entities into spatial cells
+# and to import only a region of a domain. Items are split by their centers, every node also keeps the
+# loose bounds of the items under it so queries can skip whole branches.
+
+import numpy
+
+
+# Rotation matrices of (n, 4) w, x, y, z quaternions as (n, 3, 3)
+def quaternions_to_matrices(rotations):
+    q = numpy.asarray(rotations, dtype=numpy.float64).reshape(-1, 4)
+    q = q / numpy.linalg.norm(q, axis=1).reshape(-1, 1)
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    return numpy.stack((
+        numpy.stack((1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)), axis=1),
+        numpy.stack((2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)), axis=1),
+        numpy.stack((2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)), axis=1)
+    ), axis=1)
+
+
+# World axis aligned bounds of rotated boxes, returns (minimum, maximum) as (n, 3) arrays
+def get_box_bounds(centers, rotations, dimensions):
+    centers = numpy.asarray(centers, dtype=numpy.float64).reshape(-1, 3)
+    half_extents = numpy.abs(numpy.asarray(dimensions, dtype=numpy.float64).reshape(-1, 3)) * 0.5
+    extents = numpy.einsum("nij,nj->ni", numpy.abs(quaternions_to_matrices(rotations)), half_extents)
+    return centers - extents, centers + extents
+
+
+def intersects_box(bounds_min, bounds_max, box_min, box_max):
+    return numpy.all((bounds_min <= box_max) & (bounds_max >= box_min), axis=-1)
+
+
+def intersects_sphere(bounds_min, bounds_max, center, radius):
+    closest = numpy.clip(center, bounds_min, bounds_max)
+    return numpy.sum((closest - center) ** 2, axis=-1) <= radius * radius
+
+
+class OctreeNode:
+    def __init__(self, path, cell_min, cell_max, indices):
+        # Octants from the root, "0" for the root itself
+        self.path = path
+        self.cell_min = cell_min
+        self.cell_max = cell_max
+        self.indices = indices
+        self.children = []
+        # Loose bounds of every item under this node
+        self.bounds_min = None
+        self.bounds_max = None
+
+    def is_leaf(self):
+        return not self.children
+
+
+class Octree:
+    def __init__(self, bounds_min, bounds_max, max_items=64, max_depth=6):
+        self.bounds_min = numpy.asarray(bounds_min, dtype=numpy.float64).reshape(-1, 3)
+        self.bounds_max = numpy.asarray(bounds_max, dtype=numpy.float64).reshape(-1, 3)
+        self.centers = (self.bounds_min + self.bounds_max) * 0.5
+        self.max_items = max(1, max_items)
+        self.max_depth = max_depth
+
+        indices = numpy.arange(len(self.centers))
+        if len(indices) > 0:
+            # Cubic root cell, so every level splits all axes evenly
+            cell_min = self.centers.min(axis=0)
+            size = max(float((self.centers.max(axis=0) - cell_min).max()), 1e-6)
+            cell_max = cell_min + size
+        else:
+            cell_min = cell_max = numpy.zeros(3)
+
+        self.root = OctreeNode("0", cell_min, cell_max, indices)
+        self.split(self.root, 0)
+
+    def split(self, node, depth):
+        if len(node.indices) > 0:
+            node.bounds_min = self.bounds_min[node.indices].min(axis=0)
+            node.bounds_max = self.bounds_max[node.indices].max(axis=0)
+        if len(node.indices) <= self.max_items or depth >= self.max_depth:
+            return
+
+        middle = (node.cell_min + node.cell_max) * 0.5
+        upper = self.centers[node.indices] >= middle
+        octants = upper[:, 0] * 1 + upper[:, 1] * 2 + upper[:, 2] * 4
+        for octant in range(8):
+            indices = node.indices[octants == octant]
+            if len(indices) == 0:
+                continue
+            axes = numpy.array([(octant >> axis) & 1 for axis in range(3)], dtype=bool)
+            child = OctreeNode(node.path + "-" + str(octant),
+                               numpy.where(axes, middle, node.cell_min),
+                               numpy.where(axes, node.cell_max, middle), indices)
+            node.children.append(child)
+            self.split(child, depth + 1)
+        node.indices = numpy.arange(0)
+
+    def leaves(self):
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf():
+                if len(node.indices) > 0:
+                    yield node
+            else:
+                stack.extend(reversed(node.children))
+
+    def query(self, intersects):
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.bounds_min is None or not intersects(node.bounds_min, node.bounds_max):
+                continue
+            if node.is_leaf():
+                found.append(node.indices[intersects(self.bounds_min[node.indices], self.bounds_max[node.indices])])
+            else:
+                stack.extend(node.children)
+        if not found:
+            return numpy.arange(0)
+        return numpy.sort(numpy.concatenate(found))
+
+    def query_box(self, box_min, box_max):
+        box_min = numpy.asarray(box_min, dtype=numpy.float64)
+        box_max = numpy.asarray(box_max, dtype=numpy.float64)
+        return self.query(lambda bounds_min, bounds_max: intersects_box(bounds_min, bounds_max, box_min, box_max))
+
+    def query_sphere(self, center, radius):
+        center = numpy.asarray(center, dtype=numpy.float64)
+        return self.query(lambda bounds_min, bounds_max: intersects_sphere(bounds_min, bounds_max, center, radius))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# World transforms of a parent / child tree, composed top-down and cached per node.
+# Used by the Hifi JSON importer (HifiObject), any edit to a node's local transform or parent
+# has to invalidate it, which also drops its descendants.
+
+from collections import deque
+from mathutils import Quaternion, Vector
+
+
+class TransformCache:
+    def __init__(self, get_parent, get_local, get_children):
+        # node -> parent node or None
+        self.get_parent = get_parent
+        # node -> (position, rotation) relative to the parent
+        self.get_local = get_local
+        # node -> iterable of child nodes
+        self.get_children = get_children
+        # {node: (world position, world rotation)}
+        self.world = {}
+
+    def compose(self, node, parent_world):
+        position, rotation = self.get_local(node)
+        if parent_world is None:
+            world = (Vector(position), Quaternion(rotation))
+        else:
+            parent_position, parent_rotation = parent_world
+            world = (parent_rotation @ Vector(position) + parent_position, parent_rotation @ Quaternion(rotation))
+        self.world[node] = world
+        return world
+
+    def resolve(self, node):
+        world = self.world.get(node)
+        if world is not None:
+            return world
+
+        # Walk up to the closest resolved ancestor, then compose back down.
+        chain = []
+        current = node
+        while current is not None and current not in self.world:
+            chain.append(current)
+            current = self.get_parent(current)
+
+        parent_world = self.world[current] if current is not None else None
+        for current in reversed(chain):
+            parent_world = self.compose(current, parent_world)
+        return parent_world
+
+    # Resolves whole trees breadth first, every node is composed once from its already resolved parent.
+    def resolve_tree(self, roots):
+        queue = deque(roots)
+        while queue:
+            node = queue.popleft()
+            if node not in self.world:
+                parent = self.get_parent(node)
+                self.compose(node, self.resolve(parent) if parent is not None else None)
+            queue.extend(self.get_children(node))
+
+    def position(self, node):
+        return self.resolve(node)[0].copy()
+
+    def rotation(self, node):
+        return self.resolve(node)[1].copy()
+
+    def invalidate(self, node=None):
+        if node is None:
+            self.world.clear()
+            return
+
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            self.world.pop(current, None)
+            stack.extend(self.get_children(current))
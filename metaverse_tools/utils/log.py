@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Loggers of the add-on, one per subsystem under "metaverse_tools", with the level set from the add-on preferences.
+# Per item messages go to debug with %-style arguments so they are not formatted when debug is off,
+# loops count what they did with Counters and log a single summary at info instead.
+
+import logging
+from collections import Counter
+
+LOGGER_NAME = "metaverse_tools"
+LOG_LEVELS = (
+    ('DEBUG', "Debug", "Every processed item, slow on large scenes"),
+    ('INFO', "Info", "Summaries of each operation"),
+    ('WARNING', "Warning", "Only problems"),
+    ('ERROR', "Error", "Only failures")
+)
+DEFAULT_LOG_LEVEL = 'INFO'
+
+root_logger = logging.getLogger(LOGGER_NAME)
+
+
+def get_logger(subsystem):
+    return logging.getLogger(LOGGER_NAME + "." + subsystem)
+
+
+def set_level(level):
+    if not root_logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(name)s: %(message)s"))
+        root_logger.addHandler(handler)
+        # Blender sets up its own root handler in some builds, do not print twice
+        root_logger.propagate = False
+    root_logger.setLevel(getattr(logging, level, logging.INFO))
+
+
+class Counters(Counter):
+    def log_summary(self, logger, title, level=logging.INFO):
+        if not logger.isEnabledFor(level):
+            return
+        logger.log(level, "%s: %s", title, ", ".join("%s %s" % (count, name) for name, count in sorted(self.items())))
+
+
+set_level(DEFAULT_LOG_LEVEL)
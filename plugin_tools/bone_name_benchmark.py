@@ -0,0 +1,93 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+## Utility tool not loaded by anything in the package, micro-benchmark for the cached bone name helpers in bones_builder
+## Run with the add-on installed:
+##   blender -b --python plugin_tools/bone_name_benchmark.py
+
+import time
+from metaverse_tools.utils.bones import bones_builder
+
+bases = ["Arm", "ForeArm", "Hand", "HandThumb", "HandIndex", "HandMiddle", "HandRing", "HandPinky",
+         "UpLeg", "Leg", "Foot", "Toe", "Eye", "Shoulder", "Hair", "Skirt", "Sleeve", "Ear", "Tail", "Ribbon"]
+
+# Builds the same 1000 name corpus every run, mixing the naming styles seen on MMD / Mixamo / Unity rigs.
+def build_corpus(size=1000):
+    styles = [
+        lambda side, base, idx: side + base + str(idx),
+        lambda side, base, idx: base + str(idx) + "_" + side[0],
+        lambda side, base, idx: side[0].lower() + "_" + base + str(idx),
+        lambda side, base, idx: base + "." + str(idx) + "." + side[0],
+        lambda side, base, idx: "mixamorig:" + side + base + str(idx)
+    ]
+    corpus = []
+    idx = 0
+    while len(corpus) < size:
+        for side in ["Left", "Right"]:
+            base = bases[idx % len(bases)]
+            style = styles[idx % len(styles)]
+            corpus.append(style(side, base, idx // len(bases) + 1))
+        idx += 1
+    return corpus[:size]
+
+
+cached_functions = [
+    bones_builder.camel_case_split,
+    bones_builder.parse_bone_name,
+    bones_builder.get_base_bone_name,
+    bones_builder.get_bone_side_and_mirrored
+]
+
+
+def clear_caches():
+    for function in cached_functions:
+        function.cache_clear()
+
+
+def time_passes(function, corpus, passes):
+    start = time.perf_counter()
+    for _ in range(passes):
+        for name in corpus:
+            function(name)
+    return time.perf_counter() - start
+
+
+def run(passes=20):
+    corpus = build_corpus()
+    print("Bone name benchmark:", len(corpus), "names,", passes, "passes")
+    for function in cached_functions:
+        clear_caches()
+        # The uncached reference still hits the inner helpers' caches, so clear before every pass.
+        start = time.perf_counter()
+        for _ in range(passes):
+            clear_caches()
+            for name in corpus:
+                function.__wrapped__(name)
+        uncached = time.perf_counter() - start
+
+        clear_caches()
+        cached = time_passes(function, corpus, passes)
+
+        print(" {:<28} uncached {:8.2f} ms  cached {:8.2f} ms  x{:.1f}".format(
+            function.__name__, uncached * 1000, cached * 1000, uncached / max(cached, 1e-9)))
+        print("   ", function.cache_info())
+
+
+if __name__ == "__main__":
+    run()
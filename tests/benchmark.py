@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Headless benchmarks of the scene importer, the exporters and the avatar tools.
+#
+#   blender -b --factory-startup --python tests/benchmark.py -- [--scale small] [--benchmark import_scene] [--repeat 3]
+#                                                                [--output results.json] [--history history.jsonl]
+#                                                                [--compare baseline.json --tolerance 1.25]
+#
+# Inputs are generated for every scale, each run starts from an empty file and only the call itself is timed.
+# Results are written as JSON, --history appends one line per run to track the timings over time and
+# --compare exits with 1 when a benchmark is slower than the baseline by more than the tolerance.
+# The large scale converts an 8K texture to a mask in Python and needs several GB of memory.
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import addon_utils
+import bpy
+import numpy
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if REPOSITORY_DIRECTORY not in sys.path:
+    sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+SCALES = {
+    "small": {"entities": 1000, "export_objects": 100, "bones": 50, "shape_keys": 10, "texture_size": 1024},
+    "medium": {"entities": 10000, "export_objects": 500, "bones": 200, "shape_keys": 50, "texture_size": 4096},
+    "large": {"entities": 50000, "export_objects": 2000, "bones": 500, "shape_keys": 100, "texture_size": 8192}
+}
+
+# Vertices of the synthetic avatar mesh per bone
+AVATAR_VERTICES_PER_BONE = 20
+EXPORT_MESHES = 10
+SHAPES = ("Cylinder", "Cone", "Tetrahedron", "Octahedron")
+
+# Named bones first, so the FST joint maps are written as for a real avatar
+AVATAR_BONES = ("Hips", "Spine", "Spine1", "Spine2", "Neck", "Head", "LeftArm", "LeftForeArm", "LeftHand",
+                "RightArm", "RightForeArm", "RightHand")
+
+
+class SceneExportSettings:
+    # Stand-in for the scene JSON export operator properties used by write_file
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.atp = False
+        self.use_folder = False
+        self.url_override = "http://localhost/"
+        self.clone_scene = False
+        self.remove_trailing = False
+        self.compact = False
+        self.use_gzip = False
+        self.float_precision = 0
+        self.lod_levels = 0
+        self.share_textures = False
+        self.atlas_textures = False
+        self.use_mesh_cache = False
+        self.quantize_meshes = False
+
+
+def reset_file():
+    bpy.ops.wm.read_homefile(use_empty=True)
+    gc.collect()
+
+
+def link_object(name, data):
+    obj = bpy.data.objects.new(name, data)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+
+def set_active(obj):
+    bpy.ops.object.select_all(action='DESELECT')
+    obj.select_set(state=True)
+    bpy.context.view_layer.objects.active = obj
+
+
+def generate_scene_json(entity_count, seed=0):
+    generator = random.Random(seed)
+    entities = []
+    for index in range(entity_count):
+        entity_id = "{%08d-0000-0000-0000-000000000000}" % index
+        entity = {
+            "id": entity_id,
+            "position": {"x": generator.uniform(-100, 100), "y": generator.uniform(0, 20), "z": generator.uniform(-100, 100)},
+            "rotation": {"x": 0.0, "y": generator.uniform(-1, 1), "z": 0.0, "w": 1.0},
+            "dimensions": {"x": generator.uniform(0.1, 4), "y": generator.uniform(0.1, 4), "z": generator.uniform(0.1, 4)},
+            "color": {"red": generator.randrange(256), "green": generator.randrange(256), "blue": generator.randrange(256)}
+        }
+        kind = index % 4
+        if kind == 0:
+            entity["type"] = "Box"
+        elif kind == 1:
+            entity["type"] = "Sphere"
+        else:
+            entity["type"] = "Shape"
+            entity["shape"] = SHAPES[index % len(SHAPES)]
+
+        # Every tenth entity is a child of the one before it
+        if index % 10 == 9:
+            entity["parentID"] = entities[-1]["id"]
+            entity["position"] = {"x": 0.0, "y": 1.0, "z": 0.0}
+        entities.append(entity)
+    return {"Entities": entities, "Version": 85}
+
+
+def build_cube_mesh(name):
+    mesh = bpy.data.meshes.new(name)
+    vertices = [(x, y, z) for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)]
+    faces = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    mesh.from_pydata(vertices, [], faces)
+    mesh.update()
+    return mesh
+
+
+def build_export_scene(object_count, seed=0):
+    generator = random.Random(seed)
+    meshes = [build_cube_mesh("BenchmarkMesh%02d" % index) for index in range(EXPORT_MESHES)]
+    for index in range(object_count):
+        obj = link_object("BenchmarkObject%05d" % index, meshes[index % len(meshes)])
+        obj.location = (generator.uniform(-50, 50), generator.uniform(-50, 50), generator.uniform(0, 10))
+        obj.rotation_euler = (0, 0, generator.uniform(0, 6.28))
+        if index % 5 == 0:
+            # Exercises the modifier clone path of the exporter
+            obj.modifiers.new("EdgeSplit", 'EDGE_SPLIT')
+
+
+def get_avatar_bone_names(bone_count):
+    names = list(AVATAR_BONES[:bone_count])
+    names += ["Bone%03d" % index for index in range(bone_count - len(names))]
+    return names
+
+
+# Armature with a chain of bones and a grid mesh skinned to it, every vertex weighted to two bones.
+# With unused_groups, half as many vertex groups again are added without any weights.
+def build_avatar(bone_count, shape_key_count, unused_groups=False):
+    armature = link_object("BenchmarkArmature", bpy.data.armatures.new("BenchmarkArmature"))
+    set_active(armature)
+    bpy.ops.object.mode_set(mode='EDIT')
+    parent = None
+    names = get_avatar_bone_names(bone_count)
+    for index, name in enumerate(names):
+        edit_bone = armature.data.edit_bones.new(name)
+        edit_bone.head = (0, 0, index * 0.1)
+        edit_bone.tail = (0, 0, index * 0.1 + 0.1)
+        edit_bone.parent = parent
+        edit_bone.use_connect = parent is not None
+        parent = edit_bone
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    # One row of vertices along each bone
+    columns = AVATAR_VERTICES_PER_BONE
+    rows = bone_count
+    vertices = [(column * 0.01, 0, row * 0.1 + 0.05) for row in range(rows) for column in range(columns)]
+    faces = [(row * columns + column, row * columns + column + 1, (row + 1) * columns + column + 1, (row + 1) * columns + column)
+             for row in range(rows - 1) for column in range(columns - 1)]
+    mesh = bpy.data.meshes.new("BenchmarkBody")
+    mesh.from_pydata(vertices, [], faces)
+    mesh.update()
+
+    body = link_object("BenchmarkBody", mesh)
+    body.parent = armature
+    body.modifiers.new("Armature", 'ARMATURE').object = armature
+
+    indices = numpy.arange(len(vertices))
+    bone_indices = indices // columns
+    for bone_index, name in enumerate(names):
+        group = body.vertex_groups.new(name=name)
+        group.add(indices[bone_indices == bone_index].tolist(), 0.75, 'REPLACE')
+        group.add(indices[bone_indices == bone_index - 1].tolist(), 0.25, 'REPLACE')
+    if unused_groups:
+        for index in range(bone_count // 2):
+            body.vertex_groups.new(name="Unused%03d" % index)
+
+    if shape_key_count > 0:
+        body.shape_key_add(name="Basis")
+        coordinates = numpy.empty(len(vertices) * 3, dtype=numpy.float32)
+        mesh.vertices.foreach_get("co", coordinates)
+        generator = numpy.random.default_rng(0)
+        for index in range(shape_key_count):
+            key = body.shape_key_add(name="Shape%03d" % index, from_mix=False)
+            key.data.foreach_set("co", coordinates + generator.uniform(-0.01, 0.01, coordinates.shape).astype(numpy.float32))
+
+    return armature, body
+
+
+def setup_import_scene(parameters, directory):
+    from metaverse_tools.hifi_world.scene import HifiScene
+    data = generate_scene_json(parameters["entities"])
+    return lambda: HifiScene(data)
+
+
+def setup_export_scene(parameters, directory):
+    from metaverse_tools.files.hifi_json.writer import write_file
+    build_export_scene(parameters["export_objects"])
+    settings = SceneExportSettings(os.path.join(directory, "benchmark.hifi.json"))
+    return lambda: write_file(settings)
+
+
+def setup_fst_export(parameters, directory):
+    from metaverse_tools.files.fst.writer import fst_export
+    from metaverse_tools.utils.batch import BatchExportSettings
+    armature, body = build_avatar(parameters["bones"], parameters["shape_keys"])
+    settings = BatchExportSettings(os.path.join(directory, "benchmark.fst"), "benchmark")
+    return lambda: fst_export(settings, [armature, body])
+
+
+def setup_convert_image_to_mask(parameters, directory):
+    from metaverse_tools.utils.helpers.materials import convert_image_to_mask
+    size = parameters["texture_size"]
+    image = bpy.data.images.new("BenchmarkMask", size, size, alpha=True)
+    pixels = numpy.random.default_rng(0).random(size * size * 4, dtype=numpy.float32)
+    image.pixels.foreach_set(pixels)
+    return lambda: convert_image_to_mask(image, 0.5)
+
+
+def setup_clean_unused_vertex_groups(parameters, directory):
+    from metaverse_tools.utils.helpers.mesh import clean_unused_vertex_groups
+    armature, body = build_avatar(parameters["bones"], 0, unused_groups=True)
+    set_active(body)
+    return lambda: clean_unused_vertex_groups(body)
+
+
+def setup_combine_bones(parameters, directory):
+    from metaverse_tools.utils.bones.bones_builder import combine_bones
+    armature, body = build_avatar(parameters["bones"], 0)
+    set_active(armature)
+    bpy.ops.object.mode_set(mode='EDIT')
+    # Merge the generated half of the chain into its first bone
+    names = get_avatar_bone_names(parameters["bones"])[len(AVATAR_BONES):]
+    selected = [armature.data.edit_bones[name] for name in names[:max(len(names) // 2, 2)]]
+    return lambda: combine_bones(selected, selected[0], armature)
+
+
+# {name: (setup, parameters it depends on)}
+BENCHMARKS = {
+    "import_scene": (setup_import_scene, ("entities",)),
+    "export_scene": (setup_export_scene, ("export_objects",)),
+    "fst_export": (setup_fst_export, ("bones", "shape_keys")),
+    "convert_image_to_mask": (setup_convert_image_to_mask, ("texture_size",)),
+    "clean_unused_vertex_groups": (setup_clean_unused_vertex_groups, ("bones",)),
+    "combine_bones": (setup_combine_bones, ("bones",))
+}
+
+
+def run_benchmark(name, scale, repeat):
+    setup, parameter_names = BENCHMARKS[name]
+    parameters = {parameter: SCALES[scale][parameter] for parameter in parameter_names}
+    result = {"benchmark": name, "scale": scale, "parameters": parameters, "status": "ok", "timings": []}
+    for _ in range(repeat):
+        reset_file()
+        with tempfile.TemporaryDirectory(prefix="mvt_benchmark_") as directory:
+            try:
+                call = setup(parameters, directory)
+                gc.collect()
+                start = time.perf_counter()
+                call()
+                result["timings"].append(time.perf_counter() - start)
+            except Exception as e:
+                result["status"] = "failed"
+                result["error"] = repr(e)
+                break
+
+    if result["timings"]:
+        result["seconds"] = min(result["timings"])
+        result["median"] = statistics.median(result["timings"])
+    print("{:<28} {:<8} {:>10} {}".format(name, scale, "%.3fs" % result["seconds"] if "seconds" in result else "-",
+                                          result["status"]))
+    return result
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPOSITORY_DIRECTORY, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline_path, tolerance):
+    with open(baseline_path, "r", encoding="utf-8") as baseline_file:
+        baseline = {(entry["benchmark"], entry["scale"]): entry for entry in json.load(baseline_file)["results"]}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["benchmark"], result["scale"]))
+        if previous is None or "seconds" not in previous or "seconds" not in result:
+            continue
+        ratio = result["seconds"] / max(previous["seconds"], 1e-9)
+        result["baseline_ratio"] = ratio
+        if ratio > tolerance:
+            regressions.append(result)
+            print("Regression: {} {} {:.3f}s -> {:.3f}s ({:.2f}x)".format(result["benchmark"], result["scale"],
+                                                                          previous["seconds"], result["seconds"], ratio))
+    return regressions
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="tests/benchmark.py", description="Benchmark the Metaverse Toolkit add-on")
+    parser.add_argument("--scale", action="append", choices=list(SCALES.keys()),
+                        help="Input scale, can be repeated. small by default")
+    parser.add_argument("--benchmark", action="append", choices=list(BENCHMARKS.keys()),
+                        help="Benchmark to run, can be repeated. All by default")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per benchmark, the fastest is reported")
+    parser.add_argument("--output", default=None, help="Write the results JSON to this file")
+    parser.add_argument("--history", default=None, help="Append the results as one JSON line to this file")
+    parser.add_argument("--compare", default=None, help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="Slowdown against --compare that counts as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    arguments = parse_arguments(argv)
+
+    addon_utils.enable("metaverse_tools", default_set=False)
+    from metaverse_tools.utils import log
+    # Per object messages would be timed as well
+    log.set_level('WARNING')
+
+    results = []
+    for scale in arguments.scale or ["small"]:
+        for name in arguments.benchmark or list(BENCHMARKS.keys()):
+            results.append(run_benchmark(name, scale, max(arguments.repeat, 1)))
+
+    report = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": get_commit(),
+        "blender": bpy.app.version_string,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results
+    }
+
+    regressions = []
+    if arguments.compare:
+        regressions = compare_results(results, arguments.compare, arguments.tolerance)
+
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=4)
+    if arguments.history:
+        with open(arguments.history, "a", encoding="utf-8") as history_file:
+            history_file.write(json.dumps(report, separators=(",", ":")) + "\n")
+    if not arguments.output:
+        print(json.dumps(report, indent=4))
+
+    failed = [result for result in results if result["status"] != "ok"]
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
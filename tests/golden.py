@@ -0,0 +1,540 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Golden file regression tests of the scene JSON and FST exporters.
+#
+#   python tests/golden.py [--blender blender] [--case export_scene] [--update] [--output results.json]
+#
+# Every case is exported headless by its own "blender -b" worker, so its time and peak memory can be measured
+# on their own. The worker exports a case TIMED_RUNS times from a freshly loaded file and reports the median time. The scene JSON is compared per entity with a float tolerance, FBX files are parsed and compared
+# by their node structure and values instead of bytes, ids and time stamps aside.
+# A case fails when its output differs from tests/<case>/expected, when it has no expected files,
+# or when it is over the time or memory baseline recorded with its expected files by more than the margin.
+# --update records the current output and its time and peak memory as the new expected files and baseline.
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+TESTS_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+RESULT_PREFIX = "MVT_GOLDEN_RESULT "
+FLOAT_TOLERANCE = 1e-3
+
+# Baseline of a case, {"seconds": median of the export calls, "peak_memory": peak resident size of the worker
+# including Blender itself}
+BASELINE_FILE = "baseline.json"
+TIMED_RUNS = 5
+# Allowed growth over the baseline, timing of a small export is noisier than its memory
+TIME_MARGIN = 1.5
+MEMORY_MARGIN = 1.1
+
+CASES = {
+    "export_scene": {
+        "blend": os.path.join(TESTS_DIRECTORY, "export_scene", "Cube_Test.blend"),
+        "expected": os.path.join(TESTS_DIRECTORY, "export_scene", "expected")
+    },
+    "export_avatar": {
+        "blend": None,
+        "expected": os.path.join(TESTS_DIRECTORY, "export_avatar", "expected")
+    }
+}
+
+FBX_MAGIC = b"Kaydara FBX Binary  \x00\x1a\x00"
+# Differ on every export
+FBX_IGNORED_NODES = ("FBXHeaderExtension", "FileId", "CreationTime", "Creator")
+FBX_ARRAY_TYPES = {b"f": "f", b"d": "d", b"l": "q", b"i": "i", b"b": "?"}
+FBX_SCALAR_TYPES = {b"Y": "<h", b"C": "<?", b"I": "<i", b"F": "<f", b"D": "<d", b"L": "<q"}
+
+
+def read_fbx_property(data, offset):
+    type_code = data[offset:offset + 1]
+    offset += 1
+    if type_code in FBX_SCALAR_TYPES:
+        value_format = FBX_SCALAR_TYPES[type_code]
+        return (type_code.decode(), struct.unpack_from(value_format, data, offset)[0]), offset + struct.calcsize(value_format)
+    if type_code in FBX_ARRAY_TYPES:
+        length, encoding, compressed_length = struct.unpack_from("<III", data, offset)
+        offset += 12
+        content = data[offset:offset + compressed_length]
+        if encoding == 1:
+            content = zlib.decompress(content)
+        value_format = "<" + str(length) + FBX_ARRAY_TYPES[type_code]
+        return (type_code.decode(), struct.unpack(value_format, content)), offset + compressed_length
+    if type_code in (b"S", b"R"):
+        length = struct.unpack_from("<I", data, offset)[0]
+        offset += 4
+        content = data[offset:offset + length]
+        if type_code == b"S":
+            content = content.decode("utf-8", "replace")
+        return (type_code.decode(), content), offset + length
+    raise ValueError("Unknown FBX property type %r at %d" % (type_code, offset - 1))
+
+
+# Returns ((name, [(type, value)], [children]), offset after the node), None for the null record ending a list
+def read_fbx_node(data, offset, version):
+    if version >= 7500:
+        end_offset, property_count, _ = struct.unpack_from("<QQQ", data, offset)
+        offset += 24
+    else:
+        end_offset, property_count, _ = struct.unpack_from("<III", data, offset)
+        offset += 12
+    name_length = data[offset]
+    offset += 1
+    if end_offset == 0:
+        return None, offset
+
+    name = data[offset:offset + name_length].decode("utf-8", "replace")
+    offset += name_length
+    properties = []
+    for _ in range(property_count):
+        fbx_property, offset = read_fbx_property(data, offset)
+        properties.append(fbx_property)
+
+    children = []
+    while offset < end_offset:
+        child, offset = read_fbx_node(data, offset, version)
+        if child is None:
+            break
+        children.append(child)
+    return (name, properties, children), end_offset
+
+
+def read_fbx(filepath):
+    with open(filepath, "rb") as fbx_file:
+        data = fbx_file.read()
+    if not data.startswith(FBX_MAGIC):
+        raise ValueError(filepath + " is not a binary FBX file")
+
+    version = struct.unpack_from("<I", data, len(FBX_MAGIC))[0]
+    offset = len(FBX_MAGIC) + 4
+    nodes = []
+    while offset < len(data):
+        node, offset = read_fbx_node(data, offset, version)
+        if node is None:
+            break
+        nodes.append(node)
+    return version, nodes
+
+
+def find_fbx_nodes(nodes, name):
+    return [node for node in nodes if node[0] == name]
+
+
+# Object ids are hashes of names and pointers, they are replaced by their order of appearance
+def normalize_fbx_ids(nodes):
+    ids = {}
+    for container in find_fbx_nodes(nodes, "Objects") + find_fbx_nodes(nodes, "Documents"):
+        for child in container[2]:
+            if child[1] and child[1][0][0] == "L":
+                ids.setdefault(child[1][0][1], "#" + str(len(ids)))
+
+    def normalize(node):
+        name, properties, children = node
+        properties = [("L", ids.get(value, value)) if type_code == "L" else (type_code, value)
+                      for type_code, value in properties]
+        return name, properties, [normalize(child) for child in children]
+
+    return [normalize(node) for node in nodes if node[0] not in FBX_IGNORED_NODES]
+
+
+def is_close(expected, actual, tolerance=FLOAT_TOLERANCE):
+    return math.isclose(expected, actual, rel_tol=tolerance, abs_tol=tolerance)
+
+
+def is_path(value):
+    return isinstance(value, str) and ("/" in value or "\\" in value)
+
+
+def compare_values(expected, actual, path, differences, tolerance=FLOAT_TOLERANCE):
+    if isinstance(expected, float) or isinstance(actual, float):
+        if not isinstance(expected, (int, float)) or not isinstance(actual, (int, float)) or not is_close(expected, actual, tolerance):
+            differences.append("%s: expected %r, got %r" % (path, expected, actual))
+    elif isinstance(expected, (tuple, list)) and isinstance(actual, (tuple, list)):
+        if len(expected) != len(actual):
+            differences.append("%s: expected %d values, got %d" % (path, len(expected), len(actual)))
+            return
+        for index, (expected_value, actual_value) in enumerate(zip(expected, actual)):
+            compare_values(expected_value, actual_value, path + "[" + str(index) + "]", differences, tolerance)
+            if len(differences) > 100:
+                return
+    elif is_path(expected) and is_path(actual):
+        # Texture paths are absolute to the machine that exported them
+        if os.path.basename(expected.replace("\\", "/")) != os.path.basename(actual.replace("\\", "/")):
+            differences.append("%s: expected %r, got %r" % (path, expected, actual))
+    elif expected != actual:
+        differences.append("%s: expected %r, got %r" % (path, expected, actual))
+
+
+def compare_fbx_nodes(expected, actual, path, differences):
+    expected_names = [node[0] for node in expected]
+    actual_names = [node[0] for node in actual]
+    if expected_names != actual_names:
+        differences.append("%s: expected nodes %s, got %s" % (path or "/", expected_names, actual_names))
+        return
+
+    for index, (expected_node, actual_node) in enumerate(zip(expected, actual)):
+        node_path = path + "/" + expected_node[0] + "[" + str(index) + "]"
+        expected_types = "".join(type_code for type_code, _ in expected_node[1])
+        actual_types = "".join(type_code for type_code, _ in actual_node[1])
+        if expected_types != actual_types:
+            differences.append("%s: expected properties %s, got %s" % (node_path, expected_types, actual_types))
+            continue
+        compare_values([value for _, value in expected_node[1]], [value for _, value in actual_node[1]],
+                       node_path, differences)
+        compare_fbx_nodes(expected_node[2], actual_node[2], node_path, differences)
+
+
+def compare_fbx(expected_path, actual_path):
+    differences = []
+    expected_version, expected_nodes = read_fbx(expected_path)
+    actual_version, actual_nodes = read_fbx(actual_path)
+    if expected_version != actual_version:
+        differences.append("FBX version: expected %d, got %d" % (expected_version, actual_version))
+    compare_fbx_nodes(normalize_fbx_ids(expected_nodes), normalize_fbx_ids(actual_nodes), "", differences)
+    return differences
+
+
+def compare_json_values(expected, actual, path, differences):
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in sorted(set(expected.keys()) | set(actual.keys())):
+            if key not in actual:
+                differences.append("%s.%s: missing" % (path, key))
+            elif key not in expected:
+                differences.append("%s.%s: unexpected %r" % (path, key, actual[key]))
+            else:
+                compare_json_values(expected[key], actual[key], path + "." + key, differences)
+    else:
+        compare_values(expected, actual, path, differences)
+
+
+# Entities are matched by name, the export order follows the scene and is not part of the format
+def compare_scene_json(expected, actual):
+    differences = []
+    compare_json_values({key: value for key, value in expected.items() if key != "Entities"},
+                        {key: value for key, value in actual.items() if key != "Entities"}, "", differences)
+
+    expected_entities = {entity.get("name"): entity for entity in expected.get("Entities", [])}
+    actual_entities = {entity.get("name"): entity for entity in actual.get("Entities", [])}
+    for name in sorted(set(expected_entities.keys()) | set(actual_entities.keys()), key=str):
+        if name not in actual_entities:
+            differences.append("Entities[%s]: missing" % name)
+        elif name not in expected_entities:
+            differences.append("Entities[%s]: unexpected" % name)
+        else:
+            compare_json_values(expected_entities[name], actual_entities[name], "Entities[" + str(name) + "]",
+                                differences)
+    return differences
+
+
+def read_fst(filepath):
+    with open(filepath, "r", encoding="utf-8") as fst_file:
+        lines = [line.rstrip("\n") for line in fst_file if line.strip()]
+    # The model file is named by a new uuid on every export
+    return [re.sub(r"^(filename|lod) = [^ ]+", r"\1 = *", line) for line in lines]
+
+
+def get_fst_model(filepath):
+    with open(filepath, "r", encoding="utf-8") as fst_file:
+        for line in fst_file:
+            if line.startswith("filename = "):
+                return os.path.join(os.path.dirname(filepath), line.split("=", 1)[1].strip())
+    return None
+
+
+# Output files of a case as {file name in expected: path in the work directory}
+def get_case_outputs(name, work_directory):
+    if name == "export_scene":
+        export_directory = os.path.join(work_directory, "expected")
+        return {file_name: os.path.join(export_directory, file_name) for file_name in sorted(os.listdir(export_directory))
+                if file_name.endswith((".json", ".fbx"))}
+
+    fst_path = os.path.join(work_directory, "avatar", "avatar.fst")
+    if not os.path.exists(fst_path):
+        return {}
+    outputs = {"avatar.fst": fst_path}
+    model = get_fst_model(fst_path)
+    if model is not None:
+        outputs["avatar.fbx"] = model
+    return outputs
+
+
+def get_expected_files(name):
+    expected_directory = CASES[name]["expected"]
+    if not os.path.isdir(expected_directory):
+        return []
+    return sorted(file_name for file_name in os.listdir(expected_directory)
+                  if file_name != BASELINE_FILE and not file_name.endswith(".txt"))
+
+
+def compare_case(name, work_directory):
+    case = CASES[name]
+    expected_files = get_expected_files(name)
+    if not expected_files:
+        return ["No expected files, record them with --update"]
+    outputs = get_case_outputs(name, work_directory)
+
+    differences = []
+    for file_name in expected_files:
+        expected_path = os.path.join(case["expected"], file_name)
+        actual_path = outputs.get(file_name)
+        if actual_path is None or not os.path.exists(actual_path):
+            differences.append(file_name + ": not exported")
+            continue
+
+        if file_name.endswith(".json"):
+            with open(expected_path, "r", encoding="utf-8") as expected_file, open(actual_path, "r", encoding="utf-8") as actual_file:
+                file_differences = compare_scene_json(json.load(expected_file), json.load(actual_file))
+        elif file_name.endswith(".fbx"):
+            file_differences = compare_fbx(expected_path, actual_path)
+        elif file_name.endswith(".fst"):
+            file_differences = []
+            compare_values(read_fst(expected_path), read_fst(actual_path), "lines", file_differences)
+        else:
+            continue
+        differences += [file_name + " " + difference for difference in file_differences]
+
+    for file_name in sorted(set(outputs.keys()) - set(expected_files)):
+        differences.append(file_name + ": not in expected")
+    return differences
+
+
+def load_baseline(name):
+    try:
+        with open(os.path.join(CASES[name]["expected"], BASELINE_FILE), "r", encoding="utf-8") as baseline_file:
+            return json.load(baseline_file)
+    except (OSError, ValueError):
+        return None
+
+
+def update_case(name, work_directory, result):
+    case = CASES[name]
+    os.makedirs(case["expected"], exist_ok=True)
+    for file_name in get_expected_files(name):
+        os.remove(os.path.join(case["expected"], file_name))
+    for file_name, path in get_case_outputs(name, work_directory).items():
+        shutil.copyfile(path, os.path.join(case["expected"], file_name))
+
+    with open(os.path.join(case["expected"], BASELINE_FILE), "w", encoding="utf-8") as baseline_file:
+        json.dump({"seconds": round(result["seconds"], 6), "peak_memory": result["peak_memory"]}, baseline_file,
+                  indent=4, sort_keys=True)
+
+
+# Worker, runs inside Blender
+
+# Seconds of the export call, the output goes to output_directory
+def export_case(name, output_directory):
+    import bpy
+    import benchmark
+
+    if name == "export_scene":
+        from metaverse_tools.files.hifi_json.writer import write_file
+        # The export changes the scene, every run starts from the saved file
+        bpy.ops.wm.open_mainfile(filepath=CASES[name]["blend"])
+        export_directory = os.path.join(output_directory, "expected")
+        os.makedirs(export_directory)
+        # The expected model urls are atp:/<folder name>/
+        settings = benchmark.SceneExportSettings(os.path.join(export_directory, "Cube_Test.hifi.json"))
+        settings.atp = True
+        settings.use_folder = True
+        start = time.perf_counter()
+        write_file(settings)
+        return time.perf_counter() - start
+
+    from metaverse_tools.files.fst.writer import fst_export
+    from metaverse_tools.utils.batch import BatchExportSettings
+    benchmark.reset_file()
+    armature, body = benchmark.build_avatar(len(benchmark.AVATAR_BONES), 4)
+    settings = BatchExportSettings(os.path.join(output_directory, "avatar.fst"), "avatar")
+    start = time.perf_counter()
+    fst_export(settings, [armature, body])
+    return time.perf_counter() - start
+
+
+# Times of every run, the last run exports to work_directory and is the one compared
+def export_case_runs(name, work_directory, runs=TIMED_RUNS):
+    import addon_utils
+
+    if REPOSITORY_DIRECTORY not in sys.path:
+        sys.path.insert(0, REPOSITORY_DIRECTORY)
+    if TESTS_DIRECTORY not in sys.path:
+        sys.path.insert(0, TESTS_DIRECTORY)
+    addon_utils.enable("metaverse_tools", default_set=False)
+
+    times = []
+    for run in range(runs):
+        if run < runs - 1:
+            output_directory = os.path.join(work_directory, "runs", str(run))
+            os.makedirs(output_directory)
+        else:
+            output_directory = work_directory
+        times.append(export_case(name, output_directory))
+    return times
+
+
+def run_worker(name, work_directory):
+    result = {"case": name, "status": "ok"}
+    try:
+        result["times"] = export_case_runs(name, work_directory)
+        result["seconds"] = statistics.median(result["times"])
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = repr(e)
+    print(RESULT_PREFIX + json.dumps(result))
+
+
+# Coordinator
+
+def get_peak_memory(rusage):
+    # Kilobytes on Linux, bytes on macOS
+    return rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+
+
+def run_worker_process(command, log_path):
+    # Returns (exit code, peak memory in bytes or None), peak memory of this worker alone where wait4 exists
+    with open(log_path, "w") as log_file:
+        process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+        if not hasattr(os, "wait4"):
+            return process.wait(), None
+        _, status, rusage = os.wait4(process.pid, 0)
+        # Reaped already, keep Popen from waiting on it again
+        process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+        return process.returncode, get_peak_memory(rusage)
+
+
+def run_case(name, blender, update=False):
+    case = CASES[name]
+    result = {"case": name, "status": "failed", "differences": [], "peak_memory": None}
+    with tempfile.TemporaryDirectory(prefix="mvt_golden_") as work_directory:
+        command = [blender, "-b", "--factory-startup"]
+        if case["blend"] is not None:
+            command.append(case["blend"])
+        command += ["--python", os.path.realpath(__file__), "--", "--worker", name, "--work-directory", work_directory]
+
+        log_path = os.path.join(work_directory, "worker.log")
+        exit_code, result["peak_memory"] = run_worker_process(command, log_path)
+        with open(log_path, "r", encoding="utf-8", errors="replace") as log_file:
+            output = log_file.read()
+
+        worker_result = None
+        for line in output.splitlines():
+            if line.startswith(RESULT_PREFIX):
+                worker_result = json.loads(line[len(RESULT_PREFIX):])
+
+        if worker_result is None or worker_result["status"] != "ok":
+            result["error"] = worker_result.get("error") if worker_result else "Worker did not report, exit code " + str(exit_code)
+            result["log"] = output[-4000:]
+            return result
+
+        result["seconds"] = worker_result["seconds"]
+        result["times"] = worker_result.get("times")
+        if update:
+            update_case(name, work_directory, result)
+            result["status"] = "updated"
+            return result
+
+        result["differences"] = compare_case(name, work_directory)
+        result["status"] = "ok"
+    return result
+
+
+# Budgets of a case from its recorded baseline, (seconds, peak memory in bytes or None)
+def get_budgets(baseline):
+    time_budget = baseline["seconds"] * TIME_MARGIN
+    memory_budget = baseline["peak_memory"] * MEMORY_MARGIN if baseline.get("peak_memory") else None
+    return time_budget, memory_budget
+
+
+def check_budgets(result):
+    if result["status"] in ("failed", "updated"):
+        return result
+    failures = list(result["differences"])
+    baseline = load_baseline(result["case"])
+    if baseline is None:
+        failures.append("No time and memory baseline, record it with --update")
+    else:
+        time_budget, memory_budget = get_budgets(baseline)
+        result["time_budget"] = time_budget
+        result["memory_budget"] = memory_budget
+        if result.get("seconds") is not None and result["seconds"] > time_budget:
+            failures.append("time %.3fs over the budget of %.3fs" % (result["seconds"], time_budget))
+        if memory_budget is not None and result.get("peak_memory") is not None and result["peak_memory"] > memory_budget:
+            failures.append("peak memory %.0f MB over the budget of %.0f MB" % (result["peak_memory"] / 1024 ** 2,
+                                                                                memory_budget / 1024 ** 2))
+    result["failures"] = failures
+    result["status"] = "failed" if failures else "ok"
+    return result
+
+
+def print_result(result):
+    seconds = "%.3fs" % result["seconds"] if result.get("seconds") is not None else "-"
+    memory = "%.0f MB" % (result["peak_memory"] / 1024 ** 2) if result.get("peak_memory") else "-"
+    print("{:<16} {:<8} {:>10} {:>10}".format(result["case"], result["status"], seconds, memory))
+    for failure in result.get("failures", [])[:50]:
+        print("   " + failure)
+    if "error" in result:
+        print("   " + result["error"])
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="tests/golden.py", description="Golden file regression tests of the exporters")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"), help="Blender executable")
+    parser.add_argument("--case", action="append", choices=list(CASES.keys()), help="Case to run, can be repeated. All by default")
+    parser.add_argument("--update", action="store_true", help="Record the current output, time and peak memory as the expected files and baseline")
+    parser.add_argument("--output", default=None, help="Write the results JSON to this file")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--work-directory", default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    arguments = parse_arguments(argv)
+
+    if arguments.worker:
+        run_worker(arguments.worker, arguments.work_directory)
+        return
+
+    results = [check_budgets(run_case(name, arguments.blender, arguments.update))
+               for name in arguments.case or list(CASES.keys())]
+    for result in results:
+        print_result(result)
+
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as output_file:
+            json.dump({"results": results}, output_file, indent=4)
+
+    if any(result["status"] == "failed" for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Keys of the scene export mesh cache, every input of the cached mesh has to change the key.
+#
+#   blender -b --factory-startup --python tests/test_mesh_cache.py
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import addon_utils
+import bpy
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if REPOSITORY_DIRECTORY not in sys.path:
+    sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+
+class MeshCacheKeyTest(unittest.TestCase):
+    def setUp(self):
+        from metaverse_tools.utils.helpers import mesh_cache
+        bpy.ops.wm.read_homefile(use_empty=True)
+        bpy.ops.mesh.primitive_cube_add()
+        self.obj = bpy.context.active_object
+        self.obj.modifiers.new("Subdivision", 'SUBSURF')
+        self.directory = tempfile.mkdtemp(prefix="mvt_mesh_cache_")
+        self.cache = mesh_cache.MeshCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get_key(self):
+        # A new export starts with no hashed meshes
+        self.cache.clear()
+        return self.cache.get_key(self.obj)
+
+    def store(self):
+        key = self.get_key()
+        self.cache.store(key, self.obj.data)
+        return key
+
+    def test_same_mesh_hits(self):
+        self.store()
+        self.assertIsNotNone(self.cache.get_mesh(self.get_key(), self.obj.data))
+
+    def test_smooth_shading_misses(self):
+        key = self.store()
+        for polygon in self.obj.data.polygons:
+            polygon.use_smooth = not polygon.use_smooth
+        changed_key = self.get_key()
+        self.assertNotEqual(key, changed_key)
+        self.assertIsNone(self.cache.get_mesh(changed_key, self.obj.data))
+
+    def test_sharp_edge_misses(self):
+        key = self.store()
+        self.obj.data.edges[0].use_edge_sharp = not self.obj.data.edges[0].use_edge_sharp
+        self.assertNotEqual(key, self.get_key())
+
+    def test_modifier_setting_misses(self):
+        key = self.store()
+        self.obj.modifiers["Subdivision"].levels += 1
+        self.assertNotEqual(key, self.get_key())
+
+
+def main():
+    addon_utils.enable("metaverse_tools", default_set=False)
+    result = unittest.main(argv=[sys.argv[0]], exit=False).result
+    sys.exit(0 if result.wasSuccessful() else 1)
+
+
+if __name__ == "__main__":
+    main()